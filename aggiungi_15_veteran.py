@@ -2,10 +2,11 @@
 from app import create_app
 from models import db
 from models.user import User
+from models.exp_ledger import MovimentoExp
 import random
 from datetime import datetime, timedelta
 
-app = create_app()
+app = create_app(avvia_scheduler=False)
 with app.app_context():
 
     # Conta utenti esistenti
@@ -41,6 +42,9 @@ with app.app_context():
         db.session.add(user)
         utenti_nuovi.append(user)
 
+    # L'EXP iniziale va anche nel registro, altrimenti la riconciliazione la azzera
+    db.session.flush()
+    db.session.add_all(MovimentoExp(user_id=u.id, delta=u.tabl_exp, causale='apertura') for u in utenti_nuovi)
     db.session.commit()
 
     print("\n🎉 15 utenti Veteran AGGIUNTI!")
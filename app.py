@@ -8,20 +8,39 @@ from models import db, bcrypt
 from models.user import User
 from models.evento import Evento  # ✅ AGGIUNTO
 from models.partecipazione import Partecipazione  # ✅ AGGIUNTO
+from utils.stats import stats_service
+from utils.outbox import OutboxWorkerPool
+from utils.scheduler import SchedulerCluster
+from utils.webhook_stripe import WebhookWorker, registra_evento, FirmaNonValida
+from utils.stripe_gateway import configura_stripe
+from utils.metriche_sql import installa as installa_metriche_sql
+from utils.telemetria import configura_telemetria
+from utils.password import password_service
+from utils.limiti import limitatore
+from utils.cache_utenti import cache_utenti
 from flask_mail import Mail
 from dotenv import load_dotenv
-from apscheduler.schedulers.background import BackgroundScheduler
-from apscheduler.triggers.cron import CronTrigger
 from datetime import datetime, timedelta
+from utils.log import configura_log
+import logging
 import os
-import stripe
 
 load_dotenv()
 
-def create_app():
+log = logging.getLogger('tablhero.app')
+log_webhook = logging.getLogger('tablhero.webhook')
+
+def create_app(avvia_scheduler=None):
+    """
+    avvia_scheduler=False per script e comandi CLI: niente scheduler, worker
+    webhook né worker outbox in background (default: SCHEDULER_ATTIVO)
+    """
     app = Flask(__name__)
     app.config.from_object(Config)
 
+    # Log JSON su coda + thread di scrittura, request id per richiesta
+    configura_log(app)
+
     # Session timeout aumentato per Stripe (24h invece di 30min)
     app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(hours=24)
 
@@ -32,26 +51,41 @@ def create_app():
     app.config['MAIL_PASSWORD'] = os.getenv('MAIL_PASSWORD')
     app.config['MAIL_DEFAULT_SENDER'] = os.getenv('MAIL_DEFAULT_SENDER')
     
+    # Metriche Prometheus: sceglie anche il pool misurato, quindi prima di db.init_app
+    configura_telemetria(app)
+
     # Inizializza estensioni
     db.init_app(app)
     bcrypt.init_app(app)
+    password_service.init_app(app)
+    limitatore.init_app(app)
     migrate = Migrate(app, db)
+
+    # Conteggio e tempo delle query per richiesta (pagina admin, header in debug)
+    installa_metriche_sql(app)
     
-    # Configura Stripe
-    stripe.api_key = app.config['STRIPE_SECRET_KEY']
+    # Configura Stripe (chiave, pool HTTP keep-alive, eventuale server locale)
+    configura_stripe(app)
 
     # Configura Flask-Mail
     mail = Mail(app)
 
+    # Worker che svuotano la outbox email (le route si limitano ad accodare)
+    outbox = OutboxWorkerPool(app, mail)
+    app.extensions['outbox'] = outbox
+
     # Configura Flask-Login
     login_manager = LoginManager()
     login_manager.init_app(app)
     login_manager.login_view = 'auth.login'
     login_manager.login_message = 'Effettua il login per accedere a questa pagina.'
     
+    # Utente corrente dalla cache: nessuna query per richiesta finché non cambia
+    cache_utenti.init_app(app)
+
     @login_manager.user_loader
     def load_user(user_id):
-        return db.session.get(User, int(user_id))
+        return cache_utenti.carica(int(user_id))
     
     @app.template_filter('livello_color')
     def livello_color_filter(livello):
@@ -87,15 +121,17 @@ def create_app():
     # Route homepage
     @app.route('/')
     def index():
-        # Conta solo membri ATTIVI (escludi disattivati)
-        total_members = User.query.filter_by(attivo=True).count()
+        # Contatori dalla cache statistiche (una query per tabella ogni TTL)
+        stats = stats_service.get()['utenti']
+        total_members = stats['attivi']
 
         # Conta per ruolo (solo attivi)
-        sidekick_count = User.query.filter_by(ruolo='sidekick', attivo=True).count()
-        tablhero_count = User.query.filter_by(ruolo='tablhero', attivo=True).count()
-        veteran_count = User.query.filter_by(ruolo='veteran', attivo=True).count()
-        game_architect_count = User.query.filter_by(ruolo='game_architect', attivo=True).count()
-        founder_count = User.query.filter_by(ruolo='founder', attivo=True).count()
+        per_ruolo = stats['per_ruolo_attivi']
+        sidekick_count = per_ruolo.get('sidekick', 0)
+        tablhero_count = per_ruolo.get('tablhero', 0)
+        veteran_count = per_ruolo.get('veteran', 0)
+        game_architect_count = per_ruolo.get('game_architect', 0)
+        founder_count = per_ruolo.get('founder', 0)
 
         # Prossimi eventi per utenti iscritti
         prossimi_eventi = None
@@ -132,91 +168,21 @@ def create_app():
     
     @app.route('/stripe/webhook', methods=['POST'])
     def stripe_webhook():
-        print("🚨 WEBHOOK ARRIVATO! 🎉")
-        print(f"Headers: {dict(request.headers)}")
-
-        payload = request.get_data()
-        sig_header = request.headers.get('Stripe-Signature')
+        """Verifica, salva e risponde subito: l'elaborazione la fa il worker webhook"""
         endpoint_secret = app.config.get('STRIPE_WEBHOOK_SECRET')
+        if not endpoint_secret and not app.debug:
+            log_webhook.error('Webhook rifiutato: STRIPE_WEBHOOK_SECRET non configurato')
+            return '', 400
 
-        print(f"🔑 Secret configurato: {'SÌ' if endpoint_secret else 'NO'}")
-
-        # 🔓 TEMPORANEO: Skip verifica per debug
         try:
-            import json
-            event_data = json.loads(payload)
-            print(f"✅ Evento: {event_data.get('type')}")
-            print(f"Metadata: {event_data['data']['object'].get('metadata', {})}")
-        except Exception as e:
-            print(f"❌ Parse fallito: {e}")
+            nuovo = registra_evento(request.get_data(), request.headers.get('Stripe-Signature'),
+                                    endpoint_secret, verifica=bool(endpoint_secret))
+        except (FirmaNonValida, ValueError, KeyError) as e:
+            log_webhook.warning('Webhook rifiutato', extra={'errore': str(e)})
             return '', 400
 
-        # 🔄 LOGICA ORIGINALE (solo se debug OK)
-        if event_data.get('type') == 'checkout.session.completed':
-            session = event_data['data']['object']
-            metadata = session.get('metadata', {})
-
-            # 🎫 PAGAMENTO EVENTO
-            if 'eventoid' in metadata:
-                user_id = int(metadata['userid'])
-                evento_id = int(metadata['eventoid'])
-
-                user = User.query.get(user_id)
-                evento = Evento.query.get(evento_id)
-
-                if user and evento:
-                    # Check if event is in the past
-                    if evento.data_evento and evento.data_evento <= datetime.utcnow():
-                        print(f"❌ PAGAMENTO RIFIUTATO: Evento passato {evento.titolo}")
-                        return '', 400
-
-                    existing = Partecipazione.query.filter_by(user_id=user_id, evento_id=evento_id).first()
-                    if not existing:
-                        partecipaz = Partecipazione(user_id=user_id, evento_id=evento_id, exp_guadagnata=evento.exp_reward)
-                        user.aggiungi_exp(evento.exp_reward)
-                        db.session.add(partecipaz)
-                        db.session.commit()
-                        print(f"✅ AUTO-ISCRITTO EVENTO: {user.nickname}")
-
-            # 🔄 RINNOVO MEMBERSHIP
-            elif metadata.get('tipo') == 'renew':
-                user_id = int(metadata['userid'])
-
-                user = User.query.get(user_id)
-                if user:
-                    # Sostituisci la logica: usa data scadenza esistente + 365gg
-                    user.ha_pagato = True
-                    if user.data_scadenza:
-                        user.data_scadenza = user.data_scadenza + timedelta(days=365)  # DA SCADENZA ESISTENTE
-                    else:
-                        user.data_scadenza = datetime.utcnow() + timedelta(days=365)  # Fallback se non c'è scadenza
-                    user.payment_status = 'completed'
-                    # Upgrade sidekick to tablhero upon membership renewal
-                    if user.ruolo == 'sidekick':
-                        user.ruolo = 'tablhero'
-                    db.session.commit()
-                    print(f"✅ RENEW {user.nickname}: Membership da SCADENZA +365gg")
-
-            # 🎫 MEMBERSHIP GENERICO (nuova O renew)
-            elif metadata.get('tipo') == 'membership':
-                user_id = int(metadata['userid'])
-
-                user = User.query.get(user_id)
-                if user:
-                    user.ha_pagato = True
-                    if user.data_scadenza and user.data_scadenza > datetime.utcnow():
-                        # Se è un rinnovo, usa scadenza esistente + 365gg
-                        user.data_scadenza = user.data_scadenza + timedelta(days=365)
-                    else:
-                        # Se è nuova membership, usa oggi + 365gg
-                        user.data_scadenza = datetime.utcnow() + timedelta(days=365)
-                    user.payment_status = 'completed'
-                    # Upgrade sidekick to tablhero upon membership purchase
-                    if user.ruolo == 'sidekick':
-                        user.ruolo = 'tablhero'
-                    db.session.commit()
-                    print(f"✅ MEMBERSHIP {user.nickname}: Attivata da SCADENZA +365gg")
-
+        if not nuovo:
+            log_webhook.info('Webhook duplicato ignorato')
         return '', 200
 
     
@@ -224,58 +190,22 @@ def create_app():
     with app.app_context():
         db.create_all()
 
-        # 🔄 SCHEDULER PER REMINDER AUTOMATICI
-        def job_reminder():
-            """Invia reminder automatici per eventi domani alle 9:00"""
-            with app.app_context():
-                # Calcola domani (inizio e fine giornata)
-                domani = datetime.utcnow() + timedelta(days=1)
-                domani_inizio = datetime(domani.year, domani.month, domani.day, 0, 0, 0)
-                domani_fine = datetime(domani.year, domani.month, domani.day, 23, 59, 59)
-
-                # Query eventi domani
-                eventi_domani = Evento.query.filter(
-                    Evento.data_evento >= domani_inizio,
-                    Evento.data_evento <= domani_fine
-                ).all()
-
-                print(f"🔍 Trovati {len(eventi_domani)} eventi domani")
-
-                total_reminders = 0
-
-                for evento in eventi_domani:
-                    if evento.partecipazioni:  # Solo se ci sono partecipanti
-                        print(f"📧 Invio reminder per: {evento.titolo}")
-
-                        for partecipazione in evento.partecipazioni:
-                            try:
-                                from flask_mail import Message
-                                msg = Message(
-                                    subject=f'Reminder: {evento.titolo} domani! - TableHero',
-                                    recipients=[partecipazione.user.email],
-                                    html=f'<h2>Reminder Evento Automatico</h2><p>Ciao {partecipazione.user.nome},<br><strong>{evento.titolo}</strong> è domani {evento.data_evento.strftime("%d/%m/%Y alle %H:%M")}!</p><p>Non mancare! 🎲</p>'
-                                )
-                                mail.send(msg)
-                                total_reminders += 1
-
-                                print(f"✅ Reminder inviato a: {partecipazione.user.email}")
-
-                            except Exception as e:
-                                print(f"❌ Errore invio a {partecipazione.user.email}: {e}")
-
-                print(f"📊 Reminder totali inviati: {total_reminders}")
-
-        # Avvia scheduler per reminder automatici
-        scheduler = BackgroundScheduler()
-        scheduler.add_job(
-            job_reminder,
-            trigger=CronTrigger(hour=9, timezone='Europe/Rome'),  # Ogni giorno alle 9:00
-            id='daily_reminder',
-            name='Invio reminder eventi giornaliero'
-        )
-        scheduler.start()
-
-        print("Scheduler reminder avviato - invio alle 9:00 Europe/Rome")
+        # 🔄 SCHEDULER PER REMINDER AUTOMATICI: lo esegue un solo processo del cluster
+        if avvia_scheduler is None:
+            avvia_scheduler = app.config['SCHEDULER_ATTIVO']
+        if avvia_scheduler:
+            scheduler = SchedulerCluster(app)
+            app.extensions['scheduler'] = scheduler
+            scheduler.avvia()
+
+            # Eventi Stripe salvati dal webhook: li elabora in ordine un solo processo
+            webhook_worker = WebhookWorker(app)
+            app.extensions['stripe_webhook'] = webhook_worker
+            webhook_worker.avvia()
+
+            # Gli script accodano soltanto: spediscono i worker dei processi web
+            outbox.avvia()
+            log.info('Outbox email avviata', extra={'worker': outbox.num_worker})
 
     return app
 
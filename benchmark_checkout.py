@@ -0,0 +1,88 @@
+# benchmark_checkout.py - Chiamate API e latenza per checkout: price_data inline vs stripe_gateway
+#
+# Uso: python benchmark_checkout.py --utenti 50 --click 3 --latenza 0.08
+# Usa il finto server di utils/stripe_locale.py (o --api-base per stripe-mock).
+# DATABASE_URL permette di usare un DB di prova.
+import argparse
+import os
+import time
+from datetime import datetime, timedelta
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--utenti', type=int, default=50)
+parser.add_argument('--click', type=int, default=3, help='checkout aperti da ogni utente (doppi click, refresh)')
+parser.add_argument('--latenza', type=float, default=0.08, help='round trip simulato verso Stripe (secondi)')
+parser.add_argument('--port', type=int, default=12111)
+parser.add_argument('--api-base', help='server Stripe esterno invece di quello finto')
+args = parser.parse_args()
+
+os.environ['STRIPE_API_BASE'] = args.api_base or f'http://127.0.0.1:{args.port}'
+os.environ.setdefault('STRIPE_SECRET_KEY', 'sk_test_benchmark')
+
+import stripe
+
+from app import create_app
+from models import db
+from models.user import User
+from models.stripe_cache import PrezzoStripe, CheckoutStripe
+from utils.stripe_gateway import prezzo, crea_checkout, statistiche_api
+from utils.stripe_locale import StripeLocale
+
+app = create_app(avvia_scheduler=False)
+prefisso = f'bench{int(time.time())}_'
+acquisti = args.utenti * args.click
+
+
+def inline(user, importo):
+    """Com'era prima: un Session.create con price_data a ogni click"""
+    stripe.checkout.Session.create(
+        payment_method_types=['card'],
+        line_items=[{'price_data': {'currency': 'eur',
+                                    'product_data': {'name': 'Benchmark evento'},
+                                    'unit_amount': importo},
+                     'quantity': 1}],
+        mode='payment',
+        success_url='http://localhost/ok', cancel_url='http://localhost/ko',
+        customer_email=user.email,
+        metadata={'userid': str(user.id), 'tipo': 'evento'},
+    )
+
+
+def gateway(user, importo):
+    crea_checkout(f'user:{user.id}:{prefisso}', prezzo(f'{prefisso}:{importo}', 'Benchmark evento', importo),
+                  importo, 'http://localhost/ok', 'http://localhost/ko',
+                  {'userid': str(user.id), 'tipo': 'evento'}, user=user,
+                  scadenza=datetime.utcnow() + timedelta(minutes=40))
+    db.session.commit()
+
+
+def misura(nome, funzione, utenti):
+    prima = statistiche_api()
+    inizio = time.perf_counter()
+    for user in utenti:
+        for _ in range(args.click):
+            funzione(user, 1500)
+    durata = time.perf_counter() - inizio
+    chiamate = statistiche_api()['chiamate'] - prima['chiamate']
+    print(f"📊 {nome:8} {chiamate / acquisti:.2f} chiamate/acquisto, "
+          f"{durata / acquisti * 1000:.1f} ms/acquisto ({chiamate} chiamate in {durata:.2f}s)")
+
+
+with app.app_context(), StripeLocale(port=args.port, latenza=args.latenza) as finto:
+    utenti = [User(nickname=f'{prefisso}{i}', nome='Bench', cognome='Checkout',
+                   email=f'{prefisso}{i}@bench.local', password_hash='!', ruolo='tablhero')
+              for i in range(args.utenti)]
+    db.session.add_all(utenti)
+    db.session.commit()
+
+    print(f"🧪 {args.utenti} utenti x {args.click} click, latenza Stripe {args.latenza * 1000:.0f}ms")
+    misura('inline', inline, utenti)
+    misura('gateway', gateway, utenti)
+    if not args.api_base:
+        print(f"📊 Connessioni TCP aperte verso il finto Stripe: {finto.connessioni}")
+
+    # Pulizia
+    CheckoutStripe.query.filter(CheckoutStripe.chiave.like(f'user:%:{prefisso}')).delete(synchronize_session=False)
+    PrezzoStripe.query.filter(PrezzoStripe.chiave.like(f'{prefisso}%')).delete(synchronize_session=False)
+    User.query.filter(User.id.in_([u.id for u in utenti])).delete(synchronize_session=False)
+    db.session.commit()
@@ -0,0 +1,85 @@
+# benchmark_login.py - Login al secondo per core con il servizio password (bcrypt su pool limitato)
+#
+# Uso: python benchmark_login.py --costo 12 --client 8 --login 200
+#      python benchmark_login.py --costo 10 --worker 2 --coda 4 --client 16     (quanti 503 con la coda piena)
+#      python benchmark_login.py --http                                          (POST /login completi)
+# Con --http crea un utente di prova sul DB di DATABASE_URL e lo cancella alla fine.
+import argparse
+import os
+import threading
+import time
+import uuid
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--costo', type=int, default=12, help='BCRYPT_LOG_ROUNDS')
+parser.add_argument('--worker', type=int, default=0, help='thread bcrypt (0 = uno per core)')
+parser.add_argument('--coda', type=int, default=16, help='verifiche in attesa oltre i worker')
+parser.add_argument('--client', type=int, default=4, help='login concorrenti')
+parser.add_argument('--login', type=int, default=100, help='login totali')
+parser.add_argument('--http', action='store_true', help='passa da POST /login invece di chiamare il servizio')
+args = parser.parse_args()
+
+os.environ.update({'BCRYPT_LOG_ROUNDS': str(args.costo), 'PASSWORD_WORKER': str(args.worker),
+                   'PASSWORD_CODA': str(args.coda), 'OUTBOX_WORKER': '0'})
+
+from app import create_app
+from models import db
+from models.user import User
+from utils.password import password_service, ServizioOccupato
+
+app = create_app(avvia_scheduler=False)
+password = 'Benchmark-Login-123!'
+
+with app.app_context():
+    hash_prova = password_service.hash(password)
+    nickname = f'bench{uuid.uuid4().hex[:8]}'
+    if args.http:
+        utente = User(nickname=nickname, nome='Bench', cognome='Login', email=f'{nickname}@bench.local',
+                      email_verificata=True, password_hash=hash_prova)
+        db.session.add(utente)
+        db.session.commit()
+
+esiti = {'ok': 0, 'occupato': 0, 'errore': 0}
+lock = threading.Lock()
+contatore = iter(range(args.login))
+
+
+def client():
+    http = app.test_client() if args.http else None
+    for _ in contatore:
+        try:
+            if http:
+                risposta = http.post('/login', data={'nickname': nickname, 'email': f'{nickname}@bench.local',
+                                                     'password': password})
+                esito = {302: 'ok', 503: 'occupato'}.get(risposta.status_code, 'errore')
+                http.get('/logout')
+            else:
+                esito = 'ok' if password_service.verifica(hash_prova, password) else 'errore'
+        except ServizioOccupato:
+            esito = 'occupato'
+        with lock:
+            esiti[esito] += 1
+
+
+thread = [threading.Thread(target=client) for _ in range(args.client)]
+inizio = time.perf_counter()
+for t in thread:
+    t.start()
+for t in thread:
+    t.join()
+durata = time.perf_counter() - inizio
+
+if args.http:
+    with app.app_context():
+        User.query.filter_by(nickname=nickname).delete()
+        db.session.commit()
+
+core = min(password_service.worker, os.cpu_count() or 1)
+al_secondo = esiti['ok'] / durata
+print(f"🔐 bcrypt costo {args.costo}, {password_service.worker} worker, coda {password_service.coda}, "
+      f"{args.client} client, {'POST /login' if args.http else 'solo verifica'}")
+print(f"  ✅ {esiti['ok']} login in {durata:.2f}s: {al_secondo:.1f}/s, {al_secondo / core:.1f}/s per core ({core} core)")
+if esiti['occupato']:
+    print(f"  ⏳ {esiti['occupato']} rifiutati con la coda piena (503)")
+if esiti['errore']:
+    print(f"  ❌ {esiti['errore']} errori")
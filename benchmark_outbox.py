@@ -0,0 +1,81 @@
+# benchmark_outbox.py - Throughput della outbox email contro un server SMTP locale
+#
+# Uso: python benchmark_outbox.py --email 2000 --worker 4 --latenza 0.005 --errori 0.05
+# Richiede aiosmtpd (pip install aiosmtpd). DATABASE_URL permette di usare un DB di prova.
+import argparse
+import os
+import sys
+import time
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--email', type=int, default=1000)
+parser.add_argument('--worker', type=int, default=2)
+parser.add_argument('--lotto', type=int, default=50)
+parser.add_argument('--latenza', type=float, default=0.0, help='secondi per messaggio lato server')
+parser.add_argument('--errori', type=float, default=0.0, help='frazione di 451 simulati')
+parser.add_argument('--port', type=int, default=8025)
+args = parser.parse_args()
+
+# Il sink deve sostituire il server SMTP vero prima che venga letta la configurazione
+os.environ.update({
+    'MAIL_SERVER': '127.0.0.1',
+    'MAIL_PORT': str(args.port),
+    'MAIL_USE_TLS': 'False',
+    'MAIL_USERNAME': '',
+    'MAIL_PASSWORD': '',
+    'MAIL_DEFAULT_SENDER': 'benchmark@tablhero.local',
+    'OUTBOX_WORKER': '0',
+})
+
+from app import create_app
+from models import db
+from models.email_outbox import EmailOutbox
+from utils.outbox import accoda_email, OutboxWorkerPool
+from utils.smtp_sink import SmtpSink
+
+app = create_app(avvia_scheduler=False)
+app.config.update(OUTBOX_WORKER=args.worker, OUTBOX_LOTTO=args.lotto,
+                  OUTBOX_BACKOFF_SECONDI=0.1, OUTBOX_BACKOFF_MAX_SECONDI=1,
+                  OUTBOX_POLL_SECONDI=0.1)
+prefisso = f'bench{int(time.time())}_'
+
+with app.app_context():
+    print(f"🧪 Accodo {args.email} email")
+    for i in range(args.email):
+        accoda_email(f'{prefisso}{i}@bench.local', 'Benchmark outbox - TableHero',
+                     f'<p>Email di prova {i}</p>')
+    db.session.commit()
+
+with SmtpSink(port=args.port, latenza=args.latenza, tasso_errori=args.errori) as sink:
+    pool = OutboxWorkerPool(app, app.extensions['mail'])
+    inizio = time.perf_counter()
+    pool.avvia()
+
+    with app.app_context():
+        da_fare = EmailOutbox.destinatario.like(f'{prefisso}%') & \
+            EmailOutbox.stato.in_(('in_coda', 'in_invio'))
+        while EmailOutbox.query.filter(da_fare).count():
+            db.session.rollback()
+            time.sleep(0.05)
+    durata = time.perf_counter() - inizio
+    pool.ferma()
+
+with app.app_context():
+    mie = EmailOutbox.query.filter(EmailOutbox.destinatario.like(f'{prefisso}%'))
+    inviate = mie.filter_by(stato='inviata').count()
+    fallite = mie.filter_by(stato='fallita').count()
+    ritentate = mie.filter(EmailOutbox.tentativi > 0).count()
+
+    print(f"⏱️  {durata:.2f}s ({inviate / durata:.0f} email/s con {args.worker} worker)")
+    print(f"📊 Inviate: {inviate}, in dead letter: {fallite}, ritentate almeno una volta: {ritentate}")
+    print(f"📊 Sink: {len(sink.messaggi)} messaggi su {sink.connessioni} connessioni SMTP, "
+          f"{sink.rifiutati} 451 simulati")
+
+    # Pulizia
+    mie.delete(synchronize_session=False)
+    db.session.commit()
+
+if inviate + fallite != args.email:
+    print("❌ Email perse")
+    sys.exit(1)
+print("✅ Tutte le email consegnate o in dead letter")
@@ -0,0 +1,115 @@
+# carico_login.py - Login legittimi al secondo con e senza un attacco di credential stuffing
+#
+# Uso: python carico_login.py                      (limiti attivi: i login legittimi restano costanti)
+#      python carico_login.py --senza-limiti       (stesso attacco senza limiti, per confronto)
+#      python carico_login.py --secondi 20 --attaccanti 16 --costo 12
+# Gli utenti legittimi entrano ognuno da un IP diverso; l'attacco prova password sbagliate
+# su account esistenti (nickname ed email giusti, quindi ogni tentativo arriverebbe a bcrypt)
+# da pochi IP, a ritmo fisso: client e server girano nello stesso processo, e un attaccante
+# che gira a vuoto consumerebbe qui la CPU che nella realtà è sua. Crea gli utenti sul DB
+# di DATABASE_URL e li cancella alla fine.
+import argparse
+import itertools
+import os
+import threading
+import time
+import uuid
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--costo', type=int, default=10, help='BCRYPT_LOG_ROUNDS')
+parser.add_argument('--secondi', type=float, default=15, help='durata di ogni fase')
+parser.add_argument('--client', type=int, default=4, help='client legittimi concorrenti')
+parser.add_argument('--pausa', type=float, default=0.2, help='secondi tra due login di un client legittimo')
+parser.add_argument('--utenti', type=int, default=50, help='account legittimi (a rotazione)')
+parser.add_argument('--attaccanti', type=int, default=8, help='thread di attacco')
+parser.add_argument('--ip-attacco', type=int, default=2, help='IP da cui arriva l\'attacco')
+parser.add_argument('--ritmo-attacco', type=float, default=100, help='tentativi al secondo di tutto l\'attacco')
+parser.add_argument('--senza-limiti', action='store_true')
+args = parser.parse_args()
+
+os.environ.update({'BCRYPT_LOG_ROUNDS': str(args.costo), 'OUTBOX_WORKER': '0',
+                   'LIMITI_ATTIVI': str(not args.senza_limiti)})
+
+from app import create_app
+from models import db
+from models.user import User
+from utils.password import password_service
+
+app = create_app(avvia_scheduler=False)
+prefisso = f'carico{uuid.uuid4().hex[:6]}'
+password = 'Carico-Login-123!'
+
+with app.app_context():
+    hash_password = password_service.hash(password)
+    for i in range(args.utenti * 2):
+        nickname = f'{prefisso}{i}'
+        db.session.add(User(nickname=nickname, nome='Carico', cognome='Login', email=f'{nickname}@carico.local',
+                            email_verificata=True, password_hash=hash_password))
+    db.session.commit()
+
+legittimi = itertools.cycle(range(args.utenti))
+bersagli = itertools.cycle(range(args.utenti, args.utenti * 2))
+ip_legittimi = (f'10.{n // 65536 % 256}.{n // 256 % 256}.{n % 256}' for n in itertools.count(1))
+lock = threading.Lock()
+
+
+def client_legittimo(fine, esiti):
+    http = app.test_client()
+    while time.monotonic() < fine:
+        with lock:
+            i, ip = next(legittimi), next(ip_legittimi)
+        risposta = http.post('/login', data={'nickname': f'{prefisso}{i}', 'email': f'{prefisso}{i}@carico.local',
+                                             'password': password}, environ_base={'REMOTE_ADDR': ip})
+        with lock:
+            esiti[risposta.status_code] = esiti.get(risposta.status_code, 0) + 1
+        http.get('/logout')
+        time.sleep(args.pausa)
+
+
+def attaccante(fine, esiti, n):
+    http = app.test_client()
+    ip = f'203.0.113.{n % args.ip_attacco + 1}'
+    while time.monotonic() < fine:
+        with lock:
+            i = next(bersagli)
+        risposta = http.post('/login', data={'nickname': f'{prefisso}{i}', 'email': f'{prefisso}{i}@carico.local',
+                                             'password': uuid.uuid4().hex}, environ_base={'REMOTE_ADDR': ip})
+        with lock:
+            esiti[risposta.status_code] = esiti.get(risposta.status_code, 0) + 1
+        time.sleep(args.attaccanti / args.ritmo_attacco)
+
+
+def fase(nome, attacco):
+    legit, attacco_esiti = {}, {}
+    fine = time.monotonic() + args.secondi
+    thread = [threading.Thread(target=client_legittimo, args=(fine, legit)) for _ in range(args.client)]
+    if attacco:
+        thread += [threading.Thread(target=attaccante, args=(fine, attacco_esiti, n))
+                   for n in range(args.attaccanti)]
+    for t in thread:
+        t.start()
+    for t in thread:
+        t.join()
+
+    riusciti = legit.get(302, 0)
+    print(f"{nome}: ✅ {riusciti / args.secondi:.1f} login legittimi/s "
+          f"(429: {legit.get(429, 0)}, 503: {legit.get(503, 0)})")
+    if attacco:
+        totale = sum(attacco_esiti.values())
+        limitati = attacco_esiti.get(429, 0)
+        print(f"  🛡️  attacco: {totale} tentativi, {limitati} fermati con 429, "
+              f"{totale - limitati} arrivati a bcrypt")
+    return riusciti / args.secondi
+
+
+try:
+    print(f"🔐 costo {args.costo}, limiti {'spenti' if args.senza_limiti else 'attivi'}, "
+          f"{args.client} client legittimi, attacco a {args.ritmo_attacco:.0f}/s da {args.ip_attacco} IP")
+    base = fase('Senza attacco', attacco=False)
+    sotto = fase('Sotto attacco', attacco=True)
+    if base:
+        print(f"📊 Login legittimi sotto attacco: {sotto / base * 100:.0f}% della base")
+finally:
+    with app.app_context():
+        User.query.filter(User.nickname.like(f'{prefisso}%')).delete(synchronize_session=False)
+        db.session.commit()
@@ -6,20 +6,36 @@ load_dotenv()
 
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-key-molto-sicura'
-    SQLALCHEMY_DATABASE_URI = 'mysql+pymysql://root:@localhost/tablhero'
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'mysql+pymysql://root:@localhost/tablhero'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
     # Stripe Configuration
     STRIPE_PUBLIC_KEY = os.environ.get('STRIPE_PUBLIC_KEY')
     STRIPE_SECRET_KEY = os.environ.get('STRIPE_SECRET_KEY')
     STRIPE_WEBHOOK_SECRET = os.environ.get('STRIPE_WEBHOOK_SECRET')
+    STRIPE_API_BASE = os.environ.get('STRIPE_API_BASE')  # Server Stripe locale per i test (es. stripe-mock)
+    STRIPE_HTTP_POOL = 10  # Connessioni keep-alive verso l'API Stripe
+
+    # Worker webhook: elabora in ordine gli eventi salvati dall'endpoint
+    STRIPE_WEBHOOK_POLL_SECONDI = 1
+    STRIPE_WEBHOOK_LEASE_SECONDI = 30  # Un solo worker attivo nel cluster
+    STRIPE_WEBHOOK_MAX_TENTATIVI = 8  # Poi l'evento va in 'fallito' (vedi replay_webhook.py)
+    STRIPE_WEBHOOK_BACKOFF_SECONDI = 10  # Raddoppia a ogni tentativo fallito
     
     # Prezzi in centesimi (Euro)
     PRICE_TABLHERO = 2000  # 20€
     PRICE_VETERAN = 0  # Assegnato manualmente - non acquistabile
     PRICE_GAME_ARCHITECT = 3000  # 30€
     PRICE_FOUNDER = 0  # Non acquistabile
+
+    # Posto tenuto durante il checkout evento (Stripe richiede expires_at >= 30 minuti)
+    PRENOTAZIONE_MINUTI = 35
     
+    # Scheduler: un solo leader per cluster (SCHEDULER_ATTIVO=False per script e CLI)
+    SCHEDULER_ATTIVO = os.environ.get('SCHEDULER_ATTIVO', 'True') == 'True'
+    SCHEDULER_LEASE_SECONDI = 60  # Dopo questo tempo senza heartbeat subentra un altro processo
+    SCHEDULER_HEARTBEAT_SECONDI = 20
+
     # Flask-Mail Configuration
     MAIL_SERVER = os.environ.get('MAIL_SERVER')
     MAIL_PORT = int(os.environ.get('MAIL_PORT', 587))
@@ -29,7 +45,18 @@ class Config:
     MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
     MAIL_DEFAULT_SENDER = os.environ.get('MAIL_DEFAULT_SENDER')
 
-    # Livelli TablExp
+    # Outbox email: le route accodano, OUTBOX_WORKER thread inviano (0 = nessun worker)
+    OUTBOX_WORKER = int(os.environ.get('OUTBOX_WORKER', 2))
+    OUTBOX_LOTTO = 50  # Email prese per giro da ogni worker
+    OUTBOX_MAX_TENTATIVI = 6  # Poi l'email va in dead letter ('fallita')
+    OUTBOX_BACKOFF_SECONDI = 30  # Raddoppia a ogni tentativo fallito
+    OUTBOX_BACKOFF_MAX_SECONDI = 3600
+    OUTBOX_POLL_SECONDI = 2
+    OUTBOX_LEASE_SECONDI = 300  # Dopo questo tempo un lotto non confermato viene ripreso
+    OUTBOX_EMAIL_AL_SECONDO = float(os.environ.get('OUTBOX_EMAIL_AL_SECONDO', 0))  # Limite del provider, per tutto il cluster (0 = nessuno)
+
+    # Livelli TablExp: soglie di default, sovrascritte dalla tabella `livelli` se popolata
+    # (vedi utils/livelli.py e rilivella.py). Il massimo di ogni intervallo è solo indicativo.
     LIVELLI = {
         'bronzo': (1, 500),
         'argento': (501, 1500),
@@ -37,31 +64,57 @@ class Config:
         'platino': (3501, 7500),
         'diamante': (7501, float('inf'))
     }
-    
-    @staticmethod
-    def calcola_livello(exp):
-        """Calcola il livello in base all'esperienza"""
-        if exp >= 7501:
-            return 'diamante'
-        elif exp >= 3501:
-            return 'platino'
-        elif exp >= 1501:
-            return 'oro'
-        elif exp >= 501:
-            return 'argento'
-        else:
-            return 'bronzo'
-    
-    @staticmethod
-    def exp_per_prossimo_livello(exp):
-        """Calcola l'exp necessaria per il prossimo livello"""
-        if exp < 500:
-            return 500 - exp
-        elif exp < 1500:
-            return 1500 - exp
-        elif exp < 3500:
-            return 3500 - exp
-        elif exp < 7500:
-            return 7500 - exp
-        else:
-            return 0  # Livello massimo raggiunto
+    LIVELLI_RICARICA_SECONDI = 300  # Ogni processo rilegge le soglie dal DB al massimo ogni 5 minuti
+
+    # Registro EXP (exp_ledger): oltre questa età i movimenti vengono fusi in una riga per utente e mese
+    EXP_COMPATTAZIONE_GIORNI = 400
+
+    # Job notturno membership: avviso "la membership scade tra N giorni" per ogni N
+    MEMBERSHIP_AVVISI_GIORNI = (30, 7, 1)
+
+    # Classifiche per periodo (/leaderboard?periodo=stagione): stagioni di 3 mesi a partire da gennaio
+    STAGIONE_MESI = 3
+
+    # Query SQL per richiesta (utils/metriche_sql.py): totali per endpoint su /admin/metriche-sql,
+    # header X-Query-* in debug. Uno statement ripetuto così tante volte in una richiesta è un N+1.
+    METRICHE_SQL = os.environ.get('METRICHE_SQL', 'True') == 'True'
+    METRICHE_SQL_SOGLIA_N_PIU_1 = 5
+
+    # Metriche Prometheus su /metrics (utils/telemetria.py, serve pip install prometheus-client).
+    # Con più processi impostare PROMETHEUS_MULTIPROC_DIR su una cartella vuota prima dell'avvio.
+    METRICHE_PROMETHEUS = os.environ.get('METRICHE_PROMETHEUS', 'False') == 'True'
+    METRICHE_TOKEN = os.environ.get('METRICHE_TOKEN')  # Se impostato /metrics vuole Authorization: Bearer <token>
+
+    # Log (utils/log.py): logger 'tablhero.<blueprint o modulo>', JSON su stderr da un thread dedicato
+    LOG_LIVELLO = os.environ.get('LOG_LIVELLO', 'INFO')
+    LOG_LIVELLI = os.environ.get('LOG_LIVELLI', '')  # Per blueprint/modulo, es. "auth=DEBUG,scheduler=WARNING"
+    LOG_CAMPIONAMENTO = os.environ.get('LOG_CAMPIONAMENTO', 'auth=0.1')  # Quota di DEBUG/INFO tenuta (WARNING+ sempre)
+    LOG_FORMATO = os.environ.get('LOG_FORMATO', 'json')  # 'testo' per lo sviluppo
+
+    # Password (utils/password.py): costo bcrypt (le hash con costo diverso si aggiornano al login),
+    # thread bcrypt per processo (default: un core ciascuno) e login in attesa oltre i quali si risponde 503
+    BCRYPT_LOG_ROUNDS = int(os.environ.get('BCRYPT_LOG_ROUNDS', 12))
+    PASSWORD_WORKER = int(os.environ.get('PASSWORD_WORKER', 0)) or None
+    PASSWORD_CODA = int(os.environ.get('PASSWORD_CODA', 16))
+    PASSWORD_ATTESA_SECONDI = 10
+
+    # Limiti di frequenza (utils/limiti.py): (capienza, token al minuto) per regola.
+    # La chiave 'ip' è request.remote_addr: dietro un proxy serve ProxyFix.
+    LIMITI_ATTIVI = os.environ.get('LIMITI_ATTIVI', 'True') == 'True'
+    LIMITI = {
+        'login_ip': (10, 10),  # Una raffica di 10 tentativi, poi uno ogni 6 secondi
+        'login_nickname': (5, 5),
+        'reinvia_ip': (5, 2),
+        'reinvia_email': (2, 0.2),  # Un'email di verifica ogni 5 minuti dopo le prime due
+    }
+    LIMITI_REDIS_URL = os.environ.get('LIMITI_REDIS_URL')  # Secchielli condivisi tra processi (pip install redis)
+    LIMITI_CHIAVI_MAX = 100000  # Secchielli tenuti in memoria per processo
+
+    # Export admin e esporta.py (utils/esportazioni.py): righe lette per giro dal cursore lato server
+    ESPORTAZIONE_LOTTO = 1000
+
+    # Cache dell'utente corrente (load_user senza query)
+    UTENTI_CACHE = os.environ.get('UTENTI_CACHE', 'True') == 'True'
+    UTENTI_CACHE_MAX = 10000  # Utenti in memoria per processo
+    UTENTI_CACHE_VERIFICA_SECONDI = 5  # Ogni quanto si confrontano le versioni con il DB (scritture degli altri processi)
+    UTENTI_CACHE_TTL = 300  # Oltre questa età una foto si rilegge comunque
@@ -0,0 +1,50 @@
+# esporta.py - Export di utenti, eventi o partecipazioni in un file compresso (CSV o JSONL gzip)
+#
+# Uso: python esporta.py partecipazioni                          (partecipazioni-AAAAMMGG-HHMM.csv.gz)
+#      python esporta.py utenti --formato jsonl --ruolo veteran --search rossi
+#      python esporta.py partecipazioni --evento-id 12 -o evento12.csv.gz
+#      python esporta.py eventi --tipo giochi_ruolo --lotto 5000
+# Stessi filtri e stesse colonne degli export della pagina admin; righe lette a lotti
+# da un cursore lato server e compresse man mano, quindi la memoria non cresce con il DB.
+import argparse
+import gzip
+import os
+import time
+from datetime import datetime
+
+from utils.esportazioni import ESPORTAZIONI, FORMATI, intestazione, formatta, lotti
+
+parser = argparse.ArgumentParser()
+parser.add_argument('nome', choices=sorted(ESPORTAZIONI))
+parser.add_argument('--formato', choices=sorted(FORMATI), default='csv')
+parser.add_argument('-o', '--output', help='file .gz di destinazione (default: <nome>-<data>.<formato>.gz)')
+parser.add_argument('--lotto', type=int, help='righe lette per giro (default: ESPORTAZIONE_LOTTO)')
+parser.add_argument('--search', default='', help='utenti: nickname, email, nome o cognome')
+parser.add_argument('--ruolo', default='', help='utenti: ruolo')
+parser.add_argument('--tipo', default='', help='eventi: giochi_tavolo o giochi_ruolo')
+parser.add_argument('--evento-id', type=int, help='partecipazioni: un solo evento')
+parser.add_argument('--user-id', type=int, help='partecipazioni: un solo utente')
+args = parser.parse_args()
+
+from app import create_app
+
+app = create_app(avvia_scheduler=False)
+query, parametri = ESPORTAZIONI[args.nome]
+output = args.output or f'{args.nome}-{datetime.now():%Y%m%d-%H%M}.{args.formato}.gz'
+
+with app.app_context():
+    stmt = query(**{p: getattr(args, p) for p in parametri})
+    colonne = list(stmt.selected_columns.keys())
+    lotto = args.lotto or app.config['ESPORTAZIONE_LOTTO']
+
+    print(f"📦 Export {args.nome} ({args.formato}) in {output}...")
+    inizio = time.perf_counter()
+    righe_scritte = 0
+    with gzip.open(output, 'wt', encoding='utf-8', newline='') as f:
+        f.write(intestazione(colonne, args.formato))
+        for righe in lotti(stmt, lotto):
+            f.write(formatta(righe, colonne, args.formato))
+            righe_scritte += len(righe)
+    durata = time.perf_counter() - inizio
+
+print(f"✅ {righe_scritte} righe in {durata:.1f}s, {os.path.getsize(output) / 1024:.0f} KB compressi")
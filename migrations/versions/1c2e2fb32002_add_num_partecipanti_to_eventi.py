@@ -0,0 +1,32 @@
+"""Add num_partecipanti counter to eventi
+
+Revision ID: 1c2e2fb32002
+Revises: 2fee59b3f350
+Create Date: 2026-10-17 10:12:41.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1c2e2fb32002'
+down_revision = '2fee59b3f350'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('eventi', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('num_partecipanti', sa.Integer(), nullable=False, server_default='0'))
+
+    # Backfill del contatore dalle partecipazioni esistenti
+    op.execute(
+        "UPDATE eventi SET num_partecipanti = "
+        "(SELECT COUNT(*) FROM partecipazioni p WHERE p.evento_id = eventi.id)"
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('eventi', schema=None) as batch_op:
+        batch_op.drop_column('num_partecipanti')
@@ -0,0 +1,42 @@
+"""Add stripe_eventi table for asynchronous webhook processing
+
+Revision ID: 20dc6f46346b
+Revises: 4c8dc1d127fb
+Create Date: 2026-10-18 13:02:44.871630
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '20dc6f46346b'
+down_revision = '4c8dc1d127fb'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('stripe_eventi',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('stripe_id', sa.String(length=255), nullable=False),
+    sa.Column('tipo', sa.String(length=100), nullable=False),
+    sa.Column('payload', sa.Text(length=16777215), nullable=False),
+    sa.Column('stato', sa.Enum('in_coda', 'elaborato', 'fallito'), nullable=False),
+    sa.Column('tentativi', sa.Integer(), nullable=False),
+    sa.Column('prossimo_tentativo', sa.DateTime(), nullable=False),
+    sa.Column('esito', sa.Text(), nullable=True),
+    sa.Column('data_ricezione', sa.DateTime(), nullable=True),
+    sa.Column('data_elaborazione', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('stripe_id')
+    )
+    with op.batch_alter_table('stripe_eventi', schema=None) as batch_op:
+        batch_op.create_index('ix_stripe_eventi_stato_prossimo', ['stato', 'prossimo_tentativo'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('stripe_eventi', schema=None) as batch_op:
+        batch_op.drop_index('ix_stripe_eventi_stato_prossimo')
+
+    op.drop_table('stripe_eventi')
@@ -0,0 +1,44 @@
+"""Add email_outbox table
+
+Revision ID: 49979de52adc
+Revises: d5f10b5c57eb
+Create Date: 2026-10-18 09:12:40.318205
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '49979de52adc'
+down_revision = 'd5f10b5c57eb'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('email_outbox',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('destinatario', sa.String(length=255), nullable=False),
+    sa.Column('oggetto', sa.String(length=255), nullable=False),
+    sa.Column('html', sa.Text(), nullable=False),
+    sa.Column('stato', sa.Enum('in_coda', 'in_invio', 'inviata', 'fallita'), nullable=False),
+    sa.Column('tentativi', sa.Integer(), nullable=False),
+    sa.Column('prossimo_tentativo', sa.DateTime(), nullable=False),
+    sa.Column('lotto', sa.String(length=32), nullable=True),
+    sa.Column('ultimo_errore', sa.Text(), nullable=True),
+    sa.Column('data_creazione', sa.DateTime(), nullable=True),
+    sa.Column('data_invio', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('email_outbox', schema=None) as batch_op:
+        batch_op.create_index('ix_email_outbox_stato_prossimo', ['stato', 'prossimo_tentativo'], unique=False)
+        batch_op.create_index(batch_op.f('ix_email_outbox_lotto'), ['lotto'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('email_outbox', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_email_outbox_lotto'))
+        batch_op.drop_index('ix_email_outbox_stato_prossimo')
+
+    op.drop_table('email_outbox')
@@ -0,0 +1,47 @@
+"""Add scheduler_leader and esecuzioni_job tables
+
+Revision ID: 4c8dc1d127fb
+Revises: 6e5b2f3880b2
+Create Date: 2026-10-18 11:26:51.094377
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4c8dc1d127fb'
+down_revision = '6e5b2f3880b2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('scheduler_leader',
+    sa.Column('nome', sa.String(length=50), nullable=False),
+    sa.Column('istanza', sa.String(length=100), nullable=False),
+    sa.Column('scadenza', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('nome')
+    )
+    op.create_table('esecuzioni_job',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('job_id', sa.String(length=100), nullable=False),
+    sa.Column('slot', sa.String(length=32), nullable=False),
+    sa.Column('istanza', sa.String(length=100), nullable=False),
+    sa.Column('esito', sa.Enum('in_corso', 'ok', 'errore'), nullable=False),
+    sa.Column('errore', sa.Text(), nullable=True),
+    sa.Column('inizio', sa.DateTime(), nullable=True),
+    sa.Column('fine', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('job_id', 'slot', name='uq_esecuzioni_job_slot')
+    )
+    with op.batch_alter_table('esecuzioni_job', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_esecuzioni_job_inizio'), ['inizio'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('esecuzioni_job', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_esecuzioni_job_inizio'))
+
+    op.drop_table('esecuzioni_job')
+    op.drop_table('scheduler_leader')
@@ -0,0 +1,49 @@
+"""Add composite indexes for hot queries
+
+Revision ID: 4d7a2c8e1f36
+Revises: e2b6f0c4d951
+Create Date: 2026-10-18 19:41:27.118305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4d7a2c8e1f36'
+down_revision = 'e2b6f0c4d951'
+branch_labels = None
+depends_on = None
+
+
+INDICI = [
+    ('users', 'ix_users_attivo_ruolo_tabl_exp', ['attivo', 'ruolo', 'tabl_exp']),
+    ('users', 'ix_users_tabl_exp', ['tabl_exp']),
+    ('users', 'ix_users_data_registrazione', ['data_registrazione']),
+    ('users', 'ix_users_ruolo_data_registrazione', ['ruolo', 'data_registrazione']),
+    ('eventi', 'ix_eventi_tipo_data_evento_id', ['tipo', 'data_evento', 'id']),
+    ('partecipazioni', 'ix_partecipazioni_user_data', ['user_id', 'data_partecipazione']),
+    ('partecipazioni', 'ix_partecipazioni_evento_id', ['evento_id']),
+]
+
+
+def _esistenti(tabella):
+    """Colonne degli indici già presenti (anche quelli creati da MariaDB per le FK)"""
+    return {tuple(i['column_names']) for i in sa.inspect(op.get_bind()).get_indexes(tabella)}
+
+
+def upgrade():
+    for tabella, nome, colonne in INDICI:
+        # Es. la chiave `evento_id` del dump: un doppione rallenterebbe solo le scritture
+        if tuple(colonne) in _esistenti(tabella):
+            continue
+        with op.batch_alter_table(tabella, schema=None) as batch_op:
+            batch_op.create_index(nome, colonne, unique=False)
+
+
+def downgrade():
+    for tabella, nome, colonne in reversed(INDICI):
+        if nome not in {i['name'] for i in sa.inspect(op.get_bind()).get_indexes(tabella)}:
+            continue
+        with op.batch_alter_table(tabella, schema=None) as batch_op:
+            batch_op.drop_index(nome)
@@ -0,0 +1,47 @@
+"""Add prenotazioni_posti table and eventi.num_prenotati
+
+Revision ID: 4e30705d94a0
+Revises: e87d566d6163
+Create Date: 2026-10-17 11:48:09.662731
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4e30705d94a0'
+down_revision = 'e87d566d6163'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('prenotazioni_posti',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('evento_id', sa.Integer(), nullable=False),
+    sa.Column('stripe_session_id', sa.String(length=255), nullable=True),
+    sa.Column('scadenza', sa.DateTime(), nullable=False),
+    sa.Column('data_creazione', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['evento_id'], ['eventi.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('stripe_session_id'),
+    sa.UniqueConstraint('user_id', 'evento_id', name='uq_prenotazioni_user_evento')
+    )
+    with op.batch_alter_table('prenotazioni_posti', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_prenotazioni_posti_scadenza'), ['scadenza'], unique=False)
+
+    with op.batch_alter_table('eventi', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('num_prenotati', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade():
+    with op.batch_alter_table('eventi', schema=None) as batch_op:
+        batch_op.drop_column('num_prenotati')
+
+    with op.batch_alter_table('prenotazioni_posti', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_prenotazioni_posti_scadenza'))
+
+    op.drop_table('prenotazioni_posti')
@@ -0,0 +1,55 @@
+"""Add exp_ledger with opening balances
+
+Revision ID: 5f8b3d1e6a27
+Revises: 7a1c5e9d2b40
+Create Date: 2026-10-18 17:21:09.604815
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5f8b3d1e6a27'
+down_revision = '7a1c5e9d2b40'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('exp_ledger',
+    sa.Column('id', sa.BigInteger().with_variant(sa.Integer(), 'sqlite'), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('delta', sa.Integer(), nullable=False),
+    sa.Column('causale', sa.Enum('apertura', 'iscrizione', 'promozione', 'annullamento', 'rimozione', 'admin', 'correzione', 'compattazione'), nullable=False),
+    sa.Column('evento_id', sa.Integer(), nullable=True),
+    sa.Column('data', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('exp_ledger', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_exp_ledger_data'), ['data'], unique=False)
+        batch_op.create_index('ix_exp_ledger_user_data', ['user_id', 'data'], unique=False)
+
+    # Saldo di apertura: il registro parte dai tabl_exp attuali
+    users = sa.table('users', sa.column('id', sa.Integer), sa.column('tabl_exp', sa.Integer))
+    exp_ledger = sa.table('exp_ledger', sa.column('user_id', sa.Integer), sa.column('delta', sa.Integer),
+                          sa.column('causale', sa.String), sa.column('data', sa.DateTime))
+    op.execute(
+        exp_ledger.insert().from_select(
+            ['user_id', 'delta', 'causale', 'data'],
+            sa.select(users.c.id, users.c.tabl_exp, sa.literal('apertura'),
+                      sa.literal(datetime.utcnow(), sa.DateTime))
+            .where(users.c.tabl_exp != 0)
+        )
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('exp_ledger', schema=None) as batch_op:
+        batch_op.drop_index('ix_exp_ledger_user_data')
+        batch_op.drop_index(batch_op.f('ix_exp_ledger_data'))
+
+    op.drop_table('exp_ledger')
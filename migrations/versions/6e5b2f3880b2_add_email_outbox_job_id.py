@@ -0,0 +1,28 @@
+"""Add email_outbox.job_id for bulk sends
+
+Revision ID: 6e5b2f3880b2
+Revises: 49979de52adc
+Create Date: 2026-10-18 10:03:17.540912
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6e5b2f3880b2'
+down_revision = '49979de52adc'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('email_outbox', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('job_id', sa.String(length=32), nullable=True))
+        batch_op.create_index(batch_op.f('ix_email_outbox_job_id'), ['job_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('email_outbox', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_email_outbox_job_id'))
+        batch_op.drop_column('job_id')
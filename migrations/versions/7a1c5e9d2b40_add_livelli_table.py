@@ -0,0 +1,29 @@
+"""Add livelli table
+
+Revision ID: 7a1c5e9d2b40
+Revises: b3e07a9d51c4
+Create Date: 2026-10-18 16:02:44.518203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7a1c5e9d2b40'
+down_revision = 'b3e07a9d51c4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('livelli',
+    sa.Column('nome', sa.String(length=20), nullable=False),
+    sa.Column('exp_minima', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('nome'),
+    sa.UniqueConstraint('exp_minima')
+    )
+
+
+def downgrade():
+    op.drop_table('livelli')
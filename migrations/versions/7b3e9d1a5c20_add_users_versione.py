@@ -0,0 +1,26 @@
+"""Add users.versione for the cached user loader
+
+Revision ID: 7b3e9d1a5c20
+Revises: 4d7a2c8e1f36
+Create Date: 2026-10-18 22:05:12.481730
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7b3e9d1a5c20'
+down_revision = '4d7a2c8e1f36'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('versione', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_column('versione')
@@ -0,0 +1,26 @@
+"""Add users (ha_pagato, data_scadenza) index for the membership job
+
+Revision ID: a91c4f6e2b08
+Revises: 7b3e9d1a5c20
+Create Date: 2026-10-18 23:12:40.907215
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a91c4f6e2b08'
+down_revision = '7b3e9d1a5c20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.create_index('ix_users_ha_pagato_data_scadenza', ['ha_pagato', 'data_scadenza'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_index('ix_users_ha_pagato_data_scadenza')
@@ -0,0 +1,49 @@
+"""Add stripe_prezzi and stripe_checkout caches
+
+Revision ID: b3e07a9d51c4
+Revises: 20dc6f46346b
+Create Date: 2026-10-18 14:37:05.226418
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3e07a9d51c4'
+down_revision = '20dc6f46346b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('stripe_prezzi',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('chiave', sa.String(length=255), nullable=False),
+    sa.Column('importo', sa.Integer(), nullable=False),
+    sa.Column('product_id', sa.String(length=255), nullable=False),
+    sa.Column('price_id', sa.String(length=255), nullable=False),
+    sa.Column('data_creazione', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('chiave')
+    )
+    op.create_table('stripe_checkout',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('chiave', sa.String(length=255), nullable=False),
+    sa.Column('importo', sa.Integer(), nullable=False),
+    sa.Column('session_id', sa.String(length=255), nullable=False),
+    sa.Column('url', sa.Text(), nullable=False),
+    sa.Column('scadenza', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('chiave')
+    )
+    with op.batch_alter_table('stripe_checkout', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_stripe_checkout_session_id'), ['session_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('stripe_checkout', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_stripe_checkout_session_id'))
+
+    op.drop_table('stripe_checkout')
+    op.drop_table('stripe_prezzi')
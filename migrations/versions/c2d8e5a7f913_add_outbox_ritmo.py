@@ -0,0 +1,28 @@
+"""Add outbox_ritmo table for the cluster-wide email rate limit
+
+Revision ID: c2d8e5a7f913
+Revises: a91c4f6e2b08
+Create Date: 2026-10-19 09:14:03.552817
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c2d8e5a7f913'
+down_revision = 'a91c4f6e2b08'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('outbox_ritmo',
+    sa.Column('nome', sa.String(length=50), nullable=False),
+    sa.Column('prossimo_ms', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('nome')
+    )
+
+
+def downgrade():
+    op.drop_table('outbox_ritmo')
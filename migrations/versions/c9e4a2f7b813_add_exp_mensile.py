@@ -0,0 +1,36 @@
+"""Add exp_mensile rollup
+
+Revision ID: c9e4a2f7b813
+Revises: 5f8b3d1e6a27
+Create Date: 2026-10-18 18:05:37.118640
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c9e4a2f7b813'
+down_revision = '5f8b3d1e6a27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('exp_mensile',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('mese', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('exp', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id', 'mese')
+    )
+    with op.batch_alter_table('exp_mensile', schema=None) as batch_op:
+        batch_op.create_index('ix_exp_mensile_mese_user_exp', ['mese', 'user_id', 'exp'], unique=False)
+    # Il contenuto si ricostruisce dalle partecipazioni: python ricostruisci_classifiche.py
+
+
+def downgrade():
+    with op.batch_alter_table('exp_mensile', schema=None) as batch_op:
+        batch_op.drop_index('ix_exp_mensile_mese_user_exp')
+
+    op.drop_table('exp_mensile')
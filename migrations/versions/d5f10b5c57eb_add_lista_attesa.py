@@ -0,0 +1,39 @@
+"""Add lista_attesa table
+
+Revision ID: d5f10b5c57eb
+Revises: 4e30705d94a0
+Create Date: 2026-10-17 12:31:55.107842
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd5f10b5c57eb'
+down_revision = '4e30705d94a0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('lista_attesa',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('evento_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('posizione', sa.Integer(), nullable=False),
+    sa.Column('data_iscrizione', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['evento_id'], ['eventi.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('evento_id', 'user_id', name='uq_lista_attesa_evento_user')
+    )
+    with op.batch_alter_table('lista_attesa', schema=None) as batch_op:
+        batch_op.create_index('ix_lista_attesa_evento_posizione', ['evento_id', 'posizione'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('lista_attesa', schema=None) as batch_op:
+        batch_op.drop_index('ix_lista_attesa_evento_posizione')
+
+    op.drop_table('lista_attesa')
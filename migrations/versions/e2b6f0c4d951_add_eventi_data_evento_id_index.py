@@ -0,0 +1,26 @@
+"""Add (data_evento, id) index on eventi
+
+Revision ID: e2b6f0c4d951
+Revises: c9e4a2f7b813
+Create Date: 2026-10-18 18:52:13.772904
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2b6f0c4d951'
+down_revision = 'c9e4a2f7b813'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('eventi', schema=None) as batch_op:
+        batch_op.create_index('ix_eventi_data_evento_id', ['data_evento', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('eventi', schema=None) as batch_op:
+        batch_op.drop_index('ix_eventi_data_evento_id')
@@ -0,0 +1,37 @@
+"""Unique constraint on partecipazioni (user_id, evento_id)
+
+Revision ID: e87d566d6163
+Revises: 1c2e2fb32002
+Create Date: 2026-10-17 11:03:27.905411
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e87d566d6163'
+down_revision = '1c2e2fb32002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Elimina eventuali doppioni (tiene la prima iscrizione) e riallinea i contatori
+    op.execute(
+        "DELETE FROM partecipazioni WHERE id NOT IN ("
+        "SELECT id FROM (SELECT MIN(id) AS id FROM partecipazioni "
+        "GROUP BY user_id, evento_id) AS da_tenere)"
+    )
+    op.execute(
+        "UPDATE eventi SET num_partecipanti = "
+        "(SELECT COUNT(*) FROM partecipazioni p WHERE p.evento_id = eventi.id)"
+    )
+
+    with op.batch_alter_table('partecipazioni', schema=None) as batch_op:
+        batch_op.create_unique_constraint('uq_partecipazioni_user_evento', ['user_id', 'evento_id'])
+
+
+def downgrade():
+    with op.batch_alter_table('partecipazioni', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_partecipazioni_user_evento', type_='unique')
@@ -0,0 +1,41 @@
+# models/email_outbox.py
+from models import db
+from datetime import datetime
+
+class EmailOutbox(db.Model):
+    """Email da inviare: scritta nella stessa transazione della richiesta, spedita dai worker"""
+    __tablename__ = 'email_outbox'
+    __table_args__ = (
+        db.Index('ix_email_outbox_stato_prossimo', 'stato', 'prossimo_tentativo'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    destinatario = db.Column(db.String(255), nullable=False)
+    oggetto = db.Column(db.String(255), nullable=False)
+    html = db.Column(db.Text, nullable=False)
+
+    # in_coda -> in_invio -> inviata | (in_coda con backoff) | fallita (dead letter)
+    stato = db.Column(db.Enum('in_coda', 'in_invio', 'inviata', 'fallita'),
+                      nullable=False, default='in_coda')
+    tentativi = db.Column(db.Integer, nullable=False, default=0)
+    prossimo_tentativo = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    lotto = db.Column(db.String(32), index=True)  # Token del worker che l'ha presa in carico
+    job_id = db.Column(db.String(32), index=True)  # Invii massivi (reminder): per seguirne l'avanzamento
+    ultimo_errore = db.Column(db.Text)
+
+    data_creazione = db.Column(db.DateTime, default=datetime.utcnow)
+    data_invio = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f'<EmailOutbox {self.id} {self.destinatario} - {self.stato}>'
+
+
+class RitmoOutbox(db.Model):
+    """Prossimo turno di invio libero per tutto il cluster (OUTBOX_EMAIL_AL_SECONDO)"""
+    __tablename__ = 'outbox_ritmo'
+
+    nome = db.Column(db.String(50), primary_key=True)
+    prossimo_ms = db.Column(db.BigInteger, nullable=False)  # Epoch in millisecondi: aritmetica uguale su ogni DB
+
+    def __repr__(self):
+        return f'<RitmoOutbox {self.nome} {self.prossimo_ms}>'
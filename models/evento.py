@@ -4,6 +4,12 @@ from datetime import datetime
 
 class Evento(db.Model):
     __tablename__ = 'eventi'
+    __table_args__ = (
+        # Paginazione keyset di archivio e admin (utils/paginazione.py)
+        db.Index('ix_eventi_data_evento_id', 'data_evento', 'id'),
+        # Stessi elenchi filtrati per tipo: prima l'uguaglianza, poi il range su data_evento
+        db.Index('ix_eventi_tipo_data_evento_id', 'tipo', 'data_evento', 'id'),
+    )
     
     prezzo = db.Column(db.Numeric(10,2), default=15.00)
     id = db.Column(db.Integer, primary_key=True)
@@ -13,6 +19,8 @@ class Evento(db.Model):
     data_evento = db.Column(db.DateTime, nullable=False)
     max_partecipanti = db.Column(db.Integer)
     override_partecipanti = db.Column(db.Integer)  # Manual override for past events
+    num_partecipanti = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Contatore denormalizzato
+    num_prenotati = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Posti tenuti durante il checkout
     exp_reward = db.Column(db.Integer, default=50)
     immagine_url = db.Column(db.String(255))
     
@@ -23,16 +31,20 @@ class Evento(db.Model):
     partecipazioni = db.relationship('Partecipazione', backref='evento',
                                     lazy=True, cascade='all, delete-orphan')
     
+    def posti_occupati(self):
+        """Iscritti + posti tenuti da checkout Stripe in corso"""
+        return (self.num_partecipanti or 0) + (self.num_prenotati or 0)
+    
     def is_full(self):
-        """Controlla se l'evento è pieno"""
+        """Controlla se l'evento è pieno (usa i contatori, niente lazy load)"""
         if self.max_partecipanti:
-            return len(self.partecipazioni) >= self.max_partecipanti
+            return self.posti_occupati() >= self.max_partecipanti
         return False
     
     def posti_disponibili(self):
         """Ritorna i posti disponibili"""
         if self.max_partecipanti:
-            return self.max_partecipanti - len(self.partecipazioni)
+            return self.max_partecipanti - self.posti_occupati()
         return None
     
     def __repr__(self):
@@ -0,0 +1,24 @@
+# models/exp_ledger.py
+from models import db
+from datetime import datetime
+
+class MovimentoExp(db.Model):
+    """
+    Registro append-only dei TablExp: ogni assegnazione o storno è una riga.
+    users.tabl_exp è la somma dei delta dell'utente (vedi utils/exp.riconcilia).
+    """
+    __tablename__ = 'exp_ledger'
+    __table_args__ = (
+        db.Index('ix_exp_ledger_user_data', 'user_id', 'data'),
+    )
+
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    delta = db.Column(db.Integer, nullable=False)
+    causale = db.Column(db.Enum('apertura', 'iscrizione', 'promozione', 'annullamento', 'rimozione',
+                                'admin', 'correzione', 'compattazione'), nullable=False)
+    evento_id = db.Column(db.Integer)  # Nessuna FK: il movimento resta anche se l'evento viene eliminato
+    data = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)  # Range scan per periodo
+
+    def __repr__(self):
+        return f'<MovimentoExp User:{self.user_id} {self.delta:+d} {self.causale}>'
@@ -0,0 +1,17 @@
+# models/exp_mensile.py
+from models import db
+
+class ExpMensile(db.Model):
+    """Rollup EXP da partecipazioni per utente e mese: le classifiche per periodo leggono solo da qui"""
+    __tablename__ = 'exp_mensile'
+    __table_args__ = (
+        # Covering per le classifiche: range su mese, GROUP BY user_id, SUM(exp) senza toccare la tabella
+        db.Index('ix_exp_mensile_mese_user_exp', 'mese', 'user_id', 'exp'),
+    )
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    mese = db.Column(db.Integer, primary_key=True, autoincrement=False)  # AAAAMM, es. 202610
+    exp = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<ExpMensile User:{self.user_id} {self.mese} {self.exp}>'
@@ -0,0 +1,20 @@
+# models/lista_attesa.py
+from models import db
+from datetime import datetime
+
+class ListaAttesa(db.Model):
+    """Coda FIFO per evento: chi è in testa viene iscritto quando si libera un posto"""
+    __tablename__ = 'lista_attesa'
+    __table_args__ = (
+        db.Index('ix_lista_attesa_evento_posizione', 'evento_id', 'posizione'),
+        db.UniqueConstraint('evento_id', 'user_id', name='uq_lista_attesa_evento_user'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    evento_id = db.Column(db.Integer, db.ForeignKey('eventi.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    posizione = db.Column(db.Integer, nullable=False)
+    data_iscrizione = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<ListaAttesa Event:{self.evento_id} User:{self.user_id} #{self.posizione}>'
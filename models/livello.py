@@ -0,0 +1,12 @@
+# models/livello.py
+from models import db
+
+class LivelloExp(db.Model):
+    """Soglia di un livello TablExp. Se la tabella è vuota valgono quelle di Config.LIVELLI"""
+    __tablename__ = 'livelli'
+
+    nome = db.Column(db.String(20), primary_key=True)  # Uno dei valori di User.livello
+    exp_minima = db.Column(db.Integer, unique=True, nullable=False)
+
+    def __repr__(self):
+        return f'<LivelloExp {self.nome} da {self.exp_minima}>'
@@ -4,6 +4,13 @@ from datetime import datetime
 
 class Partecipazione(db.Model):
     __tablename__ = 'partecipazioni'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'evento_id', name='uq_partecipazioni_user_evento'),
+        # Storico della dashboard: partecipazioni di un utente dalla più recente
+        db.Index('ix_partecipazioni_user_data', 'user_id', 'data_partecipazione'),
+        # Partecipanti di un evento (su MariaDB c'è già la chiave della FK: la migrazione la riusa)
+        db.Index('ix_partecipazioni_evento_id', 'evento_id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
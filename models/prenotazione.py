@@ -0,0 +1,23 @@
+# models/prenotazione.py
+from models import db
+from datetime import datetime
+
+class PrenotazionePosto(db.Model):
+    """Posto tenuto da parte mentre l'utente paga su Stripe (scade dopo un TTL)"""
+    __tablename__ = 'prenotazioni_posti'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'evento_id', name='uq_prenotazioni_user_evento'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    evento_id = db.Column(db.Integer, db.ForeignKey('eventi.id'), nullable=False)
+    stripe_session_id = db.Column(db.String(255), unique=True, nullable=True)
+    scadenza = db.Column(db.DateTime, nullable=False, index=True)
+    data_creazione = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def is_scaduta(self):
+        return self.scadenza < datetime.utcnow()
+
+    def __repr__(self):
+        return f'<PrenotazionePosto User:{self.user_id} Event:{self.evento_id} scade:{self.scadenza}>'
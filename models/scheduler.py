@@ -0,0 +1,34 @@
+# models/scheduler.py
+from models import db
+from datetime import datetime
+
+class LeaderScheduler(db.Model):
+    """Lease del processo che esegue lo scheduler: una riga per nome, rinnovata a ogni heartbeat"""
+    __tablename__ = 'scheduler_leader'
+
+    nome = db.Column(db.String(50), primary_key=True)
+    istanza = db.Column(db.String(100), nullable=False)  # host:pid:token del leader attuale
+    scadenza = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f'<LeaderScheduler {self.nome} {self.istanza} scade:{self.scadenza}>'
+
+
+class EsecuzioneJob(db.Model):
+    """Registro esecuzioni: la chiave (job_id, slot) garantisce un'esecuzione per cluster"""
+    __tablename__ = 'esecuzioni_job'
+    __table_args__ = (
+        db.UniqueConstraint('job_id', 'slot', name='uq_esecuzioni_job_slot'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.String(100), nullable=False)
+    slot = db.Column(db.String(32), nullable=False)  # Periodo di competenza (es. giorno per un job giornaliero)
+    istanza = db.Column(db.String(100), nullable=False)
+    esito = db.Column(db.Enum('in_corso', 'ok', 'errore'), nullable=False, default='in_corso')
+    errore = db.Column(db.Text)
+    inizio = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    fine = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f'<EsecuzioneJob {self.job_id} {self.slot} - {self.esito}>'
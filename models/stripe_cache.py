@@ -0,0 +1,32 @@
+# models/stripe_cache.py
+from models import db
+from datetime import datetime
+
+class PrezzoStripe(db.Model):
+    """Product/Price già creati su Stripe, riusati invece di mandare price_data a ogni checkout"""
+    __tablename__ = 'stripe_prezzi'
+
+    id = db.Column(db.Integer, primary_key=True)
+    chiave = db.Column(db.String(255), unique=True, nullable=False)  # es. 'evento:12:1500', 'membership:2000'
+    importo = db.Column(db.Integer, nullable=False)  # Centesimi
+    product_id = db.Column(db.String(255), nullable=False)
+    price_id = db.Column(db.String(255), nullable=False)
+    data_creazione = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<PrezzoStripe {self.chiave} {self.price_id}>'
+
+
+class CheckoutStripe(db.Model):
+    """Sessione checkout aperta: finché non scade, un nuovo click rimanda alla stessa"""
+    __tablename__ = 'stripe_checkout'
+
+    id = db.Column(db.Integer, primary_key=True)
+    chiave = db.Column(db.String(255), unique=True, nullable=False)  # Acquirente + cosa compra
+    importo = db.Column(db.Integer, nullable=False)
+    session_id = db.Column(db.String(255), nullable=False, index=True)
+    url = db.Column(db.Text, nullable=False)
+    scadenza = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return f'<CheckoutStripe {self.chiave} {self.session_id} scade:{self.scadenza}>'
@@ -0,0 +1,27 @@
+# models/stripe_evento.py
+from models import db
+from datetime import datetime
+
+class EventoStripe(db.Model):
+    """Evento webhook Stripe: salvato così com'è alla ricezione, elaborato dal worker in ordine di arrivo"""
+    __tablename__ = 'stripe_eventi'
+    __table_args__ = (
+        db.Index('ix_stripe_eventi_stato_prossimo', 'stato', 'prossimo_tentativo'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)  # Ordine di arrivo
+    stripe_id = db.Column(db.String(255), unique=True, nullable=False)  # evt_...: deduplica i retry di Stripe
+    tipo = db.Column(db.String(100), nullable=False)
+    payload = db.Column(db.Text(length=16777215), nullable=False)  # MEDIUMTEXT su MariaDB
+
+    # in_coda -> elaborato | (in_coda con backoff) | fallito
+    stato = db.Column(db.Enum('in_coda', 'elaborato', 'fallito'), nullable=False, default='in_coda')
+    tentativi = db.Column(db.Integer, nullable=False, default=0)
+    prossimo_tentativo = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    esito = db.Column(db.Text)  # Ultimo errore o nota di elaborazione
+
+    data_ricezione = db.Column(db.DateTime, default=datetime.utcnow)
+    data_elaborazione = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f'<EventoStripe {self.stripe_id} {self.tipo} - {self.stato}>'
@@ -1,11 +1,21 @@
 # models/user.py
-from models import db, bcrypt
+from models import db
 from flask_login import UserMixin
 from datetime import datetime
 
 
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
+    __table_args__ = (
+        # Classifica per ruolo tra gli attivi e top EXP di admin/statistiche
+        db.Index('ix_users_attivo_ruolo_tabl_exp', 'attivo', 'ruolo', 'tabl_exp'),
+        db.Index('ix_users_tabl_exp', 'tabl_exp'),
+        # Ultimi iscritti e gestione utenti (filtro ruolo) ordinati per registrazione
+        db.Index('ix_users_data_registrazione', 'data_registrazione'),
+        db.Index('ix_users_ruolo_data_registrazione', 'ruolo', 'data_registrazione'),
+        # Job notturno membership: scadute e avvisi "scade tra N giorni"
+        db.Index('ix_users_ha_pagato_data_scadenza', 'ha_pagato', 'data_scadenza'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     nickname = db.Column(db.String(50), unique=True, nullable=False)
@@ -34,58 +44,51 @@ class User(UserMixin, db.Model):
     data_registrazione = db.Column(db.DateTime, default=datetime.utcnow)
     attivo = db.Column(db.Boolean, default=True)
     is_admin = db.Column(db.Boolean, default=False)
+    # Incrementata a ogni scrittura (utils/cache_utenti.py): invalida l'utente in cache
+    versione = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     
     # Relazioni
     partecipazioni = db.relationship('Partecipazione', backref='utente', 
                                     lazy=True, cascade='all, delete-orphan')
     
-    def puo_iscriversi_eventi(self):
-        """Verifica se l'utente può iscriversi agli eventi (membership valida)"""
+    def puo_iscriversi_eventi(self, adesso=None):
+        """
+        Verifica se l'utente può iscriversi agli eventi (membership valida). Solo lettura:
+        ha_pagato lo spegne il job notturno 'membership_scadute' (utils/membership.py).
+        """
         # Founder e admin sempre accesso
-        if self.ruolo in ['founder'] or self.is_admin:
+        if self.ruolo == 'founder' or self.is_admin:
             return True
         
         if not self.ha_pagato:
             return False
         
-        # Controlla scadenza
-        if self.data_scadenza and self.data_scadenza < datetime.utcnow():
-            self.ha_pagato = False
-            db.session.commit()
-            return False
-        
-        return True
+        # Scaduta ma non ancora passata dal job notturno
+        return self.data_scadenza is None or self.data_scadenza >= (adesso or datetime.utcnow())
     
     def set_password(self, password):
-        self.password_hash = bcrypt.generate_password_hash(password).decode('utf-8')
+        from utils.password import password_service
+        self.password_hash = password_service.hash(password)
     
     def check_password(self, password):
-        return bcrypt.check_password_hash(self.password_hash, password)
+        from utils.password import password_service
+        return password_service.verifica(self.password_hash, password)
     
-    def aggiungi_exp(self, exp_amount):
-        self.tabl_exp += exp_amount
-        self.aggiorna_livello()
+    def aggiungi_exp(self, exp_amount, causale='admin', evento_id=None):
+        from utils.exp import assegna_exp
+        assegna_exp(self.id, exp_amount, causale, evento_id)
     
     def aggiorna_livello(self):
-        from config import Config
-        nuovo_livello = Config.calcola_livello(self.tabl_exp)
+        from utils.livelli import tabella_livelli
+        nuovo_livello = tabella_livelli.livello(self.tabl_exp)
         if nuovo_livello != self.livello:
             self.livello = nuovo_livello
             return True
         return False
     
     def get_progresso_livello(self):
-        exp = self.tabl_exp
-        if exp < 500:
-            return (exp / 500) * 100
-        elif exp < 1500:
-            return ((exp - 500) / 1000) * 100
-        elif exp < 3500:
-            return ((exp - 1500) / 2000) * 100
-        elif exp < 7500:
-            return ((exp - 3500) / 4000) * 100
-        else:
-            return 100
+        from utils.livelli import tabella_livelli
+        return tabella_livelli.progresso(self.tabl_exp)
     
     def __repr__(self):
         return f'<User {self.nickname} - {self.ruolo}>'
@@ -0,0 +1,74 @@
+# replay_webhook.py - Rimette in coda eventi webhook Stripe già ricevuti
+#
+# Uso: python replay_webhook.py evt_123 evt_456       (eventi specifici)
+#      python replay_webhook.py --falliti              (tutti quelli in 'fallito')
+#      python replay_webhook.py --dal 2026-10-01 --tipo checkout.session.expired --forza
+#      python replay_webhook.py --falliti --subito     (elabora qui invece di aspettare il worker)
+import argparse
+import sys
+from datetime import datetime
+
+from sqlalchemy import update
+
+from app import create_app
+from models import db
+from models.stripe_evento import EventoStripe
+from utils.scheduler import prendi_lease, rilascia_lease
+from utils.webhook_stripe import elabora_coda, NOME_LEASE
+
+parser = argparse.ArgumentParser()
+parser.add_argument('stripe_id', nargs='*', help='id evento Stripe (evt_...)')
+parser.add_argument('--falliti', action='store_true', help='tutti gli eventi in stato fallito')
+parser.add_argument('--dal', help='solo eventi ricevuti da questa data (YYYY-MM-DD)')
+parser.add_argument('--tipo', help='solo eventi di questo tipo')
+parser.add_argument('--forza', action='store_true', help='rilancia anche eventi già elaborati')
+parser.add_argument('--subito', action='store_true', help='elabora la coda in questo processo')
+args = parser.parse_args()
+
+if not (args.stripe_id or args.falliti or args.dal):
+    parser.error('indica almeno un id evento, --falliti o --dal')
+
+app = create_app(avvia_scheduler=False)
+
+with app.app_context():
+    condizioni = []
+    if args.stripe_id:
+        condizioni.append(EventoStripe.stripe_id.in_(args.stripe_id))
+    if args.falliti:
+        condizioni.append(EventoStripe.stato == 'fallito')
+    if args.dal:
+        condizioni.append(EventoStripe.data_ricezione >= datetime.strptime(args.dal, '%Y-%m-%d'))
+    if args.tipo:
+        condizioni.append(EventoStripe.tipo == args.tipo)
+    if not args.forza:
+        condizioni.append(EventoStripe.stato != 'elaborato')
+
+    # L'id (ordine di arrivo) non cambia: il worker li rielabora nell'ordine originale
+    rimessi = db.session.execute(
+        update(EventoStripe)
+        .where(*condizioni)
+        .values(stato='in_coda', tentativi=0, prossimo_tentativo=datetime.utcnow())
+    ).rowcount
+    db.session.commit()
+    print(f"🔁 {rimessi} eventi rimessi in coda")
+
+    # Un solo consumatore alla volta: se il worker dell'app è attivo ci pensa lui
+    if args.subito and not prendi_lease(NOME_LEASE, app.config['STRIPE_WEBHOOK_LEASE_SECONDI']):
+        print("ℹ️ Worker webhook attivo in un altro processo: gli eventi verranno elaborati da lì")
+    elif args.subito:
+        totale = 0
+        while True:
+            # Lease rinnovato prima di ogni evento: se lo perdiamo il lotto si ferma
+            lavorati = elabora_coda(max_tentativi=app.config['STRIPE_WEBHOOK_MAX_TENTATIVI'],
+                                    backoff=app.config['STRIPE_WEBHOOK_BACKOFF_SECONDI'],
+                                    continua=lambda: prendi_lease(NOME_LEASE, app.config['STRIPE_WEBHOOK_LEASE_SECONDI']))
+            if not lavorati:
+                break
+            totale += lavorati
+        rilascia_lease(NOME_LEASE)
+        falliti = EventoStripe.query.filter_by(stato='fallito').count()
+        print(f"✅ Elaborati {totale} eventi ({falliti} in stato fallito)")
+
+if args.stripe_id and rimessi < len(args.stripe_id):
+    print("⚠️ Alcuni id non trovati (o già elaborati: usa --forza)")
+    sys.exit(1)
@@ -2,7 +2,7 @@ from app import create_app
 from models import db
 from models.user import User
 
-app = create_app()
+app = create_app(avvia_scheduler=False)
 with app.app_context():
     # Reset password Giuseppe
     giuseppe = User.query.filter_by(email='giuseppe@tablehero.it').first()
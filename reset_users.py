@@ -4,8 +4,10 @@ from models import db
 from models.user import User
 from models.partecipazione import Partecipazione
 from models.evento import Evento
+from models.exp_ledger import MovimentoExp
+from models.exp_mensile import ExpMensile
 
-app = create_app()
+app = create_app(avvia_scheduler=False)
 
 with app.app_context():
     print("Inizio reset utenti...")
@@ -20,7 +22,9 @@ with app.app_context():
     Evento.query.delete()
     print(f"Eliminati {eventi_count} eventi")
 
-    # 3. Elimina tutti gli utenti
+    # 3. Elimina registro EXP, classifiche per periodo e utenti
+    MovimentoExp.query.delete()
+    ExpMensile.query.delete()
     users_count = User.query.count()
     User.query.delete()
     print(f"Eliminati {users_count} utenti")
@@ -68,6 +72,8 @@ with app.app_context():
         )
         founder.set_password(founder_data['password'])
         db.session.add(founder)
+        db.session.flush()
+        db.session.add(MovimentoExp(user_id=founder.id, delta=founder.tabl_exp, causale='apertura'))
         print(f"Creato Founder: {founder.nome} {founder.cognome} ({founder.email})")
 
     db.session.commit()
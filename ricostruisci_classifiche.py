@@ -0,0 +1,28 @@
+# ricostruisci_classifiche.py - Ricalcola il rollup exp_mensile dalle partecipazioni storiche
+#
+# Uso: python ricostruisci_classifiche.py               (blocchi da 1000 utenti)
+#      python ricostruisci_classifiche.py --lotto 200
+# Da lanciare dopo la migrazione che crea exp_mensile, o se il rollup è da rifare: le classifiche
+# restano online, ogni blocco sovrascrive i suoi utenti senza svuotare la tabella.
+import argparse
+import time
+
+from app import create_app
+from models import db
+from models.exp_mensile import ExpMensile
+from utils.classifiche import ricostruisci
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--lotto', type=int, default=1000, help='utenti (per id) ricalcolati a ogni blocco')
+args = parser.parse_args()
+
+app = create_app(avvia_scheduler=False)
+
+with app.app_context():
+    inizio = time.perf_counter()
+    print("🔄 Ricostruzione classifiche per periodo...")
+    for letti, ultimo in ricostruisci(lotto=args.lotto):
+        print(f"   utenti fino a {letti}/{ultimo}")
+
+    righe = db.session.query(ExpMensile).count()
+    print(f"✅ {righe} righe utente/mese in {time.perf_counter() - inizio:.1f}s")
@@ -0,0 +1,62 @@
+# rilivella.py - Soglie dei livelli TablExp e ricalcolo del livello di tutti gli utenti
+#
+# Uso: python rilivella.py --mostra                            (soglie in uso)
+#      python rilivella.py                                     (ricalcola con le soglie in uso)
+#      python rilivella.py --soglie bronzo=0 argento=600 oro=1800 platino=4000 diamante=8000
+#      python rilivella.py --default                           (torna alle soglie di Config.LIVELLI)
+#      python rilivella.py --soglie argento=600 ... --prova    (conta gli spostamenti senza scrivere)
+# Con NumPy installato il ricalcolo è vettoriale (pip install numpy), altrimenti usa bisect.
+import argparse
+import time
+
+from app import create_app
+from models import db
+from utils.livelli import tabella_livelli, normalizza_soglie, rilivella_tutti
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--soglie', nargs='+', metavar='NOME=EXP', help='nuove soglie (EXP minima per livello)')
+parser.add_argument('--default', action='store_true', help='svuota la tabella livelli: valgono quelle di Config')
+parser.add_argument('--mostra', action='store_true', help='stampa le soglie in uso ed esce')
+parser.add_argument('--prova', action='store_true', help='non salva nulla, conta solo gli utenti da spostare')
+parser.add_argument('--lotto', type=int, default=5000, help='id per ogni UPDATE')
+args = parser.parse_args()
+
+if args.soglie and args.default:
+    parser.error('--soglie e --default sono alternativi')
+if args.mostra and (args.soglie or args.default):
+    parser.error('--mostra non modifica le soglie')
+
+coppie = None
+if args.soglie:
+    try:
+        coppie = [(nome, int(valore)) for nome, valore in (s.split('=', 1) for s in args.soglie)]
+        normalizza_soglie(coppie)
+    except ValueError as e:
+        parser.error(f'soglie non valide: {e}')
+
+app = create_app(avvia_scheduler=False)
+
+with app.app_context():
+    if coppie or args.default:
+        tabella_livelli.salva(coppie)
+
+    soglie, nomi = tabella_livelli.tabella()
+    print('📋 Soglie: ' + ', '.join(f'{nome} da {soglia}' for nome, soglia in zip(nomi, soglie)))
+    if args.mostra:
+        raise SystemExit
+
+    inizio = time.perf_counter()
+    spostati = rilivella_tutti(lotto=args.lotto, prova=args.prova)
+    durata = time.perf_counter() - inizio
+
+    if args.prova:
+        db.session.rollback()
+        tabella_livelli.invalida()
+    else:
+        db.session.commit()
+
+    for nome in nomi:
+        if spostati[nome]:
+            print(f"  ➡️  {spostati[nome]} utenti diventano {nome}")
+    stato = '(prova, nulla salvato)' if args.prova else 'salvato'
+    print(f"✅ {sum(spostati.values())} utenti da rilivellare in {durata:.2f}s {stato}")
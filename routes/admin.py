@@ -1,18 +1,32 @@
 # routes/admin.py
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
+from flask import (Blueprint, render_template, request, redirect, url_for, flash, jsonify, current_app,
+                   Response, abort, stream_with_context)
 from flask_login import login_required, current_user
-from flask_mail import Message, Mail
 from functools import wraps
+from sqlalchemy.orm import joinedload, selectinload
 from models import db
 from models.user import User
 from models.evento import Evento
 from models.partecipazione import Partecipazione
+from utils.stats import stats_service
+from utils.partecipazioni import (annulla_partecipazione, rimuovi_partecipazioni_utente,
+                                  rimuovi_partecipazioni_evento)
+from utils.prenotazioni import rilascia_prenotazioni_utente
+from utils.exp import assegna_exp
+from utils.lista_attesa import promuovi_lista_attesa
+from utils.reminder import accoda_reminder
+from utils.outbox import stato_job
+from utils.paginazione import pagina_eventi
+from utils.metriche_sql import metriche_sql
+from utils.password import password_service, ServizioOccupato
+from utils.esportazioni import ESPORTAZIONI, FORMATI, filtri_utenti, filtri_eventi, genera
+from models.lista_attesa import ListaAttesa
+from models.prenotazione import PrenotazionePosto
 from datetime import datetime, timedelta
-
-# Inizializza mail per admin
-mail = Mail()
+import logging
 
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
+log = logging.getLogger('tablhero.admin')
 
 # Decorator per proteggere le route admin
 def admin_required(f):
@@ -30,18 +44,20 @@ def admin_required(f):
 def panel():
     """Pannello amministratore principale"""
     
-    # Statistiche generali
-    total_users = User.query.count()
-    total_eventi = Evento.query.count()
-    total_partecipazioni = Partecipazione.query.count()
+    # Statistiche generali (dalla cache statistiche)
+    stats = stats_service.get()
+    total_users = stats['utenti']['totale']
+    total_eventi = stats['eventi']['totale']
+    total_partecipazioni = stats['partecipazioni']['totale']
     
     # Utenti per ruolo
-    sidekick_count = User.query.filter_by(ruolo='sidekick').count()
-    tablhero_count = User.query.filter_by(ruolo='tablhero').count()
-    veteran_count = User.query.filter_by(ruolo='veteran').count()
-    master_count = User.query.filter_by(ruolo='master').count()
-    architect_count = User.query.filter_by(ruolo='architect').count()
-    coordinator_count = User.query.filter_by(ruolo='coordinator').count()
+    per_ruolo = stats['utenti']['per_ruolo']
+    sidekick_count = per_ruolo.get('sidekick', 0)
+    tablhero_count = per_ruolo.get('tablhero', 0)
+    veteran_count = per_ruolo.get('veteran', 0)
+    master_count = per_ruolo.get('master', 0)
+    architect_count = per_ruolo.get('architect', 0)
+    coordinator_count = per_ruolo.get('coordinator', 0)
     
     # Ultimi utenti registrati
     ultimi_utenti = User.query.order_by(User.data_registrazione.desc()).limit(10).all()
@@ -75,20 +91,8 @@ def gestione_utenti():
     search = request.args.get('search', '')
     ruolo_filter = request.args.get('ruolo', '')
     
-    query = User.query
-    
-    # Filtro ricerca
-    if search:
-        query = query.filter(
-            (User.nickname.contains(search)) |
-            (User.email.contains(search)) |
-            (User.nome.contains(search)) |
-            (User.cognome.contains(search))
-        )
-    
-    # Filtro ruolo
-    if ruolo_filter:
-        query = query.filter_by(ruolo=ruolo_filter)
+    # Filtri ricerca e ruolo (gli stessi dell'export)
+    query = User.query.filter(*filtri_utenti(search, ruolo_filter))
     
     # Paginazione
     utenti = query.order_by(User.data_registrazione.desc()).paginate(
@@ -112,6 +116,15 @@ def edit_utente(user_id):
         return redirect(url_for('admin.gestione_utenti'))
     
     if request.method == 'POST':
+        # Prima la hash (può rifiutare con il pool bcrypt pieno), poi le modifiche: niente a metà
+        new_password = request.form.get('new_password')
+        try:
+            nuova_hash = password_service.hash(new_password) if new_password else None
+        except ServizioOccupato:
+            flash('Troppe operazioni password in corso: nessuna modifica salvata, riprova tra qualche secondo.',
+                  'warning')
+            return render_template('admin/edit_utente.html', user=user), 503
+
         old_ruolo = user.ruolo
         user.nickname = request.form.get('nickname', user.nickname)
         user.nome = request.form.get('nome', user.nome)
@@ -119,7 +132,7 @@ def edit_utente(user_id):
         user.email = request.form.get('email', user.email)
         new_ruolo = request.form.get('ruolo', user.ruolo)
         user.ruolo = new_ruolo
-        user.tabl_exp = int(request.form.get('tabl_exp', user.tabl_exp))
+        nuova_exp = int(request.form.get('tabl_exp', user.tabl_exp))
         user.attivo = request.form.get('attivo') == 'on'
 
         # Auto-grant membership for paid roles
@@ -129,15 +142,15 @@ def edit_utente(user_id):
             user.data_scadenza = datetime.utcnow() + timedelta(days=365)  # 1 year membership
             user.payment_status = 'completed'
 
-        # Aggiorna livello in base alla nuova exp
-        user.aggiorna_livello()
+        # La differenza va nel registro EXP come incremento atomico (livello ricalcolato in SQL):
+        # un'iscrizione arrivata nel frattempo non viene sovrascritta
+        if nuova_exp != user.tabl_exp:
+            assegna_exp(user.id, nuova_exp - user.tabl_exp, 'admin')
 
         # Cambia password se fornita
-        new_password = request.form.get('new_password')
-        if new_password:
-            print(f"Changing password for user {user.nickname}")
-            user.set_password(new_password)
-            print(f"Password changed successfully")
+        if nuova_hash:
+            user.password_hash = nuova_hash
+            log.info('Password cambiata da un admin', extra={'user_id': user.id, 'admin_id': current_user.id})
 
         try:
             db.session.commit()
@@ -168,6 +181,9 @@ def delete_utente(user_id):
     
     try:
         nickname = user.nickname
+        rimuovi_partecipazioni_utente(user.id)
+        rilascia_prenotazioni_utente(user.id)
+        ListaAttesa.query.filter_by(user_id=user.id).delete()
         db.session.delete(user)
         db.session.commit()
         flash(f'Utente {nickname} eliminato con successo.', 'success')
@@ -200,18 +216,13 @@ def toggle_admin(user_id):
 @login_required
 @admin_required
 def gestione_eventi():
-    """Pagina gestione eventi"""
-    page = request.args.get('page', 1, type=int)
+    """Pagina gestione eventi (keyset su data_evento, id: niente OFFSET né COUNT)"""
     tipo_filter = request.args.get('tipo', '')
     
-    query = Evento.query
+    query = Evento.query.filter(*filtri_eventi(tipo_filter))
     
-    if tipo_filter:
-        query = query.filter_by(tipo=tipo_filter)
-    
-    eventi = query.order_by(Evento.data_evento.desc()).paginate(
-        page=page, per_page=20, error_out=False
-    )
+    eventi = pagina_eventi(query, per_pagina=20,
+                           dopo=request.args.get('dopo'), prima=request.args.get('prima'))
     
     return render_template('admin/eventi.html',
                          eventi=eventi,
@@ -271,7 +282,9 @@ def nuovo_evento():
 @admin_required
 def edit_evento(evento_id):
     """Modifica evento"""
-    evento = Evento.query.get_or_404(evento_id)
+    evento = (Evento.query
+              .options(selectinload(Evento.partecipazioni).joinedload(Partecipazione.user))
+              .get_or_404(evento_id))
     
     if request.method == 'POST':
         evento.titolo = request.form.get('titolo', evento.titolo)
@@ -316,6 +329,11 @@ def delete_evento(evento_id):
     
     try:
         titolo = evento.titolo
+        PrenotazionePosto.query.filter_by(evento_id=evento_id).delete()
+        ListaAttesa.query.filter_by(evento_id=evento_id).delete()
+        # Toglie l'EXP ai partecipanti e cancella le partecipazioni con pochi statement,
+        # così il cascade ORM sull'evento non ha più righe da caricare
+        rimuovi_partecipazioni_evento(evento_id)
         db.session.delete(evento)
         db.session.commit()
         flash(f'Evento "{titolo}" eliminato con successo.', 'success')
@@ -331,7 +349,10 @@ def delete_evento(evento_id):
 def partecipanti_evento(evento_id):
     """Visualizza partecipanti di un evento"""
     evento = Evento.query.get_or_404(evento_id)
-    partecipazioni = Partecipazione.query.filter_by(evento_id=evento_id).all()
+    partecipazioni = (Partecipazione.query
+                      .options(joinedload(Partecipazione.user))
+                      .filter_by(evento_id=evento_id)
+                      .all())
 
     return render_template('admin/partecipanti_evento.html',
                          evento=evento,
@@ -346,12 +367,12 @@ def rimuovi_partecipante(evento_id, user_id):
         evento_id=evento_id, user_id=user_id
     ).first_or_404()
 
-    # Rimuovi TablExp guadagnati dall'evento
-    partecipazione.user.tabl_exp = max(0, partecipazione.user.tabl_exp - partecipazione.exp_guadagnata)
-    partecipazione.user.aggiorna_livello()
+    # Rimuovi TablExp guadagnati dall'evento + partecipazione
+    evento = partecipazione.evento
+    annulla_partecipazione(partecipazione, causale='rimozione')
 
-    # Rimuovi partecipazione
-    db.session.delete(partecipazione)
+    # Il posto liberato va al primo della lista d'attesa
+    promuovi_lista_attesa(evento, 1)
     db.session.commit()
 
     flash(f'Partecipante {partecipazione.user.nickname} rimosso dall\'evento.', 'success')
@@ -363,18 +384,12 @@ def rimuovi_partecipante(evento_id, user_id):
 def rimuovi_tutti_partecipanti(evento_id):
     """Rimuovi tutti i partecipanti da un evento"""
     evento = Evento.query.get_or_404(evento_id)
-    partecipazioni = Partecipazione.query.filter_by(evento_id=evento_id).all()
-
-    removed_count = 0
-    for partecipazione in partecipazioni:
-        # Rimuovi TablExp guadagnati dall'evento
-        partecipazione.user.tabl_exp = max(0, partecipazione.user.tabl_exp - partecipazione.exp_guadagnata)
-        partecipazione.user.aggiorna_livello()
 
-        # Rimuovi partecipazione
-        db.session.delete(partecipazione)
-        removed_count += 1
+    # EXP, livelli, contatore e righe aggiornati in SQL senza caricare i partecipanti
+    removed_count = rimuovi_partecipazioni_evento(evento_id)
 
+    # I posti liberati vanno ai primi della lista d'attesa
+    promuovi_lista_attesa(evento, removed_count)
     db.session.commit()
 
     flash(f'Tutti i partecipanti ({removed_count}) sono stati rimossi dall\'evento.', 'success')
@@ -387,9 +402,7 @@ def statistiche():
     """Pagina statistiche dettagliate"""
     
     # Statistiche utenti per livello
-    stats_livelli = {}
-    for livello in ['bronzo', 'argento', 'oro', 'platino', 'diamante']:
-        stats_livelli[livello] = User.query.filter_by(livello=livello).count()
+    stats_livelli = dict(stats_service.get()['utenti']['per_livello'])
     
     # Top 10 utenti per exp
     top_users = User.query.order_by(User.tabl_exp.desc()).limit(10).all()
@@ -407,30 +420,64 @@ def statistiche():
                          top_users=top_users,
                          eventi_popolari=eventi_popolari)
 
-@admin_bp.route('/invia_reminder/<int:evento_id>')
+@admin_bp.route('/invia_reminder/<int:evento_id>', methods=['GET', 'POST'])
 @login_required
 @admin_required
 def invia_reminder(evento_id):
-    """Invia reminder email a tutti i partecipanti dell'evento"""
+    """Accoda i reminder per tutti i partecipanti: l'invio prosegue in background"""
     evento = Evento.query.get_or_404(evento_id)
 
-    # Conta quanti reminder sono stati inviati
-    sent_count = 0
+    job_id, totale = accoda_reminder(Evento.id == evento.id)
+    db.session.commit()
 
-    for partecipazione in evento.partecipazioni:
-        try:
-            msg = Message(
-                subject=f'Reminder: {evento.titolo} domani! - TableHero',
-                recipients=[partecipazione.user.email],
-                html=f'<h2>Reminder Evento</h2><p>Ciao {partecipazione.user.nome},<br><strong>{evento.titolo}</strong> è domani {evento.data_evento.strftime("%d/%m/%Y alle %H:%M")}!</p><a href="[link]">Dettagli</a>'
-            )
-            mail.send(msg)
-            sent_count += 1
-        except Exception as e:
-            print(f"Errore invio email a {partecipazione.user.email}: {e}")
+    flash(f'Reminder in invio a {totale} partecipanti.', 'success')
+    return redirect(url_for('admin.edit_evento', evento_id=evento_id, reminder_job=job_id))
 
-    flash(f'Reminder inviati a {sent_count} partecipanti!', 'success')
-    return redirect(url_for('admin.gestione_eventi'))
+@admin_bp.route('/reminder/<job_id>/stato')
+@login_required
+@admin_required
+def stato_reminder(job_id):
+    """Avanzamento di un invio reminder (interrogato dalla pagina evento)"""
+    return jsonify(stato_job(job_id))
+
+@admin_bp.route('/metriche-sql')
+@login_required
+@admin_required
+def metriche_sql_pagina():
+    """Query SQL per endpoint: quante, quanto tempo sul DB, quali pagine fanno N+1"""
+    return render_template('admin/metriche_sql.html',
+                         righe=metriche_sql.riepilogo(),
+                         soglia=current_app.config['METRICHE_SQL_SOGLIA_N_PIU_1'])
+
+@admin_bp.route('/metriche-sql/azzera', methods=['POST'])
+@login_required
+@admin_required
+def azzera_metriche_sql():
+    metriche_sql.azzera()
+    flash('Metriche SQL azzerate.', 'success')
+    return redirect(url_for('admin.metriche_sql_pagina'))
+
+@admin_bp.route('/esporta/<nome>.<formato>')
+@login_required
+@admin_required
+def esporta(nome, formato):
+    """
+    Export completo in streaming, con gli stessi filtri della pagina admin (?search=&ruolo=,
+    ?tipo=, ?evento_id=): il primo lotto parte subito e la memoria resta quella di un lotto.
+    """
+    if nome not in ESPORTAZIONI or formato not in FORMATI:
+        abort(404)
+    query, parametri = ESPORTAZIONI[nome]
+    stmt = query(**{p: request.args.get(p, '' if tipo is str else None, type=tipo) for p, tipo in parametri.items()})
+    log.info('Export', extra={'esportazione': nome, 'formato': formato, 'user_id': current_user.id})
+    return Response(
+        stream_with_context(genera(stmt, formato, current_app.config['ESPORTAZIONE_LOTTO'])),
+        content_type=f'{FORMATI[formato]}; charset=utf-8',
+        headers={
+            'Content-Disposition': f'attachment; filename={nome}-{datetime.utcnow():%Y%m%d-%H%M}.{formato}',
+            'X-Accel-Buffering': 'no',  # nginx: inoltra i lotti man mano invece di accumularli
+        },
+    )
 
 @admin_bp.route('/stats')
 @login_required
@@ -440,26 +487,23 @@ def stats():
     from datetime import datetime, timedelta
     from collections import Counter
 
-    # Metriche base
-    total_users = User.query.filter_by(attivo=True).count()
-    utenti_verificati = User.query.filter_by(attivo=True, email_verificata=True).count()
+    # Metriche base (dalla cache statistiche)
+    stats = stats_service.get()
+    total_users = stats['utenti']['attivi']
+    utenti_verificati = stats['utenti']['attivi_verificati']
     utenti_non_verificati = total_users - utenti_verificati
 
     # Conteggio per ruolo (solo attivi), escludi game_architect
-    ruoli_stats = db.session.query(
-        User.ruolo,
-        db.func.count(User.id)
-    ).filter(User.attivo==True, User.ruolo != 'game_architect').group_by(User.ruolo).all()
-
-    ruolo_counts = dict(ruoli_stats)
+    ruolo_counts = {ruolo: n for ruolo, n in stats['utenti']['per_ruolo_attivi'].items()
+                    if ruolo != 'game_architect'}
 
     # Eventi
-    eventi_totali = Evento.query.count()
-    eventi_prossimi = Evento.query.filter(Evento.data_evento > datetime.utcnow()).count()
-    eventi_passati = eventi_totali - eventi_prossimi
+    eventi_totali = stats['eventi']['totale']
+    eventi_prossimi = stats['eventi']['prossimi']
+    eventi_passati = stats['eventi']['passati']
 
     # Partecipazioni totali
-    partecipazioni_totali = Partecipazione.query.count()
+    partecipazioni_totali = stats['partecipazioni']['totale']
 
     # Leaderboard top 5
     top_users = User.query.filter_by(attivo=True)\
@@ -467,11 +511,7 @@ def stats():
         .limit(5).all()
 
     # Trends ultimi 30 giorni (semplificato)
-    da_30gg = datetime.utcnow() - timedelta(days=30)
-    nuovi_utenti_30gg = User.query.filter(
-        User.data_registrazione >= da_30gg,
-        User.attivo == True
-    ).count()
+    nuovi_utenti_30gg = stats['utenti']['nuovi_30gg_attivi']
 
     return render_template('admin/stats.html',
         total_users=total_users,
@@ -1,16 +1,19 @@
 # routes/auth.py
 from flask import Blueprint, render_template, request, redirect, url_for, flash, session, current_app
 from flask_login import login_user, logout_user, login_required, current_user
-from flask_mail import Mail
 from models import db
 from models.user import User
 from config import Config
 from utils.validators import PasswordValidator, EmailValidator, NicknameValidator, NameValidator
 from utils.email import genera_token_verifica, send_email_verifica
+from utils.stripe_gateway import prezzo, crea_checkout
+from utils.password import password_service, ServizioOccupato
+from utils.limiti import limita
 from datetime import datetime, timedelta
-import stripe
+import logging
 
 auth_bp = Blueprint('auth', __name__)
+log = logging.getLogger('tablhero.auth')
 
 
 @auth_bp.route('/register', methods=['GET', 'POST'])
@@ -89,7 +92,6 @@ def register():
             email_verificata=False,
             ruolo=ruolo
         )
-        new_user.set_password(password)
 
         # Se il ruolo richiede pagamento
         if ruolo in ['tablhero']:
@@ -108,18 +110,19 @@ def register():
             return redirect(url_for('auth.checkout'))
         else:
             # Sidekick è gratis
+            try:
+                new_user.set_password(password)
+            except ServizioOccupato:
+                log.warning('Registrazione rifiutata: troppe operazioni password in corso')
+                flash('Troppe registrazioni in corso, riprova tra qualche secondo.', 'warning')
+                return render_template('register.html'), 503
             new_user.payment_status = 'completed'
             db.session.add(new_user)
-            db.session.commit()
 
-            # Invia email verifica
-            mail = Mail(current_app)
-            try:
-                send_email_verifica(mail, email, nome, token)
-                flash('✅ Registrazione completata! Controlla la tua email per verificare l\'account.', 'success')
-            except Exception as e:
-                print(f"Errore invio email verifica: {e}")
-                flash('⚠️ Account creato, ma email non inviata. Contatta l\'admin.', 'warning')
+            # Email verifica in outbox: parte solo se l'utente viene salvato
+            send_email_verifica(email, nome, token)
+            db.session.commit()
+            flash('✅ Registrazione completata! Controlla la tua email per verificare l\'account.', 'success')
 
             return redirect(url_for('auth.login'))
     
@@ -127,6 +130,7 @@ def register():
 
 
 @auth_bp.route('/login', methods=['GET', 'POST'])
+@limita(('login_ip', 'ip'), ('login_nickname', 'nickname'))
 def login():
     if request.method == 'POST':
         nickname = request.form.get('nickname', '').strip()
@@ -147,12 +151,26 @@ def login():
             flash('Nickname ed email non corrispondono!', 'error')
             return redirect(url_for('auth.login'))
 
-        # Debug logging
-        print(f"Login attempt: nickname={nickname}, email={email}, user_found={user is not None}")
-        if user:
-            print(f"User: {user.nickname}, attivo={user.attivo}, password_check={user.check_password(password)}")
+        # Percorso caldo: le INFO di auth sono campionate (LOG_CAMPIONAMENTO), mai email o password nei log
+        log.info('Tentativo di login', extra={'nickname': nickname, 'trovato': user is not None})
+
+        # Una sola verifica bcrypt, sul pool limitato: se è pieno si risponde subito
+        try:
+            password_valida = user is not None and password_service.verifica(user.password_hash, password)
+        except ServizioOccupato:
+            log.warning('Login rifiutato: troppe verifiche password in corso')
+            flash('Troppi accessi in corso, riprova tra qualche secondo.', 'warning')
+            return render_template('login.html'), 503
+
+        if password_valida:
+            # Costo bcrypt cambiato (BCRYPT_LOG_ROUNDS): la hash si rifà ora che la password è nota
+            if password_service.da_aggiornare(user.password_hash):
+                try:
+                    user.password_hash = password_service.hash(password)
+                    db.session.commit()
+                except ServizioOccupato:
+                    pass  # Riproverà al prossimo login
 
-        if user and user.check_password(password):
             if not user.attivo:
                 flash('Account disattivato. Contatta un amministratore.', 'error')
                 return redirect(url_for('auth.login'))
@@ -169,6 +187,7 @@ def login():
             next_page = request.args.get('next')
             return redirect(next_page or url_for('dashboard.index'))
         else:
+            log.warning('Login fallito: credenziali non corrette', extra={'nickname': nickname})
             flash('Credenziali non corrette!', 'error')
 
     return render_template('login.html')
@@ -183,32 +202,24 @@ def checkout_renew():
     amount = 2000  # 20€ in centesimi
 
     try:
-        # Crea sessione di checkout Stripe per rinnovo
-        checkout_session = stripe.checkout.Session.create(
-            payment_method_types=['card'],
-            line_items=[{
-                'price_data': {
-                    'currency': 'eur',
-                    'product_data': {
-                        'name': f'Rinnovo Annuale TableHero - {ruolo.replace("_", " ").title()}',
-                        'description': f'Rinnovo membership annuale',
-                    },
-                    'unit_amount': amount,
-                },
-                'quantity': 1,
-            }],
-            mode='payment',
+        # Sessione di checkout Stripe per rinnovo (riusata se già aperta)
+        session_id, _ = crea_checkout(
+            f'user:{current_user.id}:renew',
+            prezzo(f'rinnovo:{ruolo}:{amount}',
+                   f'Rinnovo Annuale TableHero - {ruolo.replace("_", " ").title()}', amount),
+            amount,
             success_url=url_for('auth.renew_success', _external=True),
             cancel_url=url_for('dashboard.index', _external=True),
-            customer_email=current_user.email,
             metadata={
                 'userid': str(current_user.id),
                 'tipo': 'renew'
-            }
+            },
+            user=current_user
         )
+        db.session.commit()
 
         return render_template('checkout.html',
-                             session_id=checkout_session.id,
+                             session_id=session_id,
                              public_key=Config.STRIPE_PUBLIC_KEY)
 
     except Exception as e:
@@ -229,32 +240,24 @@ def checkout():
     amount = Config.PRICE_TABLHERO if ruolo == 'tablhero' else Config.PRICE_GAME_ARCHITECT
     
     try:
-        # Crea sessione di checkout Stripe
-        checkout_session = stripe.checkout.Session.create(
-            payment_method_types=['card'],
-            line_items=[{
-                'price_data': {
-                    'currency': 'eur',
-                    'product_data': {
-                        'name': f'Abbonamento TableHero - {ruolo.replace("_", " ").title()}',
-                        'description': f'Iscrizione come {ruolo.replace("_", " ").title()}',
-                    },
-                    'unit_amount': amount,
-                },
-                'quantity': 1,
-            }],
-            mode='payment',
+        # Sessione di checkout Stripe (riusata se l'utente ricarica la pagina)
+        session_id, _ = crea_checkout(
+            f'email:{user_data["email"]}:registrazione',
+            prezzo(f'abbonamento:{ruolo}:{amount}',
+                   f'Abbonamento TableHero - {ruolo.replace("_", " ").title()}', amount),
+            amount,
             success_url=url_for('auth.payment_success', _external=True),
             cancel_url=url_for('auth.payment_cancel', _external=True),
-            customer_email=user_data['email'],
             metadata={
                 'userid': 'pending_registration',
                 'tipo': 'registrazione'
-            }
+            },
+            email=user_data['email']
         )
-        
+        db.session.commit()
+
         return render_template('checkout.html', 
-                             session_id=checkout_session.id,
+                             session_id=session_id,
                              public_key=Config.STRIPE_PUBLIC_KEY)
     
     except Exception as e:
@@ -268,7 +271,8 @@ def payment_success():
         flash('Sessione scaduta.', 'error')
         return redirect(url_for('auth.register'))
 
-    user_data = session.pop('pending_user')
+    # Si toglie dalla sessione solo dopo il commit: chi ha già pagato deve poter riprovare
+    user_data = session['pending_user']
 
     # Crea l'utente nel database
     new_user = User(
@@ -281,7 +285,12 @@ def payment_success():
         token_verifica=user_data['token_verifica'],
         email_verificata=False
     )
-    new_user.set_password(user_data['password'])
+    try:
+        new_user.set_password(user_data['password'])
+    except ServizioOccupato:
+        log.warning('Attivazione dopo pagamento rimandata: troppe operazioni password in corso')
+        flash('Pagamento ricevuto, ma il server è occupato: riprova tra qualche secondo.', 'warning')
+        return render_template('riprova.html', url_riprova=url_for('auth.payment_success')), 503
 
     # Se hanno pagato per tablhero, attiva membership
     if user_data['ruolo'] == 'tablhero':
@@ -289,16 +298,12 @@ def payment_success():
         new_user.data_scadenza = datetime.utcnow() + timedelta(days=365)
 
     db.session.add(new_user)
-    db.session.commit()
 
-    # Invia email verifica
-    mail = Mail(current_app)
-    try:
-        send_email_verifica(mail, user_data['email'], user_data['nome'], user_data['token_verifica'])
-        flash('✅ Pagamento completato! Controlla la tua email per verificare l\'account.', 'success')
-    except Exception as e:
-        print(f"Errore invio email verifica: {e}")
-        flash('⚠️ Pagamento completato, ma email non inviata. Contatta l\'admin.', 'warning')
+    # Email verifica in outbox, nella stessa transazione dell'utente
+    send_email_verifica(user_data['email'], user_data['nome'], user_data['token_verifica'])
+    db.session.commit()
+    session.pop('pending_user', None)
+    flash('✅ Pagamento completato! Controlla la tua email per verificare l\'account.', 'success')
 
     return redirect(url_for('auth.login'))
 
@@ -345,6 +350,7 @@ def verifica_email(token):
     return redirect(url_for('auth.login'))
 
 @auth_bp.route('/reinvia-verifica', methods=['POST'])
+@limita(('reinvia_ip', 'ip'), ('reinvia_email', 'email'))
 def reinvia_verifica():
     email = request.form.get('email')
     user = User.query.filter_by(email=email).first()
@@ -360,15 +366,11 @@ def reinvia_verifica():
     # Genera nuovo token
     token = genera_token_verifica()
     user.token_verifica = token
-    db.session.commit()
 
     # Reinvia email
-    mail = Mail(current_app)
-    try:
-        send_email_verifica(mail, user.email, user.nome, token)
-        flash('✅ Email di verifica reinviata! Controlla la tua inbox.', 'success')
-    except Exception as e:
-        flash('Errore invio email. Riprova.', 'error')
+    send_email_verifica(user.email, user.nome, token)
+    db.session.commit()
+    flash('✅ Email di verifica reinviata! Controlla la tua inbox.', 'success')
 
     return redirect(url_for('auth.login'))
 
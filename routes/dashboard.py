@@ -1,10 +1,15 @@
 # routes/dashboard.py
 from flask import Blueprint, render_template, request, redirect, url_for, flash
 from flask_login import login_required, current_user
+from sqlalchemy.orm import joinedload
 from models import db
 from models.evento import Evento
 from models.partecipazione import Partecipazione
-from config import Config
+from utils.partecipazioni import rimuovi_partecipazioni_utente
+from utils.livelli import tabella_livelli
+from utils.prenotazioni import rilascia_prenotazioni_utente
+from utils.stripe_gateway import prezzo, crea_checkout
+from models.lista_attesa import ListaAttesa
 from datetime import datetime, timedelta
 
 dashboard_bp = Blueprint('dashboard', __name__, url_prefix='/dashboard')
@@ -16,11 +21,12 @@ def index():
     
     # Calcola statistiche
     total_eventi = Partecipazione.query.filter_by(user_id=current_user.id).count()
-    progresso = current_user.get_progresso_livello()
-    exp_per_prossimo = Config.exp_per_prossimo_livello(current_user.tabl_exp)
+    progresso = tabella_livelli.progresso(current_user.tabl_exp)
+    exp_per_prossimo = tabella_livelli.exp_per_prossimo(current_user.tabl_exp)
     
     # Eventi recenti
     partecipazioni_recenti = (Partecipazione.query
+                             .options(joinedload(Partecipazione.evento))
                              .filter_by(user_id=current_user.id)
                              .order_by(Partecipazione.data_partecipazione.desc())
                              .limit(5)
@@ -53,6 +59,7 @@ def profilo():
 def miei_eventi():
     """Lista eventi a cui l'utente ha partecipato"""
     partecipazioni = (Partecipazione.query
+                     .options(joinedload(Partecipazione.evento))
                      .filter_by(user_id=current_user.id)
                      .order_by(Partecipazione.data_partecipazione.desc())
                      .all())
@@ -87,7 +94,7 @@ def disiscriviti():
         current_user.ruolo = 'sidekick'
 
     # Rimuovi tutte partecipazioni (solo eventi passati)
-    Partecipazione.query.filter_by(user_id=current_user.id).delete()
+    rimuovi_partecipazioni_utente(current_user.id)
     db.session.commit()
 
     flash('Disiscritto con successo! Puoi riabbonarti dalla Dashboard.', 'success')
@@ -105,8 +112,10 @@ def cancella_account():
         return redirect(url_for('dashboard.index'))
 
     # Delete all user data
-    Partecipazione.query.filter_by(user_id=current_user.id).delete()
-    db.session.delete(current_user)
+    rimuovi_partecipazioni_utente(current_user.id)
+    rilascia_prenotazioni_utente(current_user.id)
+    ListaAttesa.query.filter_by(user_id=current_user.id).delete()
+    db.session.delete(current_user.utente)
     db.session.commit()
 
     flash('Account cancellato con successo.', 'success')
@@ -120,22 +129,15 @@ def renew_membership():
         return redirect(url_for('dashboard.index'))
 
     # ✅ SEMPRE accessibile (nuova O renew)
-    import stripe
-    stripe.api_key = Config.STRIPE_SECRET_KEY
-    session = stripe.checkout.Session.create(
-        payment_method_types=['card'],
-        line_items=[{
-            'price_data': {
-                'currency': 'eur',
-                'product_data': {'name': 'Membership TableHero Annuale'},
-                'unit_amount': 2000,  # 20€
-            },
-            'quantity': 1,
-        }],
-        mode='payment',
+    importo = 2000  # 20€
+    _, url = crea_checkout(
+        f'user:{current_user.id}:membership',
+        prezzo(f'membership:{importo}', 'Membership TableHero Annuale', importo),
+        importo,
         success_url=url_for('dashboard.index', _external=True) + '?renewed=1',
         cancel_url=url_for('dashboard.index', _external=True),
-        customer_email=current_user.email,
-        metadata={'userid': str(current_user.id), 'tipo': 'membership'}
+        metadata={'userid': str(current_user.id), 'tipo': 'membership'},
+        user=current_user
     )
-    return redirect(session.url, code=303)
+    db.session.commit()
+    return redirect(url, code=303)
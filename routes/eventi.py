@@ -1,13 +1,18 @@
 # routes/eventi.py - PREMIUM GRATIS + VET/TABLHERO PAGA
-from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app
+from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app, jsonify
 from flask_login import login_required, current_user
-from flask_mail import Mail
+from sqlalchemy.orm import selectinload
 from models import db
 from models.evento import Evento
 from models.partecipazione import Partecipazione
 from utils.email import send_conferma_iscrizione
-from datetime import datetime
-import stripe
+from utils.partecipazioni import iscrivi_utente, annulla_partecipazione, EventoCompleto, GiaIscritto
+from utils.prenotazioni import crea_prenotazione, rilascia_prenotazione
+from utils.lista_attesa import (entra_in_lista, esci_dalla_lista, posizione_in_lista,
+                                promuovi_lista_attesa, GiaInLista)
+from utils.stripe_gateway import prezzo, crea_checkout
+from utils.paginazione import pagina_eventi
+from datetime import datetime, timedelta
 
 eventi_bp = Blueprint('eventi', __name__, url_prefix='/eventi')
 
@@ -23,8 +28,11 @@ def lista():
     eventi = query.order_by(Evento.data_evento.asc()).all()
     return render_template('eventi.html', eventi=eventi, tipo_filtro=tipo_filtro, now=datetime.utcnow())
 
-@eventi_bp.route('/passati')
-def eventi_passati():
+EVENTI_PASSATI_PER_PAGINA = 12
+
+
+def _pagina_eventi_passati():
+    """Una pagina dell'archivio (?tipo=, ?dopo=cursore) in ordine keyset (data_evento, id)"""
     tipo_filtro = request.args.get('tipo')
     query = Evento.query.filter(
         Evento.data_evento < datetime.utcnow(),
@@ -32,13 +40,42 @@ def eventi_passati():
     )
     if tipo_filtro:
         query = query.filter_by(tipo=tipo_filtro)
-    eventi = query.order_by(Evento.data_evento.desc()).all()
-    return render_template('eventi_passati.html', eventi=eventi, tipo_filtro=tipo_filtro)
+    return tipo_filtro, pagina_eventi(query, EVENTI_PASSATI_PER_PAGINA, dopo=request.args.get('dopo'))
+
+
+@eventi_bp.route('/passati')
+def eventi_passati():
+    # Solo la prima pagina: le successive arrivano da eventi_passati_json durante lo scroll
+    tipo_filtro, pagina = _pagina_eventi_passati()
+    return render_template('eventi_passati.html', eventi=pagina.items, pagina=pagina, tipo_filtro=tipo_filtro)
+
+
+@eventi_bp.route('/passati/json')
+def eventi_passati_json():
+    """Pagina successiva dell'archivio per lo scroll infinito: solo i campi mostrati nelle card"""
+    _, pagina = _pagina_eventi_passati()
+    return jsonify({
+        'eventi': [{
+            'titolo': evento.titolo,
+            'tipo': evento.tipo,
+            'data': evento.data_evento.strftime('%d/%m/%Y alle %H:%M'),
+            'partecipanti': (evento.override_partecipanti if evento.override_partecipanti is not None
+                             else evento.num_partecipanti),
+            'exp_reward': evento.exp_reward,
+            'immagine_url': evento.immagine_url,
+            'url': url_for('eventi.dettaglio', evento_id=evento.id),
+        } for evento in pagina.items],
+        'dopo': pagina.dopo,
+    })
 
 @eventi_bp.route('/<int:evento_id>')
 def dettaglio(evento_id):
-    evento = Evento.query.get_or_404(evento_id)
+    # Evento, partecipanti e loro utenti in due query, non una per badge nel template
+    evento = (Evento.query
+              .options(selectinload(Evento.partecipazioni).joinedload(Partecipazione.user))
+              .get_or_404(evento_id))
     gia_iscritto = False
+    posizione_attesa = None
     user_is_premium = False
     prezzo_finale = 0.0
     sconto_pct = 0
@@ -47,6 +84,8 @@ def dettaglio(evento_id):
         gia_iscritto = Partecipazione.query.filter_by(
             user_id=current_user.id, evento_id=evento_id
         ).first() is not None
+        if not gia_iscritto and evento.is_full():
+            posizione_attesa = posizione_in_lista(current_user.id, evento_id)
         
         # ✅ PREMIUM ROLES: GRATIS SEMPRE
         premium_roles = ['tablhero', 'founder']
@@ -62,6 +101,7 @@ def dettaglio(evento_id):
     return render_template('evento_dettaglio.html',
                           evento=evento,
                           gia_iscritto=gia_iscritto,
+                          posizione_attesa=posizione_attesa,
                           user_is_premium=user_is_premium,
                           prezzo_finale=prezzo_finale,
                           sconto_pct=sconto_pct,
@@ -84,37 +124,24 @@ def iscriviti(evento_id):
         flash('❌ Solo ruoli premium possono partecipare GRATIS!', 'error')
         return redirect(url_for('eventi.dettaglio', evento_id=evento_id))
 
-    # Check già iscritto / pieno
-    if Partecipazione.query.filter_by(user_id=current_user.id, evento_id=evento_id).first():
-        flash('Già iscritto!', 'warning')
-        return redirect(url_for('eventi.dettaglio', evento_id=evento_id))
-
-    if evento.is_full():
-        flash('Evento completo!', 'error')
-        return redirect(url_for('eventi.dettaglio', evento_id=evento_id))
-
-    # ✅ ISCRIZIONE + EXP
-    partecipaz = Partecipazione(
-        user_id=current_user.id,
-        evento_id=evento_id,
-        exp_guadagnata=evento.exp_reward
-    )
-    current_user.aggiungi_exp(evento.exp_reward)
-    db.session.add(partecipaz)
-    db.session.commit()
-
-    # Invia email di conferma
-    mail = Mail(current_app)
+    # ✅ ISCRIZIONE + EXP: prenotazione atomica del posto (niente overselling)
     try:
+        iscrivi_utente(current_user, evento)
+        # Email di conferma in outbox: la invia il worker dopo il commit
         send_conferma_iscrizione(
-            mail,
             current_user.email,
             current_user.nome,
             evento.titolo,
             evento.data_evento.strftime('%d/%m/%Y alle %H:%M')
         )
-    except Exception as e:
-        print(f"Errore invio email conferma: {e}")
+        db.session.commit()
+    except EventoCompleto:
+        db.session.rollback()
+        flash('Evento completo!', 'error')
+        return redirect(url_for('eventi.dettaglio', evento_id=evento_id))
+    except GiaIscritto:
+        flash('Già iscritto!', 'warning')
+        return redirect(url_for('eventi.dettaglio', evento_id=evento_id))
 
     flash(f'✅ Iscritto GRATIS! +{evento.exp_reward} TablExp 🎉', 'success')
     return redirect(url_for('eventi.dettaglio', evento_id=evento_id))
@@ -149,34 +176,47 @@ def paga_evento(evento_id):
     else:
         prezzo_finale = round(prezzo_base, 2)  # No sconto
     
-    stripe.api_key = current_app.config['STRIPE_SECRET_KEY']
-    
+    if Partecipazione.query.filter_by(user_id=current_user.id, evento_id=evento_id).first():
+        flash('Già iscritto!', 'warning')
+        return redirect(url_for('eventi.dettaglio', evento_id=evento_id))
+
+    # 🎟️ Tieni il posto mentre l'utente paga (liberato dallo sweeper se abbandona)
     try:
-        session = stripe.checkout.Session.create(
-            payment_method_types=['card'],
-            line_items=[{
-                'price_data': {
-                    'currency': 'eur',
-                    'product_data': {
-                        'name': f'🎲 {evento.titolo} ({current_user.ruolo.replace("_", " ").title()})',
-                        'description': f'Supporta la community TableHero!'
-                    },
-                    'unit_amount': int(prezzo_finale * 100),
-                },
-                'quantity': 1,
-            }],
-            mode='payment',
+        prenotazione = crea_prenotazione(current_user, evento, current_app.config['PRENOTAZIONE_MINUTI'])
+        db.session.commit()
+    except EventoCompleto:
+        db.session.rollback()
+        flash('Evento completo!', 'error')
+        return redirect(url_for('eventi.dettaglio', evento_id=evento_id))
+
+    # La sessione Stripe chiude qualche minuto prima che scada la prenotazione
+    expires_at = prenotazione.scadenza - timedelta(minutes=2)
+
+    importo = int(round(prezzo_finale * 100))
+
+    try:
+        # Stesso utente + stesso evento + stesso importo: riusa la sessione ancora aperta
+        session_id, url = crea_checkout(
+            f'user:{current_user.id}:evento:{evento_id}',
+            prezzo(f'evento:{evento_id}:{importo}', f'🎲 {evento.titolo}', importo),
+            importo,
             success_url=url_for('eventi.dettaglio', evento_id=evento_id, _external=True) + '?pagato=1',
             cancel_url=url_for('eventi.dettaglio', evento_id=evento_id, _external=True),
-            customer_email=current_user.email,
             metadata={
                 'userid': str(current_user.id),
                 'eventoid': str(evento_id),
                 'tipo': 'evento'
-            }
+            },
+            user=current_user,
+            scadenza=expires_at
         )
-        return redirect(session.url, code=303)
+        prenotazione.stripe_session_id = session_id
+        db.session.commit()
+        return redirect(url, code=303)
     except Exception as e:
+        db.session.rollback()
+        rilascia_prenotazione(prenotazione)
+        db.session.commit()
         flash(f'Errore: {str(e)}', 'error')
         return redirect(url_for('eventi.dettaglio', evento_id=evento_id))
 
@@ -187,11 +227,56 @@ def annulla_iscrizione(evento_id):
         user_id=current_user.id, evento_id=evento_id
     ).first_or_404()
     
-    current_user.tabl_exp = max(0, current_user.tabl_exp - partecipazione.exp_guadagnata)
-    current_user.aggiorna_livello()
-    
-    db.session.delete(partecipazione)
+    evento = partecipazione.evento
+    annulla_partecipazione(partecipazione)
+
+    # Il posto liberato va al primo della lista d'attesa
+    promuovi_lista_attesa(evento, 1)
     db.session.commit()
     
     flash('Iscrizione annullata.', 'info')
     return redirect(url_for('eventi.dettaglio', evento_id=evento_id))
+
+
+@eventi_bp.route('/<int:evento_id>/lista-attesa', methods=['POST'])
+@login_required
+def entra_lista_attesa(evento_id):
+    """⏳ Evento completo: mettiti in coda invece di ricaricare la pagina"""
+    evento = Evento.query.get_or_404(evento_id)
+
+    if evento.data_evento and evento.data_evento <= datetime.utcnow():
+        flash('❌ Non puoi iscriverti a eventi passati!', 'error')
+        return redirect(url_for('eventi.dettaglio', evento_id=evento_id))
+
+    # La promozione è un'iscrizione gratuita: stessi ruoli di iscriviti
+    premium_roles = ['tablhero', 'founder']
+    if current_user.ruolo not in premium_roles:
+        flash('❌ Solo ruoli premium possono entrare in lista d\'attesa!', 'error')
+        return redirect(url_for('eventi.dettaglio', evento_id=evento_id))
+
+    if not evento.is_full():
+        flash('Ci sono ancora posti liberi, iscriviti direttamente!', 'info')
+        return redirect(url_for('eventi.dettaglio', evento_id=evento_id))
+
+    if Partecipazione.query.filter_by(user_id=current_user.id, evento_id=evento_id).first():
+        flash('Già iscritto!', 'warning')
+        return redirect(url_for('eventi.dettaglio', evento_id=evento_id))
+
+    try:
+        entra_in_lista(current_user, evento)
+        db.session.commit()
+        flash('⏳ Sei in lista d\'attesa: ti iscriviamo appena si libera un posto!', 'success')
+    except GiaInLista:
+        flash('Sei già in lista d\'attesa.', 'info')
+
+    return redirect(url_for('eventi.dettaglio', evento_id=evento_id))
+
+
+@eventi_bp.route('/<int:evento_id>/lista-attesa/esci', methods=['POST'])
+@login_required
+def esci_lista_attesa(evento_id):
+    esci_dalla_lista(current_user.id, evento_id)
+    db.session.commit()
+
+    flash('Sei uscito dalla lista d\'attesa.', 'info')
+    return redirect(url_for('eventi.dettaglio', evento_id=evento_id))
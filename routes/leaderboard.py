@@ -1,28 +1,41 @@
 # routes/leaderboard.py
-from flask import Blueprint, render_template
-from models.user import User
+from flask import Blueprint, render_template, request
+from flask_login import current_user
+from utils.leaderboard import leaderboard_cache
+from utils.classifiche import PERIODI, intervallo, classifica_periodo
 
 leaderboard_bp = Blueprint('leaderboard', __name__)
 
 
 @leaderboard_bp.route('/leaderboard')
 def index():
-    """Classifica utenti per TablExp"""
-    
-    # Top 50 utenti per exp (escludi account disattivi)
-    top_users = User.query.filter_by(attivo=True).order_by(User.tabl_exp.desc()).limit(50).all()
-    
+    """
+    Classifica utenti per TablExp. Quella generale è servita dalla cache (niente query
+    su users); con ?periodo=mese|stagione|anno|AAAA-MM legge il rollup exp_mensile.
+    """
+    periodo = request.args.get('periodo')
+    estremi = intervallo(periodo) if periodo else None
+    if estremi:
+        return _classifica_periodo(periodo, *estremi)
+
+    # Top 50 utenti per exp (la cache indicizza solo gli account attivi)
+    top_users = leaderboard_cache.top(50)
+
     # Statistiche generali
-    total_members = User.query.filter_by(attivo=True).count()
-    total_exp = sum([u.tabl_exp for u in User.query.filter_by(attivo=True).all()])
+    total_members, total_exp = leaderboard_cache.totali()
     avg_exp = total_exp / total_members if total_members > 0 else 0
-    
+
     # Top per ruolo
-    top_sidekick = User.query.filter_by(ruolo='sidekick', attivo=True).order_by(User.tabl_exp.desc()).first()
-    top_tablhero = User.query.filter_by(ruolo='tablhero', attivo=True).order_by(User.tabl_exp.desc()).first()
-    top_veteran = User.query.filter_by(ruolo='veteran', attivo=True).order_by(User.tabl_exp.desc()).first()
-    top_architect = User.query.filter_by(ruolo='game_architect', attivo=True).order_by(User.tabl_exp.desc()).first()
-    
+    top_sidekick = leaderboard_cache.top_ruolo('sidekick')
+    top_tablhero = leaderboard_cache.top_ruolo('tablhero')
+    top_veteran = leaderboard_cache.top_ruolo('veteran')
+    top_architect = leaderboard_cache.top_ruolo('game_architect')
+
+    # La mia posizione
+    mia_posizione = None
+    if current_user.is_authenticated:
+        mia_posizione = leaderboard_cache.posizione(current_user.id)
+
     return render_template('leaderboard.html',
                          top_users=top_users,
                          total_members=total_members,
@@ -31,4 +44,28 @@ def index():
                          top_sidekick=top_sidekick,
                          top_tablhero=top_tablhero,
                          top_veteran=top_veteran,
-                         top_architect=top_architect)
+                         top_architect=top_architect,
+                         mia_posizione=mia_posizione,
+                         periodi=PERIODI,
+                         periodo=None,
+                         etichetta_periodo=None)
+
+
+def _classifica_periodo(periodo, dal, al, etichetta):
+    user_id = current_user.id if current_user.is_authenticated else None
+    classifica = classifica_periodo(dal, al, limite=50, user_id=user_id)
+    membri, totale_exp = classifica['membri'], classifica['totale_exp']
+
+    return render_template('leaderboard.html',
+                         top_users=classifica['top'],
+                         total_members=membri,
+                         total_exp=totale_exp,
+                         avg_exp=int(totale_exp / membri) if membri else 0,
+                         top_sidekick=classifica['top_ruolo'].get('sidekick'),
+                         top_tablhero=classifica['top_ruolo'].get('tablhero'),
+                         top_veteran=classifica['top_ruolo'].get('veteran'),
+                         top_architect=classifica['top_ruolo'].get('game_architect'),
+                         mia_posizione=classifica['posizione'],
+                         periodi=PERIODI,
+                         periodo=periodo,
+                         etichetta_periodo=etichetta)
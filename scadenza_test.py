@@ -4,7 +4,7 @@ from models import db
 from models.user import User
 from datetime import datetime, timedelta
 
-app = create_app()
+app = create_app(avvia_scheduler=False)
 with app.app_context():
 
     # Trova utente pinodaniele
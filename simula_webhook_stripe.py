@@ -0,0 +1,104 @@
+# simula_webhook_stripe.py - Spara eventi checkout.session.completed firmati contro l'endpoint webhook
+#
+# Uso: python simula_webhook_stripe.py --eventi 5000 --thread 32 --duplicati 0.1
+#      python simula_webhook_stripe.py --userid 7 --tipo membership   (evento reale per un utente)
+# Firma con STRIPE_WEBHOOK_SECRET come farebbe Stripe (header Stripe-Signature t=...,v1=...).
+# Senza --userid i metadata hanno tipo 'carico': il worker li segna elaborati senza toccare nulla.
+import argparse
+import hashlib
+import hmac
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from dotenv import load_dotenv
+
+load_dotenv()
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--url', default='http://localhost:5000/stripe/webhook')
+parser.add_argument('--eventi', type=int, default=1000)
+parser.add_argument('--thread', type=int, default=16)
+parser.add_argument('--duplicati', type=float, default=0.0, help='frazione di eventi rispediti con lo stesso id')
+parser.add_argument('--tipo', default='carico', help="metadata.tipo (membership, renew, carico)")
+parser.add_argument('--userid', type=int)
+parser.add_argument('--eventoid', type=int, help='simula il pagamento di un evento')
+parser.add_argument('--secret', default=os.environ.get('STRIPE_WEBHOOK_SECRET', ''))
+args = parser.parse_args()
+
+if not args.secret:
+    print("⚠️ STRIPE_WEBHOOK_SECRET non impostato: l'app accetta eventi non firmati solo in debug")
+
+
+def crea_evento():
+    metadata = {'tipo': args.tipo}
+    if args.userid:
+        metadata['userid'] = str(args.userid)
+    if args.eventoid:
+        metadata['eventoid'] = str(args.eventoid)
+    return json.dumps({
+        'id': f'evt_sim_{uuid.uuid4().hex}',
+        'object': 'event',
+        'type': 'checkout.session.completed',
+        'created': int(time.time()),
+        'livemode': False,
+        'data': {'object': {
+            'id': f'cs_sim_{uuid.uuid4().hex}',
+            'object': 'checkout.session',
+            'payment_status': 'paid',
+            'metadata': metadata,
+        }},
+    })
+
+
+def firma(payload):
+    timestamp = int(time.time())
+    v1 = hmac.new(args.secret.encode(), f'{timestamp}.{payload}'.encode(), hashlib.sha256).hexdigest()
+    return f't={timestamp},v1={v1}'
+
+
+# Una sessione HTTP keep-alive per thread
+_locale = threading.local()
+
+
+def invia(payload):
+    if not hasattr(_locale, 'http'):
+        _locale.http = requests.Session()
+    inizio = time.perf_counter()
+    try:
+        risposta = _locale.http.post(args.url, data=payload, timeout=10, headers={
+            'Content-Type': 'application/json',
+            'Stripe-Signature': firma(payload),
+        })
+        esito = risposta.status_code
+    except requests.RequestException as e:
+        esito = type(e).__name__
+    return esito, time.perf_counter() - inizio
+
+
+payloads = [crea_evento() for _ in range(args.eventi)]
+payloads += random.sample(payloads, int(len(payloads) * args.duplicati))
+random.shuffle(payloads)
+
+print(f"🚀 {len(payloads)} webhook ({args.eventi} distinti) su {args.thread} thread verso {args.url}")
+inizio = time.perf_counter()
+with ThreadPoolExecutor(max_workers=args.thread) as pool:
+    risultati = list(pool.map(invia, payloads))
+durata = time.perf_counter() - inizio
+
+latenze = sorted(lat for _, lat in risultati)
+esiti = Counter(esito for esito, _ in risultati)
+print(f"⏱️  {durata:.2f}s ({len(payloads) / durata * 60:.0f} webhook/minuto)")
+print(f"📊 Latenza p50 {latenze[len(latenze) // 2] * 1000:.1f}ms, "
+      f"p95 {latenze[int(len(latenze) * 0.95)] * 1000:.1f}ms, max {latenze[-1] * 1000:.1f}ms")
+print(f"📊 Esiti HTTP: {dict(esiti)}")
+
+if set(esiti) != {200}:
+    sys.exit(1)
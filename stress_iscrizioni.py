@@ -0,0 +1,97 @@
+# stress_iscrizioni.py - Stress test multi-thread: nessun overselling sui posti evento
+#
+# Uso: python stress_iscrizioni.py --posti 50 --utenti 400 --thread 64
+# (DATABASE_URL permette di puntare a un DB di prova invece di quello di sviluppo)
+import argparse
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from app import create_app
+from models import db
+from models.user import User
+from models.evento import Evento
+from models.partecipazione import Partecipazione
+from utils.partecipazioni import iscrivi_utente, EventoCompleto, GiaIscritto
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--posti', type=int, default=50)
+parser.add_argument('--utenti', type=int, default=400)
+parser.add_argument('--thread', type=int, default=64)
+parser.add_argument('--doppi', type=int, default=2, help='tentativi per utente (simula i doppi click)')
+args = parser.parse_args()
+
+app = create_app(avvia_scheduler=False)
+prefisso = f'stress{int(time.time())}_'
+
+
+def tenta_iscrizione(user_id, evento_id):
+    with app.app_context():
+        try:
+            user = db.session.get(User, user_id)
+            evento = db.session.get(Evento, evento_id)
+            iscrivi_utente(user, evento)
+            db.session.commit()
+            return 'iscritto'
+        except EventoCompleto:
+            db.session.rollback()
+            return 'completo'
+        except GiaIscritto:
+            return 'gia_iscritto'
+        except Exception as e:
+            db.session.rollback()
+            return f'errore: {type(e).__name__}'
+        finally:
+            db.session.remove()
+
+
+with app.app_context():
+    print(f"🧪 Preparazione: {args.utenti} utenti, evento con {args.posti} posti")
+    utenti = [
+        User(nickname=f'{prefisso}{i}', nome='Stress', cognome='Test',
+             email=f'{prefisso}{i}@stress.local', password_hash='!', ruolo='tablhero',
+             tabl_exp=0, email_verificata=True, ha_pagato=True)
+        for i in range(args.utenti)
+    ]
+    db.session.add_all(utenti)
+    evento = Evento(titolo=f'{prefisso}evento', tipo='giochi_ruolo',
+                    data_evento=datetime.utcnow() + timedelta(days=7),
+                    max_partecipanti=args.posti, exp_reward=50)
+    db.session.add(evento)
+    db.session.commit()
+    user_ids = [u.id for u in utenti]
+    evento_id = evento.id
+
+tentativi = [uid for uid in user_ids for _ in range(args.doppi)]
+print(f"🚀 {len(tentativi)} iscrizioni concorrenti su {args.thread} thread...")
+
+inizio = time.perf_counter()
+with ThreadPoolExecutor(max_workers=args.thread) as pool:
+    esiti = Counter(pool.map(lambda uid: tenta_iscrizione(uid, evento_id), tentativi))
+durata = time.perf_counter() - inizio
+
+with app.app_context():
+    evento = db.session.get(Evento, evento_id)
+    righe = Partecipazione.query.filter_by(evento_id=evento_id).count()
+    distinti = db.session.query(Partecipazione.user_id).filter_by(evento_id=evento_id).distinct().count()
+    contatore = evento.num_partecipanti
+
+    print(f"⏱️  {durata:.2f}s ({len(tentativi) / durata:.0f} tentativi/s)")
+    print(f"📊 Esiti: {dict(esiti)}")
+    print(f"📊 Partecipazioni: {righe} (utenti distinti: {distinti}), contatore: {contatore}, posti: {args.posti}")
+
+    ok = (righe == contatore == esiti['iscritto'] == distinti == min(args.posti, args.utenti))
+
+    # Pulizia
+    Partecipazione.query.filter_by(evento_id=evento_id).delete()
+    db.session.delete(evento)
+    User.query.filter(User.id.in_(user_ids)).delete(synchronize_session=False)
+    db.session.commit()
+
+if ok:
+    print("✅ Nessun overselling, nessun doppione, contatore coerente")
+else:
+    print("❌ INCOERENZA RILEVATA")
+    sys.exit(1)
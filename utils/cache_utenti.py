@@ -0,0 +1,204 @@
+# utils/cache_utenti.py - Utente corrente da cache in memoria, con numero di versione per riga
+#
+# Ogni scrittura su `users` incrementa users.versione: dall'ORM (before_update) e negli
+# UPDATE diretti (do_orm_execute). load_user restituisce un UtenteCorrente costruito da
+# una FotoUtente in cache, senza query; i campi che non sono nella foto, i metodi e le
+# assegnazioni passano all'User vero, letto una volta sola per richiesta.
+from collections import OrderedDict, namedtuple
+import threading
+import time
+
+from flask_login import UserMixin
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session, object_session
+
+from models import db
+from models.user import User
+
+# I campi letti dai template e dai controlli di accesso su current_user
+FotoUtente = namedtuple('FotoUtente', 'id versione nickname ruolo is_admin ha_pagato livello '
+                                      'tabl_exp data_scadenza attivo')
+
+_CAMPI = FotoUtente._fields
+_TUTTI = object()  # Marker: UPDATE diretto su users, non si sa quali utenti ha toccato
+
+
+class UtenteCorrente(UserMixin):
+    """
+    Quello che Flask-Login mette in current_user: legge dalla foto finché può, poi
+    carica l'User con db.session.get e da lì in avanti delega tutto a lui, così
+    anche current_user.ha_pagato = True e i metodi del modello funzionano come prima.
+    """
+    __slots__ = ('_foto', '_utente')
+
+    def __init__(self, foto):
+        object.__setattr__(self, '_foto', foto)
+        object.__setattr__(self, '_utente', None)
+
+    @property
+    def utente(self):
+        """L'User della sessione, per passarlo all'ORM (db.session.delete, relazioni)"""
+        if self._utente is None:
+            object.__setattr__(self, '_utente', db.session.get(User, self._foto.id))
+        return self._utente
+
+    def get_id(self):
+        return str(self._foto.id)
+
+    # Legge solo ruolo, is_admin, ha_pagato e data_scadenza: bastano quelli della foto
+    puo_iscriversi_eventi = User.puo_iscriversi_eventi
+
+    def __getattr__(self, nome):
+        if self._utente is None and nome in _CAMPI:
+            return getattr(self._foto, nome)
+        return getattr(self.utente, nome)
+
+    def __setattr__(self, nome, valore):
+        setattr(self.utente, nome, valore)
+
+    def __repr__(self):
+        return f'<UtenteCorrente {self._foto.nickname} v{self._foto.versione}>'
+
+
+class CacheUtenti:
+    """
+    Foto degli utenti collegati, al massimo `massimo` (si scarta la meno usata).
+    Una foto è valida finché la sua versione è quella della mappa `_versioni`: i
+    commit di questo processo tolgono subito le foto degli utenti scritti, quelli
+    degli altri processi si vedono con una query id+versione su tutte le foto in
+    cache ogni `verifica_secondi`. Oltre `ttl` una foto si rilegge comunque.
+    """
+
+    def __init__(self, massimo=10000, verifica_secondi=5, ttl=300):
+        self.massimo = massimo
+        self.verifica_secondi = verifica_secondi
+        self.ttl = ttl
+        self.attiva = True
+        self._lock = threading.Lock()
+        self._foto = OrderedDict()  # id -> (FotoUtente, letta_il)
+        self._versioni = {}         # id -> ultima versione vista nel DB
+        self._verificata_il = time.monotonic()
+
+    def init_app(self, app):
+        self.attiva = app.config.get('UTENTI_CACHE', True)
+        self.massimo = app.config.get('UTENTI_CACHE_MAX', 10000)
+        self.verifica_secondi = app.config.get('UTENTI_CACHE_VERIFICA_SECONDI', 5)
+        self.ttl = app.config.get('UTENTI_CACHE_TTL', 300)
+
+    # --- Letture ---------------------------------------------------------
+
+    def carica(self, user_id):
+        """Per il user_loader: UtenteCorrente dalla cache, oppure una query sulle sole colonne della foto"""
+        if not self.attiva:
+            return db.session.get(User, user_id)
+        self._verifica_versioni()
+
+        adesso = time.monotonic()
+        with self._lock:
+            voce = self._foto.get(user_id)
+            if voce is not None:
+                foto, letta_il = voce
+                if foto.versione == self._versioni.get(user_id) and adesso - letta_il < self.ttl:
+                    self._foto.move_to_end(user_id)
+                    return UtenteCorrente(foto)
+
+        riga = db.session.execute(select(*(getattr(User, campo) for campo in _CAMPI))
+                                  .where(User.id == user_id)).first()
+        if riga is None:
+            self.invalida([user_id])
+            return None
+        foto = FotoUtente(*riga)
+        with self._lock:
+            self._foto[user_id] = (foto, adesso)
+            self._foto.move_to_end(user_id)
+            self._versioni[user_id] = foto.versione
+            if len(self._foto) > self.massimo:
+                vecchio, _ = self._foto.popitem(last=False)
+                self._versioni.pop(vecchio, None)
+        return UtenteCorrente(foto)
+
+    def _verifica_versioni(self, lotto=500):
+        """Una query ogni `verifica_secondi` per tutte le foto: SELECT id, versione WHERE id IN (...)"""
+        with self._lock:
+            if time.monotonic() - self._verificata_il < self.verifica_secondi:
+                return
+            self._verificata_il = time.monotonic()
+            ids = list(self._foto)
+        versioni = {}
+        for inizio in range(0, len(ids), lotto):
+            versioni.update(db.session.execute(
+                select(User.id, User.versione).where(User.id.in_(ids[inizio:inizio + lotto]))
+            ).all())
+        with self._lock:
+            for user_id in ids:
+                # Utente cancellato: None non corrisponde a nessuna foto
+                self._versioni[user_id] = versioni.get(user_id)
+
+    # --- Invalidazione ---------------------------------------------------
+
+    def invalida(self, user_ids):
+        """Toglie le foto indicate: la prossima richiesta di quegli utenti le rilegge"""
+        with self._lock:
+            for user_id in user_ids:
+                self._foto.pop(user_id, None)
+                self._versioni.pop(user_id, None)
+
+    def verifica_subito(self):
+        """Dopo UPDATE diretti su users: la prossima richiesta controlla tutte le versioni"""
+        with self._lock:
+            self._verificata_il = float('-inf')
+
+    def svuota(self):
+        with self._lock:
+            self._foto.clear()
+            self._versioni.clear()
+
+
+cache_utenti = CacheUtenti()
+
+
+# --- Versione: incrementata in SQL a ogni scrittura su users ---
+
+@event.listens_for(User, 'before_update')
+def _incrementa_versione(mapper, connection, target):
+    # before_update arriva anche per oggetti "dirty" senza modifiche reali
+    if object_session(target).is_modified(target, include_collections=False):
+        target.versione = User.versione + 1
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _versione_negli_update(esecuzione):
+    # Anche update(User) via session.execute, che non passa da after_bulk_update
+    if not (esecuzione.is_update or esecuzione.is_delete):
+        return
+    if esecuzione.bind_mapper is None or esecuzione.bind_mapper.class_ is not User:
+        return
+    if esecuzione.is_update:
+        esecuzione.statement = esecuzione.statement.values(versione=User.versione + 1)
+    esecuzione.session.info.setdefault('utenti_cache_pendenti', set()).add(_TUTTI)
+
+
+# --- Hook di sessione: raccoglie gli utenti scritti, li toglie dalla cache al commit ---
+
+@event.listens_for(Session, 'after_flush')
+def _raccogli_utenti(session, flush_context):
+    pendenti = session.info.setdefault('utenti_cache_pendenti', set())
+    for obj in list(session.dirty) + list(session.deleted):
+        if isinstance(obj, User):
+            pendenti.add(obj.id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalida_al_commit(session):
+    pendenti = session.info.pop('utenti_cache_pendenti', None)
+    if not pendenti:
+        return
+    if _TUTTI in pendenti:
+        pendenti.discard(_TUTTI)
+        cache_utenti.verifica_subito()
+    cache_utenti.invalida(pendenti)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _scarta_utenti(session):
+    session.info.pop('utenti_cache_pendenti', None)
@@ -0,0 +1,195 @@
+# utils/classifiche.py - Classifiche per periodo (mese, stagione, anno) dal rollup exp_mensile
+from datetime import datetime
+
+from sqlalchemy import select, update, delete, func, extract
+from sqlalchemy.dialects import mysql, sqlite
+
+from config import Config
+from models import db
+from models.user import User
+from models.partecipazione import Partecipazione
+from models.exp_mensile import ExpMensile
+from utils.leaderboard import VoceClassifica
+
+PERIODI = {
+    'mese': 'Questo mese',
+    'stagione': 'Questa stagione',
+    'anno': "Quest'anno",
+}
+
+
+def mese_di(data=None):
+    """datetime -> AAAAMM (default: mese corrente)"""
+    data = data or datetime.utcnow()
+    return data.year * 100 + data.month
+
+
+def intervallo(periodo, oggi=None):
+    """
+    'mese' | 'stagione' | 'anno' | 'AAAA-MM' -> (primo mese, ultimo mese, etichetta),
+    None se il periodo non è valido. Le stagioni sono blocchi di STAGIONE_MESI da gennaio.
+    """
+    oggi = oggi or datetime.utcnow()
+    if periodo == 'mese':
+        return mese_di(oggi), mese_di(oggi), PERIODI[periodo]
+    if periodo == 'stagione':
+        inizio = (oggi.month - 1) // Config.STAGIONE_MESI * Config.STAGIONE_MESI + 1
+        fine = min(inizio + Config.STAGIONE_MESI - 1, 12)
+        return oggi.year * 100 + inizio, oggi.year * 100 + fine, PERIODI[periodo]
+    if periodo == 'anno':
+        return oggi.year * 100 + 1, oggi.year * 100 + 12, PERIODI[periodo]
+    try:
+        data = datetime.strptime(periodo or '', '%Y-%m')
+    except ValueError:
+        return None
+    return mese_di(data), mese_di(data), data.strftime('%m/%Y')
+
+
+# --- Aggiornamento incrementale --------------------------------------------
+
+def _somma(righe):
+    """
+    Upsert atomico di [{user_id, mese, exp}]: INSERT ... ON DUPLICATE KEY UPDATE
+    exp = exp + VALUES(exp) su MariaDB, ON CONFLICT DO UPDATE su SQLite.
+    """
+    if not righe:
+        return
+    righe = sorted(righe, key=lambda r: (r['user_id'], r['mese']))  # Ordine fisso: niente deadlock tra upsert
+    if db.session.get_bind().dialect.name == 'mysql':
+        stmt = mysql.insert(ExpMensile).values(righe)
+        stmt = stmt.on_duplicate_key_update(exp=ExpMensile.exp + stmt.inserted.exp)
+    else:
+        stmt = sqlite.insert(ExpMensile).values(righe)
+        stmt = stmt.on_conflict_do_update(index_elements=['user_id', 'mese'],
+                                          set_={'exp': ExpMensile.exp + stmt.excluded.exp})
+    db.session.execute(stmt)
+
+
+def aggiungi_exp_mensile(user_ids, exp, data=None):
+    """Nuove partecipazioni: `exp` va al mese di `data` (default: adesso) di ogni utente"""
+    if isinstance(user_ids, int):
+        user_ids = [user_ids]
+    if exp:
+        mese = mese_di(data)
+        _somma([{'user_id': user_id, 'mese': mese, 'exp': exp} for user_id in user_ids])
+
+
+def storna_exp_mensile(*condizioni):
+    """
+    Partecipazioni che stanno per essere cancellate: toglie la loro EXP dal mese
+    in cui era stata guadagnata, un UPDATE per (utente, mese) coinvolto.
+    """
+    anno = extract('year', Partecipazione.data_partecipazione)
+    mese = extract('month', Partecipazione.data_partecipazione)
+    gruppi = db.session.execute(
+        select(Partecipazione.user_id, anno, mese, func.sum(Partecipazione.exp_guadagnata))
+        .where(*condizioni, Partecipazione.exp_guadagnata != 0)
+        .group_by(Partecipazione.user_id, anno, mese)
+    ).all()
+    for user_id, a, m, exp in sorted(gruppi):
+        db.session.execute(
+            update(ExpMensile)
+            .where(ExpMensile.user_id == user_id, ExpMensile.mese == int(a) * 100 + int(m))
+            .values(exp=ExpMensile.exp - int(exp))
+            .execution_options(synchronize_session=False)
+        )
+
+
+def ricostruisci(lotto=1000):
+    """
+    Ricalcola il rollup dalle partecipazioni a blocchi di `lotto` utenti (per id), un
+    commit per blocco, senza mai svuotarlo: le classifiche restano servite dai valori
+    di prima finché ogni (utente, mese) non viene sovrascritto. Per blocco:
+    - un INSERT ... SELECT SUM ... GROUP BY con upsert che imposta exp al valore
+      ricalcolato (non lo somma). È un solo statement: su MariaDB blocca le righe lette,
+      quindi iscrizioni e cancellazioni concorrenti di quegli utenti aspettano e poi
+      applicano il loro delta sul valore nuovo;
+    - un DELETE delle righe (utente, mese) che non hanno più partecipazioni.
+    Generatore: produce (utente raggiunto, ultimo utente) dopo ogni blocco.
+    """
+    ultimo = max(db.session.scalar(select(func.max(Partecipazione.user_id))) or 0,
+                 db.session.scalar(select(func.max(ExpMensile.user_id))) or 0)
+    mese = (extract('year', Partecipazione.data_partecipazione) * 100 +
+            extract('month', Partecipazione.data_partecipazione))
+    valide = (Partecipazione.data_partecipazione.isnot(None), Partecipazione.exp_guadagnata != 0)
+
+    for inizio in range(0, ultimo, lotto):
+        utenti = (Partecipazione.user_id > inizio, Partecipazione.user_id <= inizio + lotto)
+        somme = (select(Partecipazione.user_id, mese, func.sum(Partecipazione.exp_guadagnata))
+                 .where(*utenti, *valide)
+                 .group_by(Partecipazione.user_id, mese))
+        colonne = ['user_id', 'mese', 'exp']
+        if db.session.get_bind().dialect.name == 'mysql':
+            stmt = mysql.insert(ExpMensile).from_select(colonne, somme)
+            stmt = stmt.on_duplicate_key_update(exp=stmt.inserted.exp)
+        else:
+            stmt = sqlite.insert(ExpMensile).from_select(colonne, somme)
+            stmt = stmt.on_conflict_do_update(index_elements=['user_id', 'mese'], set_={'exp': stmt.excluded.exp})
+        db.session.execute(stmt)
+
+        ancora = (select(Partecipazione.id)
+                  .where(Partecipazione.user_id == ExpMensile.user_id, mese == ExpMensile.mese, *valide)
+                  .exists())
+        db.session.execute(
+            delete(ExpMensile)
+            .where(ExpMensile.user_id > inizio, ExpMensile.user_id <= inizio + lotto, ~ancora)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        yield min(inizio + lotto, ultimo), ultimo
+
+
+# --- Letture -----------------------------------------------------------------
+
+def _somme(dal, al):
+    """EXP per utente nel periodo: solo l'indice (mese, user_id, exp)"""
+    return (select(ExpMensile.user_id, func.sum(ExpMensile.exp).label('exp'))
+            .where(ExpMensile.mese.between(dal, al))
+            .group_by(ExpMensile.user_id)
+            .having(func.sum(ExpMensile.exp) > 0)
+            .subquery())
+
+
+def _voci(righe):
+    return [VoceClassifica(user_id, nickname, ruolo, livello, int(exp), attivo)
+            for user_id, nickname, ruolo, livello, exp, attivo in righe]
+
+
+def classifica_periodo(dal, al, limite=50, user_id=None):
+    """
+    Classifica degli utenti attivi per EXP guadagnata tra i mesi `dal` e `al` (AAAAMM).
+    Ritorna {'top', 'top_ruolo', 'membri', 'totale_exp', 'posizione'}; le voci hanno
+    gli stessi campi di quelle della classifica generale, con tabl_exp = EXP del periodo.
+    """
+    somme = _somme(dal, al)
+    colonne = (User.id, User.nickname, User.ruolo, User.livello, somme.c.exp, User.attivo)
+    base = select(*colonne).join(somme, somme.c.user_id == User.id).where(User.attivo.is_(True))
+
+    top = _voci(db.session.execute(base.order_by(somme.c.exp.desc(), User.id).limit(limite)).all())
+
+    membri, totale_exp = db.session.execute(
+        select(func.count(), func.coalesce(func.sum(somme.c.exp), 0))
+        .select_from(somme).join(User, User.id == somme.c.user_id)
+        .where(User.attivo.is_(True))
+    ).one()
+
+    # Primo di ogni ruolo con una window function (MariaDB >= 10.2, SQLite >= 3.25)
+    numero = func.row_number().over(partition_by=User.ruolo, order_by=(somme.c.exp.desc(), User.id))
+    per_ruolo = base.add_columns(numero.label('n')).subquery()
+    top_ruolo = {}
+    for riga in db.session.execute(select(per_ruolo).where(per_ruolo.c.n == 1)):
+        top_ruolo[riga.ruolo] = _voci([riga[:6]])[0]
+
+    posizione = None
+    if user_id is not None:
+        mia = db.session.scalar(base.with_only_columns(somme.c.exp).where(User.id == user_id))
+        if mia is not None:
+            posizione = db.session.scalar(
+                select(func.count())
+                .select_from(somme).join(User, User.id == somme.c.user_id)
+                .where(User.attivo.is_(True),
+                       (somme.c.exp > mia) | ((somme.c.exp == mia) & (User.id < user_id)))
+            ) + 1
+
+    return {'top': top, 'top_ruolo': top_ruolo, 'membri': membri,
+            'totale_exp': int(totale_exp), 'posizione': posizione}
@@ -1,20 +1,20 @@
-# utils/email.py - VERSIONE FINALE
-from flask_mail import Message
+# utils/email.py - VERSIONE FINALE (le email passano dalla outbox, vedi utils/outbox.py)
 import secrets
 from flask import url_for
+from utils.outbox import accoda_email
 
 def genera_token_verifica():
     """Genera token sicuro per verifica email"""
     return secrets.token_urlsafe(32)
 
-def send_email_verifica(mail, user_email, user_nome, token):
-    """Invia email con link di verifica"""
+def send_email_verifica(user_email, user_nome, token):
+    """Accoda email con link di verifica (parte al commit della richiesta)"""
     link_verifica = url_for('auth.verifica_email', token=token, _external=True)
 
-    msg = Message(
-        subject='🔐 Verifica il tuo account TableHero',
-        recipients=[user_email],
-        html=f'''
+    accoda_email(
+        user_email,
+        '🔐 Verifica il tuo account TableHero',
+        f'''
         <div style="font-family: 'Orbitron', Arial, sans-serif; max-width: 600px; margin: 0 auto; background: linear-gradient(135deg, #1a1a2e 0%, #16213e 100%); color: #fff; padding: 30px; border-radius: 15px;">
             <h2 style="color: #D4AF37; text-align: center; margin-bottom: 20px;">🎲 Benvenuto su TableHero!</h2>
 
@@ -46,14 +46,13 @@ def send_email_verifica(mail, user_email, user_nome, token):
         </div>
         '''
     )
-    mail.send(msg)
 
-def send_conferma_iscrizione(mail, user_email, user_nome, evento_titolo, evento_data):
-    """Invia email conferma iscrizione evento"""
-    msg = Message(
-        subject=f'✅ Iscrizione confermata: {evento_titolo}',
-        recipients=[user_email],
-        html=f'''
+def send_conferma_iscrizione(user_email, user_nome, evento_titolo, evento_data):
+    """Accoda email conferma iscrizione evento"""
+    accoda_email(
+        user_email,
+        f'✅ Iscrizione confermata: {evento_titolo}',
+        f'''
         <div style="font-family: 'Orbitron', Arial, sans-serif; max-width: 600px; margin: 0 auto; background: linear-gradient(135deg, #1a1a2e 0%, #16213e 100%); color: #fff; padding: 30px; border-radius: 15px;">
             <h2 style="color: #D4AF37; text-align: center; margin-bottom: 20px;">🎲 TableHero - Conferma Iscrizione</h2>
             
@@ -77,4 +76,33 @@ def send_conferma_iscrizione(mail, user_email, user_nome, evento_titolo, evento_
         </div>
         '''
     )
-    mail.send(msg)
+
+def send_promozione_lista_attesa(user_email, user_nome, evento_titolo, evento_data):
+    """Accoda email: posto liberato, utente iscritto dalla lista d'attesa"""
+    accoda_email(
+        user_email,
+        f'🎉 Si è liberato un posto: {evento_titolo}',
+        f'''
+        <div style="font-family: 'Orbitron', Arial, sans-serif; max-width: 600px; margin: 0 auto; background: linear-gradient(135deg, #1a1a2e 0%, #16213e 100%); color: #fff; padding: 30px; border-radius: 15px;">
+            <h2 style="color: #D4AF37; text-align: center; margin-bottom: 20px;">🎲 TableHero - Lista d'Attesa</h2>
+            
+            <p style="font-size: 16px;">Ciao <strong style="color: #D4AF37;">{user_nome}</strong>! 🎉</p>
+            
+            <p style="margin: 20px 0;">Si è liberato un posto e sei stato iscritto automaticamente a:</p>
+            
+            <div style="background: rgba(212, 175, 55, 0.1); padding: 20px; border-left: 4px solid #D4AF37; margin: 20px 0; border-radius: 8px;">
+                <h3 style="color: #D4AF37; margin: 0 0 10px 0;">{evento_titolo}</h3>
+                <p style="margin: 5px 0; font-size: 16px;">📅 <strong>Data:</strong> {evento_data}</p>
+            </div>
+            
+            <p style="font-size: 14px; margin-top: 30px;">Se non puoi più partecipare, annulla l'iscrizione dalla pagina dell'evento per lasciare il posto al prossimo in lista.</p>
+            
+            <hr style="border: none; border-top: 1px solid rgba(212, 175, 55, 0.3); margin: 30px 0;">
+            
+            <p style="text-align: center; color: #999; font-size: 12px;">
+                <strong>TableHero</strong><br>
+                La tua community nerd a Gioia del Colle 🏰
+            </p>
+        </div>
+        '''
+    )
@@ -0,0 +1,115 @@
+# utils/esportazioni.py - Export CSV/JSONL di utenti, eventi e partecipazioni su cursore lato server
+#
+# Le query selezionano solo colonne (tuple Core, niente oggetti ORM) e si leggono con
+# yield_per: su MariaDB/PyMySQL il cursore è lato server (SSCursor), quindi la memoria
+# resta quella di un lotto qualunque sia il numero di righe. Le route le mandano in
+# streaming (routes/admin.py), esporta.py le scrive in file .gz.
+import csv
+import io
+import json
+
+from sqlalchemy import select
+
+from models import db
+from models.user import User
+from models.evento import Evento
+from models.partecipazione import Partecipazione
+
+FORMATI = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+
+
+# --- Filtri: gli stessi delle pagine admin ---
+
+def filtri_utenti(search='', ruolo=''):
+    """Ricerca su nickname/email/nome/cognome e ruolo, come admin.gestione_utenti"""
+    condizioni = []
+    if search:
+        condizioni.append(User.nickname.contains(search) | User.email.contains(search) |
+                          User.nome.contains(search) | User.cognome.contains(search))
+    if ruolo:
+        condizioni.append(User.ruolo == ruolo)
+    return condizioni
+
+
+def filtri_eventi(tipo=''):
+    """Tipo evento, come admin.gestione_eventi"""
+    return [Evento.tipo == tipo] if tipo else []
+
+
+# --- Query da esportare (password e token restano fuori) ---
+
+def query_utenti(search='', ruolo=''):
+    return (select(User.id, User.nickname, User.nome, User.cognome, User.email, User.email_verificata,
+                   User.ruolo, User.livello, User.tabl_exp, User.ha_pagato, User.data_scadenza,
+                   User.payment_status, User.attivo, User.is_admin, User.data_registrazione)
+            .where(*filtri_utenti(search, ruolo))
+            .order_by(User.data_registrazione.desc()))
+
+
+def query_eventi(tipo=''):
+    return (select(Evento.id, Evento.titolo, Evento.tipo, Evento.data_evento, Evento.max_partecipanti,
+                   Evento.num_partecipanti, Evento.prezzo, Evento.exp_reward, Evento.data_creazione)
+            .where(*filtri_eventi(tipo))
+            .order_by(Evento.data_evento.desc(), Evento.id.desc()))
+
+
+def query_partecipazioni(evento_id=None, user_id=None):
+    """Per evento come admin.partecipanti_evento, per utente, o tutte"""
+    stmt = (select(Partecipazione.id, Partecipazione.evento_id, Evento.titolo.label('evento'),
+                   Evento.data_evento, Partecipazione.user_id, User.nickname, User.email,
+                   Partecipazione.data_partecipazione, Partecipazione.exp_guadagnata)
+            .join(Evento, Evento.id == Partecipazione.evento_id)
+            .join(User, User.id == Partecipazione.user_id)
+            .order_by(Partecipazione.id))
+    if evento_id:
+        stmt = stmt.where(Partecipazione.evento_id == evento_id)
+    if user_id:
+        stmt = stmt.where(Partecipazione.user_id == user_id)
+    return stmt
+
+
+# nome: (query, {parametro: tipo}) - i parametri sono quelli delle pagine admin
+ESPORTAZIONI = {
+    'utenti': (query_utenti, {'search': str, 'ruolo': str}),
+    'eventi': (query_eventi, {'tipo': str}),
+    'partecipazioni': (query_partecipazioni, {'evento_id': int, 'user_id': int}),
+}
+
+
+# --- Lettura a lotti e formattazione ---
+
+def lotti(stmt, lotto=1000):
+    """Le righe di `stmt` a gruppi di `lotto`, lette da un cursore lato server"""
+    risultato = db.session.execute(stmt.execution_options(yield_per=lotto))
+    try:
+        yield from risultato.partitions()
+    finally:
+        risultato.close()  # Anche se il client chiude a metà download
+
+
+def intestazione(colonne, formato):
+    if formato == 'csv':
+        buffer = io.StringIO()
+        csv.writer(buffer).writerow(colonne)
+        return buffer.getvalue()
+    return ''
+
+
+def formatta(righe, colonne, formato):
+    """Un lotto di righe come un solo pezzo di testo"""
+    if formato == 'csv':
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(righe)
+        return buffer.getvalue()
+    return ''.join(json.dumps(dict(zip(colonne, riga)), ensure_ascii=False, default=str) + '\n'
+                   for riga in righe)
+
+
+def genera(stmt, formato, lotto=1000):
+    """Testo dell'export a pezzi: l'intestazione subito, poi un pezzo per lotto"""
+    colonne = list(stmt.selected_columns.keys())
+    testa = intestazione(colonne, formato)
+    if testa:
+        yield testa
+    for righe in lotti(stmt, lotto):
+        yield formatta(righe, colonne, formato)
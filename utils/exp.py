@@ -0,0 +1,161 @@
+# utils/exp.py - TablExp: movimenti append-only su exp_ledger e incremento atomico di users.tabl_exp
+from datetime import datetime
+
+from sqlalchemy import select, update, insert, delete, func, literal, extract
+from sqlalchemy.orm.util import identity_key
+
+from models import db
+from models.user import User
+from models.partecipazione import Partecipazione
+from models.exp_ledger import MovimentoExp
+from utils.leaderboard import segna_utenti_modificati
+from utils.livelli import tabella_livelli
+
+
+def _dopo_update(user_ids):
+    """
+    Dopo un UPDATE diretto su users: gli User già in sessione rileggono tabl_exp e
+    livello al prossimo accesso e la classifica in memoria li riposiziona al commit.
+    """
+    for user_id in user_ids:
+        user = db.session.identity_map.get(identity_key(User, user_id))
+        if user is not None:
+            db.session.expire(user, ['tabl_exp', 'livello'])
+    segna_utenti_modificati(user_ids)
+
+
+def assegna_exp(user_ids, delta, causale, evento_id=None):
+    """
+    Aggiunge `delta` (anche negativo) agli utenti indicati: una riga di registro
+    per utente e un solo UPDATE users SET tabl_exp = tabl_exp + :delta, con il
+    livello ricalcolato in SQL. Nessuna lettura in Python, quindi nessun
+    aggiornamento perso tra richieste concorrenti. Commit a carico del chiamante.
+    """
+    if isinstance(user_ids, int):
+        user_ids = [user_ids]
+    if not user_ids or not delta:
+        return
+
+    adesso = datetime.utcnow()
+    db.session.execute(
+        insert(MovimentoExp),
+        [{'user_id': user_id, 'delta': delta, 'causale': causale, 'evento_id': evento_id, 'data': adesso}
+         for user_id in user_ids]
+    )
+    nuova_exp = func.coalesce(User.tabl_exp, 0) + delta
+    db.session.execute(
+        update(User)
+        .where(User.id.in_(user_ids))
+        .values(tabl_exp=nuova_exp, livello=tabella_livelli.espressione_sql(nuova_exp))
+        .execution_options(synchronize_session=False)
+    )
+    _dopo_update(user_ids)
+
+
+def storna_partecipazioni(*condizioni, causale='rimozione'):
+    """
+    Toglie l'EXP delle partecipazioni che soddisfano `condizioni` (prima di cancellarle):
+    un INSERT ... SELECT scrive uno storno per partecipazione, un UPDATE users JOIN
+    (SELECT user_id, SUM(exp_guadagnata) ...) scala tabl_exp e ricalcola il livello.
+    """
+    user_ids = db.session.scalars(
+        select(Partecipazione.user_id).where(*condizioni, Partecipazione.exp_guadagnata != 0).distinct()
+    ).all()
+    if not user_ids:
+        return
+
+    db.session.execute(
+        insert(MovimentoExp).from_select(
+            ['user_id', 'delta', 'causale', 'evento_id', 'data'],
+            select(Partecipazione.user_id, -Partecipazione.exp_guadagnata, literal(causale),
+                   Partecipazione.evento_id, literal(datetime.utcnow(), MovimentoExp.data.type))
+            .where(*condizioni, Partecipazione.exp_guadagnata != 0)
+        )
+    )
+
+    exp = (select(Partecipazione.user_id, func.sum(Partecipazione.exp_guadagnata).label('exp'))
+           .where(*condizioni)
+           .group_by(Partecipazione.user_id)
+           .subquery())
+    # Ripetuta anche nel CASE del livello: MariaDB e SQLite non concordano
+    # sul vedere o meno il nuovo tabl_exp nella stessa SET
+    nuova_exp = func.coalesce(User.tabl_exp, 0) - func.coalesce(exp.c.exp, 0)
+    db.session.execute(
+        update(User)
+        .where(User.id == exp.c.user_id)
+        .values(tabl_exp=nuova_exp, livello=tabella_livelli.espressione_sql(nuova_exp))
+        .execution_options(synchronize_session=False)
+    )
+    _dopo_update(user_ids)
+
+
+def riconcilia(correggi=True, lotto=1000):
+    """
+    Confronta users.tabl_exp con la somma del registro (un solo GROUP BY) e, con
+    `correggi`, riallinea al registro gli utenti in deriva. Commit a carico del chiamante.
+    Ritorna [(user_id, tabl_exp, somma_registro)] degli utenti non allineati.
+    """
+    somme = (select(MovimentoExp.user_id, func.sum(MovimentoExp.delta).label('somma'))
+             .group_by(MovimentoExp.user_id)
+             .subquery())
+    atteso = func.coalesce(somme.c.somma, 0)
+    deriva = db.session.execute(
+        select(User.id, User.tabl_exp, atteso)
+        .outerjoin(somme, somme.c.user_id == User.id)
+        .where(func.coalesce(User.tabl_exp, 0) != atteso)
+    ).all()
+
+    if correggi and deriva:
+        somma_registro = (select(func.coalesce(func.sum(MovimentoExp.delta), 0))
+                          .where(MovimentoExp.user_id == User.id)
+                          .scalar_subquery())
+        ids = [r[0] for r in deriva]
+        for inizio in range(0, len(ids), lotto):
+            db.session.execute(
+                update(User)
+                .where(User.id.in_(ids[inizio:inizio + lotto]))
+                .values(tabl_exp=somma_registro, livello=tabella_livelli.espressione_sql(somma_registro))
+                .execution_options(synchronize_session=False)
+            )
+        _dopo_update(ids)
+
+    return [tuple(r) for r in deriva]
+
+
+def compatta_registro(prima_di):
+    """
+    Fonde i movimenti dei mesi interi prima di `prima_di` in una riga 'compattazione'
+    per utente e mese: le somme per utente non cambiano e le classifiche per periodo
+    restano calcolabili a granularità mensile. Commit a carico del chiamante.
+    Ritorna (movimenti fusi, righe scritte).
+    """
+    # Solo mesi chiusi: con un taglio a metà mese ogni notte aggiungerebbe un'altra riga
+    # 'compattazione' allo stesso mese. I movimenti nuovi hanno sempre la data di adesso,
+    # quindi un mese già compattato non riceve altro.
+    prima_di = datetime(prima_di.year, prima_di.month, 1)
+    ultimo = db.session.scalar(select(func.max(MovimentoExp.id)).where(MovimentoExp.data < prima_di))
+    if ultimo is None:
+        return 0, 0
+
+    # id <= ultimo: i movimenti scritti nel frattempo restano fuori
+    condizioni = (MovimentoExp.id <= ultimo, MovimentoExp.data < prima_di,
+                  MovimentoExp.causale != 'compattazione')
+    anno = extract('year', MovimentoExp.data)
+    mese = extract('month', MovimentoExp.data)
+    gruppi = db.session.execute(
+        select(MovimentoExp.user_id, anno, mese, func.sum(MovimentoExp.delta))
+        .where(*condizioni)
+        .group_by(MovimentoExp.user_id, anno, mese)
+    ).all()
+
+    righe = [{'user_id': user_id, 'delta': int(somma), 'causale': 'compattazione',
+              'data': datetime(int(a), int(m), 1)}
+             for user_id, a, m, somma in gruppi if somma]
+    if righe:
+        db.session.execute(insert(MovimentoExp), righe)
+    fusi = db.session.execute(
+        delete(MovimentoExp)
+        .where(*condizioni)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    return fusi, len(righe)
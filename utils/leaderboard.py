@@ -0,0 +1,198 @@
+# utils/leaderboard.py - Classifica TablExp in memoria
+from bisect import bisect_left, insort
+from collections import namedtuple
+import threading
+import time
+
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
+
+from models import db
+from models.user import User
+
+# Snapshot compatto di un utente: ha gli stessi campi usati dai template
+VoceClassifica = namedtuple('VoceClassifica', 'id nickname ruolo livello tabl_exp attivo')
+
+_CAMPI = VoceClassifica._fields
+_CAMPI_RILEVANTI = ('nickname', 'ruolo', 'livello', 'tabl_exp', 'attivo')
+_RICARICA = object()  # Marker: l'utente è cambiato via SQL diretto, va riletto
+
+
+class LeaderboardCache:
+    """
+    Indice ordinato di (tabl_exp, user_id) degli utenti attivi + totali per ruolo.
+    Viene caricato una volta dal DB e poi aggiornato incrementalmente ad ogni
+    commit che tocca gli utenti, quindi le pagine non interrogano mai `users`.
+    """
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl  # Ricarica completa periodica (allinea gli altri worker)
+        self._lock = threading.RLock()
+        self._caricata_il = None
+        self._utenti = {}         # id -> VoceClassifica (anche non attivi)
+        self._indice = []         # [(-tabl_exp, id)] solo attivi, ordinato
+        self._indice_ruolo = {}   # ruolo -> [(-tabl_exp, id)]
+        self._totali_ruolo = {}   # ruolo -> [membri, exp]
+        self._totale_exp = 0
+
+    # --- Caricamento -----------------------------------------------------
+
+    def _assicura_caricata(self):
+        scaduta = (self._caricata_il is None or
+                   time.monotonic() - self._caricata_il > self.ttl)
+        if scaduta:
+            self.ricarica()
+
+    def ricarica(self):
+        """Ricostruisce l'indice con una sola query sulle colonne necessarie"""
+        colonne = [getattr(User, campo) for campo in _CAMPI]
+        righe = db.session.execute(select(*colonne)).all()
+        with self._lock:
+            self._utenti = {}
+            self._indice = []
+            self._indice_ruolo = {}
+            self._totali_ruolo = {}
+            self._totale_exp = 0
+            for riga in righe:
+                self._inserisci(VoceClassifica(*riga))
+            self._caricata_il = time.monotonic()
+
+    def invalida(self):
+        with self._lock:
+            self._caricata_il = None
+
+    # --- Aggiornamento incrementale -------------------------------------
+
+    def _inserisci(self, voce):
+        voce = voce._replace(tabl_exp=voce.tabl_exp or 0)
+        self._utenti[voce.id] = voce
+        if not voce.attivo:
+            return
+        chiave = (-voce.tabl_exp, voce.id)
+        insort(self._indice, chiave)
+        insort(self._indice_ruolo.setdefault(voce.ruolo, []), chiave)
+        totali = self._totali_ruolo.setdefault(voce.ruolo, [0, 0])
+        totali[0] += 1
+        totali[1] += voce.tabl_exp
+        self._totale_exp += voce.tabl_exp
+
+    def _rimuovi(self, user_id):
+        voce = self._utenti.pop(user_id, None)
+        if voce is None or not voce.attivo:
+            return
+        chiave = (-voce.tabl_exp, voce.id)
+        for lista in (self._indice, self._indice_ruolo.get(voce.ruolo, [])):
+            pos = bisect_left(lista, chiave)
+            if pos < len(lista) and lista[pos] == chiave:
+                del lista[pos]
+        totali = self._totali_ruolo[voce.ruolo]
+        totali[0] -= 1
+        totali[1] -= voce.tabl_exp
+        self._totale_exp -= voce.tabl_exp
+
+    def aggiorna(self, voci=(), rimossi=()):
+        """Applica utenti modificati/nuovi e utenti eliminati"""
+        with self._lock:
+            if self._caricata_il is None:
+                return  # Verrà caricata da zero alla prossima lettura
+            for user_id in rimossi:
+                self._rimuovi(user_id)
+            for voce in voci:
+                self._rimuovi(voce.id)
+                self._inserisci(voce)
+
+    # --- Letture ---------------------------------------------------------
+
+    def top(self, limite=50):
+        self._assicura_caricata()
+        with self._lock:
+            return [self._utenti[user_id] for _, user_id in self._indice[:limite]]
+
+    def top_ruolo(self, ruolo):
+        self._assicura_caricata()
+        with self._lock:
+            lista = self._indice_ruolo.get(ruolo)
+            return self._utenti[lista[0][1]] if lista else None
+
+    def totali(self, ruolo=None):
+        """Ritorna (membri attivi, exp totale), globali o per ruolo"""
+        self._assicura_caricata()
+        with self._lock:
+            if ruolo is not None:
+                return tuple(self._totali_ruolo.get(ruolo, (0, 0)))
+            return len(self._indice), self._totale_exp
+
+    def posizione(self, user_id):
+        """Posizione in classifica (1 = primo) in O(log n), None se non presente"""
+        self._assicura_caricata()
+        with self._lock:
+            voce = self._utenti.get(user_id)
+            if voce is None or not voce.attivo:
+                return None
+            return bisect_left(self._indice, (-voce.tabl_exp, voce.id)) + 1
+
+
+leaderboard_cache = LeaderboardCache()
+
+
+def segna_utenti_modificati(user_ids, session=None):
+    """
+    Da chiamare dopo UPDATE SQL diretti su `users` (che non passano dall'ORM):
+    al commit gli utenti indicati vengono riletti e riposizionati in classifica.
+    """
+    session = session or db.session()
+    pendenti = session.info.setdefault('leaderboard_pendenti', {})
+    for user_id in user_ids:
+        pendenti[user_id] = _RICARICA
+
+
+# --- Hook di sessione: raccoglie le modifiche al flush, le applica al commit ---
+
+def _snapshot(user):
+    stato = inspect(user)
+    valori = stato.dict
+    if any(campo not in valori for campo in _CAMPI):
+        return _RICARICA  # Attributi scaduti: meglio rileggere dal DB
+    return VoceClassifica(*(valori[campo] for campo in _CAMPI))
+
+
+@event.listens_for(Session, 'after_flush')
+def _raccogli_modifiche(session, flush_context):
+    pendenti = session.info.setdefault('leaderboard_pendenti', {})
+    for obj in session.new:
+        if isinstance(obj, User):
+            pendenti[obj.id] = _snapshot(obj)
+    for obj in session.dirty:
+        if isinstance(obj, User):
+            stato = inspect(obj)
+            if any(stato.attrs[campo].history.has_changes() for campo in _CAMPI_RILEVANTI):
+                pendenti[obj.id] = _snapshot(obj)
+    for obj in session.deleted:
+        if isinstance(obj, User):
+            pendenti[obj.id] = None
+
+
+@event.listens_for(Session, 'after_commit')
+def _applica_modifiche(session):
+    pendenti = session.info.pop('leaderboard_pendenti', None)
+    if not pendenti:
+        return
+
+    voci = [v for v in pendenti.values() if isinstance(v, VoceClassifica)]
+    rimossi = [user_id for user_id, v in pendenti.items() if v is None]
+    da_rileggere = [user_id for user_id, v in pendenti.items() if v is _RICARICA]
+
+    if da_rileggere:
+        colonne = [getattr(User, campo) for campo in _CAMPI]
+        with db.engine.connect() as conn:
+            righe = conn.execute(select(*colonne).where(User.id.in_(da_rileggere))).all()
+        voci.extend(VoceClassifica(*riga) for riga in righe)
+        trovati = {riga[0] for riga in righe}
+        rimossi.extend(user_id for user_id in da_rileggere if user_id not in trovati)
+
+    leaderboard_cache.aggiorna(voci, rimossi)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _scarta_modifiche(session):
+    session.info.pop('leaderboard_pendenti', None)
@@ -0,0 +1,153 @@
+# utils/limiti.py - Limiti di frequenza a secchiello di token per /login e /reinvia-verifica
+#
+# Ogni regola di Config.LIMITI è (capienza, token al minuto): la capienza è la raffica
+# ammessa, poi si passa al ritmo di ricarica. Il controllo avviene prima di toccare DB,
+# bcrypt o SMTP: una richiesta rifiutata costa un lookup in memoria e un 429 di testo.
+# Con più processi LIMITI_REDIS_URL (pip install redis) rende i secchielli condivisi.
+from collections import OrderedDict
+from functools import wraps
+import logging
+import math
+import threading
+import time
+
+from flask import current_app, request
+
+log = logging.getLogger('tablhero.limiti')
+
+# Secchiello condiviso su Redis: ricarica, consumo e scadenza in un solo passaggio atomico
+_SCRIPT_REDIS = """
+local capienza = tonumber(ARGV[1])
+local ricarica = tonumber(ARGV[2])
+local costo = tonumber(ARGV[3])
+local ora = redis.call('TIME')
+local adesso = tonumber(ora[1]) + tonumber(ora[2]) / 1000000
+local stato = redis.call('HMGET', KEYS[1], 'token', 'ts')
+local token = tonumber(stato[1]) or capienza
+local ts = tonumber(stato[2]) or adesso
+token = math.min(capienza, token + math.max(0, adesso - ts) * ricarica)
+local consentito = 0
+if token >= costo then
+    token = token - costo
+    consentito = 1
+end
+redis.call('HSET', KEYS[1], 'token', tostring(token), 'ts', tostring(adesso))
+redis.call('EXPIRE', KEYS[1], math.ceil(capienza / ricarica) + 1)
+return {consentito, tostring(token)}
+"""
+
+
+class SecchielliLocali:
+    """
+    Secchielli in memoria del processo. Al massimo `massimo` chiavi: oltre, si scarta
+    quella usata meno di recente (un secchiello dimenticato riparte pieno, come se fosse
+    passato abbastanza tempo), così un attacco da molti IP non fa crescere la memoria.
+    """
+
+    def __init__(self, massimo=100000):
+        self.massimo = massimo
+        self._secchielli = OrderedDict()
+        self._lock = threading.Lock()
+
+    def consuma(self, chiave, capienza, ricarica, costo=1):
+        """Ritorna (consentito, token rimasti); `ricarica` in token al secondo"""
+        adesso = time.monotonic()
+        with self._lock:
+            token, ts = self._secchielli.pop(chiave, (capienza, adesso))
+            token = min(capienza, token + (adesso - ts) * ricarica)
+            consentito = token >= costo
+            if consentito:
+                token -= costo
+            self._secchielli[chiave] = (token, adesso)
+            if len(self._secchielli) > self.massimo:
+                self._secchielli.popitem(last=False)
+        return consentito, token
+
+    def azzera(self):
+        with self._lock:
+            self._secchielli.clear()
+
+
+class SecchielliRedis:
+    """Stessi secchielli su Redis, condivisi tra processi e macchine"""
+
+    def __init__(self, url):
+        import redis
+        self._client = redis.Redis.from_url(url, socket_timeout=0.2, socket_connect_timeout=0.2)
+        self._script = self._client.register_script(_SCRIPT_REDIS)
+
+    def consuma(self, chiave, capienza, ricarica, costo=1):
+        consentito, token = self._script(keys=[f'tablhero:limiti:{chiave}'], args=[capienza, ricarica, costo])
+        return bool(consentito), float(token)
+
+    def azzera(self):
+        for chiave in self._client.scan_iter('tablhero:limiti:*'):
+            self._client.delete(chiave)
+
+
+class Limitatore:
+    def __init__(self):
+        self.locali = SecchielliLocali()
+        self.condivisi = None
+
+    def init_app(self, app):
+        self.locali.massimo = app.config.get('LIMITI_CHIAVI_MAX', 100000)
+        url = app.config.get('LIMITI_REDIS_URL')
+        if url and self.condivisi is None:
+            try:
+                self.condivisi = SecchielliRedis(url)
+            except ImportError:
+                log.warning('LIMITI_REDIS_URL impostato ma il pacchetto redis non è installato: limiti per processo')
+
+    def consuma(self, regola, chiave):
+        """(consentito, token rimasti) per questa chiave secondo la regola di Config.LIMITI"""
+        capienza, al_minuto = current_app.config['LIMITI'][regola]
+        chiave = f'{regola}:{chiave}'
+        if self.condivisi is not None:
+            try:
+                return self.condivisi.consuma(chiave, capienza, al_minuto / 60)
+            except Exception as e:
+                # Redis giù: meglio un limite per processo che nessun limite (o nessun login)
+                log.warning('Limiti condivisi non raggiungibili, uso quelli locali', extra={'errore': str(e)})
+        return self.locali.consuma(chiave, capienza, al_minuto / 60)
+
+    def attesa(self, regola):
+        """Secondi consigliati prima di riprovare (Retry-After): il tempo per ricaricare un token"""
+        _, al_minuto = current_app.config['LIMITI'][regola]
+        return max(1, math.ceil(60 / al_minuto))
+
+
+limitatore = Limitatore()
+
+
+def _valore(campo):
+    if campo == 'ip':
+        return request.remote_addr or '-'
+    return (request.form.get(campo) or '').strip().lower()[:255]
+
+
+def limita(*regole):
+    """
+    Decoratore per le route POST: regole come ('login_ip', 'ip') o ('login_nickname', 'nickname'),
+    dove il secondo elemento è 'ip' o un campo del form. Si consumano in ordine (un campo
+    vuoto salta la sua regola); alla prima esaurita la richiesta riceve subito un 429.
+    """
+    def decoratore(vista):
+        @wraps(vista)
+        def limitata(*args, **kwargs):
+            if request.method == 'POST' and current_app.config.get('LIMITI_ATTIVI', True):
+                for regola, campo in regole:
+                    valore = _valore(campo)
+                    if not valore:
+                        continue
+                    consentito, _ = limitatore.consuma(regola, valore)
+                    if not consentito:
+                        # Durante un attacco sono migliaia: nei log ne resta un campione
+                        log.info('Richiesta limitata', extra={'regola': regola, 'ip': request.remote_addr,
+                                                              'campione': 0.01})
+                        attesa = limitatore.attesa(regola)
+                        return (f'Troppi tentativi: riprova tra {attesa} secondi.', 429,
+                                {'Retry-After': str(attesa), 'Content-Type': 'text/plain; charset=utf-8'})
+            return vista(*args, **kwargs)
+        return limitata
+    return decoratore
@@ -0,0 +1,105 @@
+# utils/lista_attesa.py - Lista d'attesa FIFO con promozione automatica
+from sqlalchemy import select, delete, insert, func
+from sqlalchemy.exc import IntegrityError
+
+from models import db
+from models.user import User
+from models.partecipazione import Partecipazione
+from models.lista_attesa import ListaAttesa
+from utils.partecipazioni import riserva_posti, posti_disponibili
+from utils.exp import assegna_exp
+from utils.classifiche import aggiungi_exp_mensile
+from utils.email import send_promozione_lista_attesa
+
+
+class GiaInLista(Exception):
+    """L'utente è già in lista d'attesa per l'evento"""
+
+
+def entra_in_lista(user, evento):
+    """Accoda l'utente in fondo alla lista (commit a carico del chiamante)"""
+    ultima = db.session.execute(
+        select(func.max(ListaAttesa.posizione)).where(ListaAttesa.evento_id == evento.id)
+    ).scalar()
+    voce = ListaAttesa(evento_id=evento.id, user_id=user.id, posizione=(ultima or 0) + 1)
+    db.session.add(voce)
+    try:
+        db.session.flush()
+    except IntegrityError:
+        db.session.rollback()
+        raise GiaInLista(evento.id)
+    return voce
+
+
+def esci_dalla_lista(user_id, evento_id):
+    return ListaAttesa.query.filter_by(user_id=user_id, evento_id=evento_id).delete()
+
+
+def posizione_in_lista(user_id, evento_id):
+    """Posizione (1 = prossimo a entrare) o None se l'utente non è in lista"""
+    voce = ListaAttesa.query.filter_by(user_id=user_id, evento_id=evento_id).first()
+    if voce is None:
+        return None
+    davanti = ListaAttesa.query.filter(
+        ListaAttesa.evento_id == evento_id,
+        (ListaAttesa.posizione < voce.posizione) |
+        ((ListaAttesa.posizione == voce.posizione) & (ListaAttesa.id < voce.id))
+    ).count()
+    return davanti + 1
+
+
+def testa_lista(evento_id, quanti):
+    """I primi `quanti` in coda, bloccati (usata anche da verifica_piani.py)"""
+    return (select(ListaAttesa.id, ListaAttesa.user_id)
+            .where(ListaAttesa.evento_id == evento_id)
+            .order_by(ListaAttesa.posizione, ListaAttesa.id)
+            .limit(quanti)
+            .with_for_update())
+
+
+def promuovi_lista_attesa(evento, posti_liberi):
+    """
+    Iscrive i primi `posti_liberi` utenti in lista, in ordine di posizione, ma non
+    più dei posti davvero liberi: prenotazioni Stripe o un max_partecipanti abbassato
+    possono averne già occupati una parte, e chi non entra resta in coda.
+    Costo O(posti liberati): legge solo la testa della coda tramite l'indice
+    (evento_id, posizione) e lavora con INSERT/DELETE set-based.
+    Le notifiche finiscono in outbox nella stessa transazione.
+    Commit a carico del chiamante. Ritorna la lista di utenti promossi.
+    """
+    # Prima la riga evento (stesso ordine dei lock di iscrivi_utente), poi la coda
+    disponibili = posti_disponibili(evento.id)
+    if disponibili is not None:
+        posti_liberi = min(posti_liberi, disponibili)
+    if posti_liberi <= 0:
+        return []
+
+    testa = db.session.execute(testa_lista(evento.id, posti_liberi)).all()
+    if not testa:
+        return []
+
+    # Con la riga evento bloccata non può fallire; su SQLite (niente FOR UPDATE)
+    # l'UPDATE condizionale resta comunque la garanzia contro l'overbooking
+    if not riserva_posti(evento.id, posti=len(testa)):
+        return []
+
+    user_ids = [r.user_id for r in testa]
+    db.session.execute(
+        insert(Partecipazione),
+        [{'user_id': user_id, 'evento_id': evento.id, 'exp_guadagnata': evento.exp_reward}
+         for user_id in user_ids]
+    )
+    db.session.execute(
+        delete(ListaAttesa)
+        .where(ListaAttesa.id.in_([r.id for r in testa]))
+        .execution_options(synchronize_session=False)
+    )
+
+    assegna_exp(user_ids, evento.exp_reward, 'promozione', evento.id)
+    aggiungi_exp_mensile(user_ids, evento.exp_reward)
+
+    promossi = User.query.filter(User.id.in_(user_ids)).all()
+    data = evento.data_evento.strftime('%d/%m/%Y alle %H:%M')
+    for user in promossi:
+        send_promozione_lista_attesa(user.email, user.nome, evento.titolo, data)
+    return promossi
@@ -0,0 +1,164 @@
+# utils/livelli.py - Livelli TablExp: una sola tabella di soglie per lookup, progresso e ricalcolo in massa
+from bisect import bisect_right
+import threading
+import time
+
+from sqlalchemy import select, update, delete, case
+from sqlalchemy.exc import SQLAlchemyError
+
+from config import Config
+from models import db
+from models.user import User
+from models.livello import LivelloExp
+from utils.leaderboard import segna_utenti_modificati
+
+# Nomi ammessi dalla colonna users.livello
+NOMI_LIVELLI = tuple(User.__table__.c.livello.type.enums)
+
+
+def normalizza_soglie(coppie):
+    """
+    (nome, exp_minima) -> (soglie crescenti, nomi). Il primo livello parte sempre
+    da 0, così ogni valore di EXP cade in esattamente un livello.
+    """
+    ordinate = sorted(((nome, int(minimo)) for nome, minimo in coppie), key=lambda c: c[1])
+    if not ordinate:
+        raise ValueError('Nessun livello definito')
+    nomi = [nome for nome, _ in ordinate]
+    sconosciuti = set(nomi) - set(NOMI_LIVELLI)
+    if sconosciuti:
+        raise ValueError(f'Livelli non previsti da users.livello: {", ".join(sorted(sconosciuti))}')
+    if len(set(nomi)) != len(nomi):
+        raise ValueError('Livello ripetuto')
+    soglie = [0] + [minimo for _, minimo in ordinate[1:]]
+    if any(a >= b for a, b in zip(soglie, soglie[1:])):
+        raise ValueError('Le soglie devono essere strettamente crescenti e maggiori di 0')
+    return soglie, nomi
+
+
+class TabellaLivelli:
+    """
+    Soglie dei livelli lette dalla tabella `livelli` (se popolata) o da Config.LIVELLI.
+    Vengono rilette al massimo ogni `ttl` secondi, così una modifica fatta da
+    rilivella.py arriva a tutti i processi senza riavvio.
+    """
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._tabella = None
+        self._caricata = 0.0
+
+    def tabella(self):
+        """(soglie, nomi) correnti"""
+        if self._tabella is None or time.monotonic() - self._caricata > self.ttl:
+            with self._lock:
+                if self._tabella is None or time.monotonic() - self._caricata > self.ttl:
+                    self._tabella = self._carica()
+                    self._caricata = time.monotonic()
+        return self._tabella
+
+    def invalida(self):
+        self._tabella = None
+
+    def _carica(self):
+        try:
+            # Connessione a parte: un errore (tabella non ancora migrata) non tocca la sessione della richiesta
+            with db.engine.connect() as conn:
+                righe = conn.execute(select(LivelloExp.nome, LivelloExp.exp_minima)).all()
+        except SQLAlchemyError:
+            righe = []
+        return normalizza_soglie(righe) if righe else self._da_config()
+
+    def _da_config(self):
+        return normalizza_soglie((nome, minimo) for nome, (minimo, _) in Config.LIVELLI.items())
+
+    def _indice(self, soglie, exp):
+        return max(bisect_right(soglie, exp or 0) - 1, 0)
+
+    def livello(self, exp):
+        soglie, nomi = self.tabella()
+        return nomi[self._indice(soglie, exp)]
+
+    def exp_per_prossimo(self, exp):
+        """EXP mancante al livello successivo (0 al livello massimo)"""
+        soglie, _ = self.tabella()
+        i = self._indice(soglie, exp)
+        return soglie[i + 1] - (exp or 0) if i + 1 < len(soglie) else 0
+
+    def progresso(self, exp):
+        """Percentuale di avanzamento dentro il livello attuale"""
+        soglie, _ = self.tabella()
+        i = self._indice(soglie, exp)
+        if i + 1 == len(soglie):
+            return 100
+        return ((exp or 0) - soglie[i]) / (soglie[i + 1] - soglie[i]) * 100
+
+    def espressione_sql(self, exp):
+        """La stessa regola come CASE SQL, per gli UPDATE set-based"""
+        soglie, nomi = self.tabella()
+        return case(*[(exp >= soglia, nome) for soglia, nome in reversed(list(zip(soglie, nomi)))][:-1],
+                    else_=nomi[0])
+
+    def salva(self, coppie=None):
+        """
+        Sostituisce le soglie nel DB (None = svuota, tornano quelle di Config).
+        Valgono subito in questo processo, anche prima del commit (a carico del chiamante).
+        """
+        tabella = normalizza_soglie(coppie) if coppie else self._da_config()
+        db.session.execute(delete(LivelloExp))
+        if coppie:
+            db.session.add_all(LivelloExp(nome=nome, exp_minima=soglia) for soglia, nome in zip(*tabella))
+        with self._lock:
+            self._tabella = tabella
+            self._caricata = time.monotonic()
+        return tabella
+
+
+tabella_livelli = TabellaLivelli(ttl=Config.LIVELLI_RICARICA_SECONDI)
+
+
+def _indici_livello(soglie, exp):
+    """
+    Indice del livello per ogni valore di `exp`: una sola searchsorted NumPy
+    sull'intero vettore, o bisect valore per valore se NumPy non è installato.
+    """
+    try:
+        import numpy as np
+    except ImportError:
+        return [max(bisect_right(soglie, e or 0) - 1, 0) for e in exp]
+
+    valori = np.fromiter((e or 0 for e in exp), dtype=np.int64, count=len(exp))
+    indici = np.searchsorted(np.asarray(soglie, dtype=np.int64), valori, side='right') - 1
+    return np.maximum(indici, 0).tolist()
+
+
+def rilivella_tutti(lotto=5000, prova=False):
+    """
+    Ricalcola il livello di tutti gli utenti con la tabella corrente e scrive solo
+    quelli cambiati: un UPDATE ... WHERE id IN (...) per livello e lotto.
+    Con `prova` non scrive nulla. Commit a carico del chiamante.
+    Ritorna {nome_livello: utenti spostati in quel livello}.
+    """
+    soglie, nomi = tabella_livelli.tabella()
+    # Tuple dal cursore Core: per 100k righe evita il costo degli oggetti ORM
+    righe = db.session.connection().execute(select(User.id, User.tabl_exp, User.livello)).fetchall()
+    ids, exp, attuali = zip(*righe) if righe else ((), (), ())
+
+    spostati = {nome: [] for nome in nomi}
+    for user_id, attuale, indice in zip(ids, attuali, _indici_livello(soglie, exp)):
+        if attuale != nomi[indice]:
+            spostati[nomi[indice]].append(user_id)
+
+    if not prova:
+        for nome, da_spostare in spostati.items():
+            for inizio in range(0, len(da_spostare), lotto):
+                db.session.execute(
+                    update(User)
+                    .where(User.id.in_(da_spostare[inizio:inizio + lotto]))
+                    .values(livello=nome)
+                    .execution_options(synchronize_session=False)
+                )
+        segna_utenti_modificati([user_id for gruppo in spostati.values() for user_id in gruppo])
+
+    return {nome: len(gruppo) for nome, gruppo in spostati.items()}
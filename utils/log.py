@@ -0,0 +1,147 @@
+# utils/log.py - Log strutturati: JSON con request id, scritti da un thread dedicato (QueueHandler/QueueListener)
+#
+# Ogni modulo usa logging.getLogger('tablhero.<nome>'): auth, admin, dashboard, eventi,
+# leaderboard per i blueprint; app, webhook, scheduler, outbox, telemetria per il resto.
+# I campi in extra={...} finiscono nel JSON: log.info('Login riuscito', extra={'user_id': 3}).
+import atexit
+import copy
+import json
+import logging
+import queue
+import random
+import sys
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from flask import g, has_request_context, request
+
+RADICE = 'tablhero'
+
+# Attributi di ogni LogRecord: tutto il resto viene da extra={...}
+_ATTRIBUTI_RECORD = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'campione'}
+
+_listener = None
+
+
+def _coppie(testo):
+    """'auth=DEBUG, scheduler=WARNING' -> {'auth': 'DEBUG', 'scheduler': 'WARNING'}"""
+    coppie = {}
+    for parte in (testo or '').split(','):
+        if '=' in parte:
+            nome, valore = parte.split('=', 1)
+            coppie[nome.strip()] = valore.strip()
+    return coppie
+
+
+class FiltroRichiesta(logging.Filter):
+    """
+    Gira nel thread che scrive il log, prima della coda: aggiunge request id ed
+    endpoint della richiesta in corso e scarta i record campionati via.
+    """
+
+    def __init__(self, campionamento=None):
+        super().__init__()
+        self.campionamento = campionamento or {}
+
+    def filter(self, record):
+        if record.levelno < logging.WARNING:
+            quota = getattr(record, 'campione', None)
+            if quota is None:
+                quota = self.campionamento.get(record.name[len(RADICE) + 1:])
+            if quota is not None:
+                if random.random() >= quota:
+                    return False
+                record.campione = quota
+        if has_request_context():
+            record.request_id = g.get('request_id')
+            record.endpoint = request.endpoint
+        return True
+
+
+class _CodaLog(QueueHandler):
+    """Come QueueHandler, ma tiene l'eventuale traceback in un campo a parte"""
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class FormatoJson(logging.Formatter):
+    """Un oggetto JSON per riga: ts, livello, logger, msg, request_id, endpoint e campi extra"""
+
+    def format(self, record):
+        dati = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'livello': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for chiave, valore in vars(record).items():
+            if chiave not in _ATTRIBUTI_RECORD and valore is not None:
+                dati[chiave] = valore
+        if getattr(record, 'campione', None) is not None:
+            dati['campione'] = record.campione
+        if record.exc_text:
+            dati['eccezione'] = record.exc_text
+        return json.dumps(dati, ensure_ascii=False, default=str)
+
+
+class FormatoTesto(logging.Formatter):
+    """Per lo sviluppo: una riga leggibile con request id e campi extra in coda"""
+
+    def format(self, record):
+        extra = {k: v for k, v in vars(record).items()
+                 if k not in _ATTRIBUTI_RECORD and k not in ('request_id', 'endpoint') and v is not None}
+        testo = f"{datetime.now():%H:%M:%S} {record.levelname:<7} {record.name}"
+        if getattr(record, 'request_id', None):
+            testo += f" [{record.request_id[:8]}]"
+        testo += f" {record.getMessage()}"
+        if extra:
+            testo += ' ' + ' '.join(f'{k}={v}' for k, v in extra.items())
+        if record.exc_text:
+            testo += '\n' + record.exc_text
+        return testo
+
+
+def configura_log(app):
+    """
+    Una volta per processo: i logger 'tablhero.*' mettono i record in una coda in
+    memoria e un solo thread li formatta e li scrive su stderr, così le richieste non
+    aspettano mai l'I/O del terminale. In più un request id per richiesta (header
+    X-Request-ID, ripreso dal proxy se presente) finisce in ogni log e nella risposta.
+    """
+    global _listener
+    radice = logging.getLogger(RADICE)
+    radice.setLevel(app.config.get('LOG_LIVELLO', 'INFO'))
+    for nome, livello in _coppie(app.config.get('LOG_LIVELLI')).items():
+        logging.getLogger(f'{RADICE}.{nome}').setLevel(livello.upper())
+
+    if _listener is None:
+        uscita = logging.StreamHandler(sys.stderr)
+        uscita.setFormatter(FormatoTesto() if app.config.get('LOG_FORMATO') == 'testo' else FormatoJson())
+        coda = queue.SimpleQueue()
+        ingresso = _CodaLog(coda)
+        campionamento = {nome: float(quota) for nome, quota in _coppie(app.config.get('LOG_CAMPIONAMENTO')).items()}
+        ingresso.addFilter(FiltroRichiesta(campionamento))
+        radice.addHandler(ingresso)
+        radice.propagate = False
+        _listener = QueueListener(coda, uscita, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)  # Scrive i record ancora in coda prima di uscire
+
+    @app.before_request
+    def _assegna_request_id():
+        esterno = request.headers.get('X-Request-ID', '')
+        g.request_id = esterno[:64] if esterno and esterno.isprintable() else uuid.uuid4().hex
+
+    @app.after_request
+    def _restituisci_request_id(response):
+        if 'request_id' in g:
+            response.headers['X-Request-ID'] = g.request_id
+        return response
@@ -0,0 +1,74 @@
+# utils/membership.py - Scadenza membership: un UPDATE per tutte le scadute, avvisi via outbox a lotti
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, update
+
+from models import db
+from models.user import User
+from utils.outbox import accoda_job
+
+
+def _soggetti_a_scadenza():
+    """Founder e admin non scadono mai (come in User.puo_iscriversi_eventi)"""
+    return (User.ha_pagato.is_(True), User.ruolo != 'founder', User.is_admin.isnot(True))
+
+
+def condizioni_scadute(adesso):
+    """WHERE dell'UPDATE delle scadute (usata anche da verifica_piani.py)"""
+    return (*_soggetti_a_scadenza(), User.data_scadenza < adesso)
+
+
+def lotto_avvisi(inizio, ultimo, lotto):
+    """Destinatari che scadono nel giorno `inizio`, dopo l'id `ultimo` (keyset)"""
+    return (select(User.id, User.email, User.nome, User.data_scadenza)
+            .where(*_soggetti_a_scadenza(), User.data_scadenza >= inizio,
+                   User.data_scadenza < inizio + timedelta(days=1), User.id > ultimo)
+            .order_by(User.id)
+            .limit(lotto))
+
+
+def scadi_membership(adesso=None):
+    """
+    Toglie ha_pagato a tutte le membership scadute con un solo UPDATE sull'indice
+    (ha_pagato, data_scadenza). Commit a carico del chiamante; ritorna quante ne ha chiuse.
+    """
+    risultato = db.session.execute(
+        update(User)
+        .where(*condizioni_scadute(adesso or datetime.utcnow()))
+        .values(ha_pagato=False)
+        .execution_options(synchronize_session=False)
+    )
+    return risultato.rowcount
+
+
+def accoda_avvisi_scadenza(giorni, adesso=None, lotto=1000):
+    """
+    Accoda "la tua membership scade tra N giorni" per chi scade nel giorno adesso+N,
+    per ogni N in `giorni`. Destinatari letti a lotti di `lotto` per id (keyset) e
+    scritti con un INSERT multi-riga per lotto, tutti sotto lo stesso job outbox.
+    Commit a carico del chiamante. Ritorna (job_id, {giorni: email accodate}).
+    """
+    adesso = adesso or datetime.utcnow()
+    oggi = datetime(adesso.year, adesso.month, adesso.day)
+    job_id, accodate = None, {}
+    for n in giorni:
+        inizio = oggi + timedelta(days=n)
+        accodate[n] = 0
+        ultimo = 0
+        while True:
+            righe = db.session.execute(lotto_avvisi(inizio, ultimo, lotto)).all()
+            if not righe:
+                break
+            quando = 'domani' if n == 1 else f'tra {n} giorni'
+            job_id = accoda_job([
+                (r.email, f'La tua membership scade {quando} - TableHero',
+                 f'<h2>Membership in scadenza</h2><p>Ciao {r.nome},<br>la tua membership TableHero scade '
+                 f'il <strong>{r.data_scadenza.strftime("%d/%m/%Y")}</strong>.</p>'
+                 f'<p>Rinnovala dalla Dashboard per continuare a iscriverti agli eventi. 🎲</p>')
+                for r in righe
+            ], job_id=job_id)
+            accodate[n] += len(righe)
+            ultimo = righe[-1].id
+            if len(righe) < lotto:
+                break
+    return job_id, accodate
@@ -0,0 +1,214 @@
+# utils/metriche_sql.py - Query SQL per richiesta: conteggio, tempo sul DB e statement ripetuti (N+1)
+from collections import Counter
+from contextlib import contextmanager
+import re
+import threading
+import time
+
+from flask import g, request, current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Stesso statement (a meno dei parametri) ripetuto almeno tante volte in una richiesta = sospetto N+1
+SOGLIA_N_PIU_1 = 5
+
+_SEGNAPOSTO = r'(?:\?|%s|%\(\w+\)s|:\w+)'
+_LISTA_IN = re.compile(r'\(\s*' + _SEGNAPOSTO + r'(?:\s*,\s*' + _SEGNAPOSTO + r')*\s*\)')
+_NUMERI = re.compile(r'\b\d+\b')
+_SPAZI = re.compile(r'\s+')
+
+# Raccolte attive sul thread corrente: la richiesta in corso ed eventuali budget_query()
+_locale = threading.local()
+
+
+def impronta(statement):
+    """Forma normalizzata dello statement: liste IN di lunghezza diversa e numeri letterali coincidono"""
+    testo = _SPAZI.sub(' ', statement).strip()
+    return _NUMERI.sub('?', _LISTA_IN.sub('(?)', testo))
+
+
+class RaccoltaQuery:
+    """Query eseguite dal thread finché la raccolta è attiva"""
+
+    def __init__(self):
+        self.numero = 0
+        self.durata = 0.0
+        self.impronte = Counter()
+
+    def registra(self, statement, durata):
+        self.numero += 1
+        self.durata += durata
+        self.impronte[impronta(statement)] += 1
+
+    def ripetute(self, soglia=SOGLIA_N_PIU_1):
+        """[(impronta, volte)] degli statement eseguiti almeno `soglia` volte, dal più ripetuto"""
+        return [(sql, volte) for sql, volte in self.impronte.most_common() if volte >= soglia]
+
+
+def _attive():
+    return getattr(_locale, 'raccolte', None)
+
+
+def _attiva(raccolta):
+    if not _attive():
+        _locale.raccolte = []
+    _locale.raccolte.append(raccolta)
+
+
+def _disattiva(raccolta):
+    raccolte = _attive()
+    if raccolte and raccolta in raccolte:
+        raccolte.remove(raccolta)
+
+
+# --- Eventi dell'engine --------------------------------------------------------
+# Registrati una volta su Engine: valgono per ogni engine, ma senza raccolte attive
+# sul thread (worker outbox, scheduler, script) costano solo un getattr.
+
+def _prima_query(conn, cursor, statement, parameters, context, executemany):
+    if _attive():
+        conn.info.setdefault('_inizio_query', []).append(time.perf_counter())
+
+
+def _dopo_query(conn, cursor, statement, parameters, context, executemany):
+    inizi = conn.info.get('_inizio_query')
+    if not inizi:
+        return
+    durata = time.perf_counter() - inizi.pop()
+    for raccolta in _attive() or ():
+        raccolta.registra(statement, durata)
+
+
+def _errore_query(contesto):
+    # Niente after_cursor_execute sulle query fallite: l'inizio va tolto qui
+    if contesto.connection is not None:
+        inizi = contesto.connection.info.get('_inizio_query')
+        if inizi:
+            inizi.pop()
+
+
+def _registra_eventi():
+    if not event.contains(Engine, 'before_cursor_execute', _prima_query):
+        event.listen(Engine, 'before_cursor_execute', _prima_query)
+        event.listen(Engine, 'after_cursor_execute', _dopo_query)
+        event.listen(Engine, 'handle_error', _errore_query)
+
+
+# --- Aggregati per endpoint ------------------------------------------------------
+
+class MetricheSql:
+    """
+    Totali per endpoint dall'avvio del processo (o dall'ultimo azzeramento):
+    ogni worker gunicorn ha i suoi, la pagina admin mostra quelli del processo che risponde.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoint = {}
+
+    def registra(self, endpoint, raccolta, ripetute):
+        with self._lock:
+            voce = self._endpoint.setdefault(endpoint, {
+                'richieste': 0, 'query': 0, 'durata': 0.0, 'max_query': 0,
+                'n_piu_1': 0, 'ultima_ripetuta': None,
+            })
+            voce['richieste'] += 1
+            voce['query'] += raccolta.numero
+            voce['durata'] += raccolta.durata
+            voce['max_query'] = max(voce['max_query'], raccolta.numero)
+            if ripetute:
+                voce['n_piu_1'] += 1
+                voce['ultima_ripetuta'] = ripetute[0]
+
+    def riepilogo(self):
+        """Una riga per endpoint, dai più costosi in tempo DB totale"""
+        with self._lock:
+            righe = [dict(voce, endpoint=endpoint,
+                          query_medie=voce['query'] / voce['richieste'],
+                          ms_medi=voce['durata'] * 1000 / voce['richieste'])
+                     for endpoint, voce in self._endpoint.items()]
+        return sorted(righe, key=lambda r: r['durata'], reverse=True)
+
+    def azzera(self):
+        with self._lock:
+            self._endpoint.clear()
+
+
+metriche_sql = MetricheSql()
+
+
+def _soglia():
+    if has_app_context():
+        return current_app.config.get('METRICHE_SQL_SOGLIA_N_PIU_1', SOGLIA_N_PIU_1)
+    return SOGLIA_N_PIU_1
+
+
+def installa(app):
+    """
+    Una raccolta per richiesta: totali per endpoint in `metriche_sql` e, in debug,
+    header X-Query-Count / X-Query-Time-Ms / X-Query-Ripetute sulla risposta.
+    """
+    if not app.config.get('METRICHE_SQL', True):
+        return
+    _registra_eventi()
+
+    @app.before_request
+    def _inizia_raccolta():
+        if request.endpoint != 'static':
+            g._raccolta_query = RaccoltaQuery()
+            _attiva(g._raccolta_query)
+
+    @app.after_request
+    def _chiudi_raccolta(response):
+        raccolta = g.pop('_raccolta_query', None)
+        if raccolta is None:
+            return response
+        _disattiva(raccolta)
+        ripetute = raccolta.ripetute(_soglia())
+        metriche_sql.registra(request.endpoint or '-', raccolta, ripetute)
+        if app.debug:
+            response.headers['X-Query-Count'] = str(raccolta.numero)
+            response.headers['X-Query-Time-Ms'] = f'{raccolta.durata * 1000:.1f}'
+            if ripetute:
+                response.headers['X-Query-Ripetute'] = '; '.join(f'{volte}x {sql[:120]}' for sql, volte in ripetute)
+        return response
+
+    @app.teardown_request
+    def _scarta_raccolta(exc):
+        # Richiesta finita con un'eccezione: after_request non è stato chiamato
+        raccolta = g.pop('_raccolta_query', None)
+        if raccolta is not None:
+            _disattiva(raccolta)
+
+
+# --- Budget per test e script ---------------------------------------------------------
+
+class BudgetQuerySuperato(AssertionError):
+    pass
+
+
+@contextmanager
+def budget_query(massimo=None, n_piu_1=True, soglia=None):
+    """
+    Conta le query del blocco (anche quelle di una richiesta del test client) e
+    solleva BudgetQuerySuperato se sono più di `massimo` o, con `n_piu_1`, se uno
+    statement si ripete almeno `soglia` volte:
+
+        with budget_query(6):
+            client.get('/dashboard/')
+    """
+    _registra_eventi()
+    raccolta = RaccoltaQuery()
+    _attiva(raccolta)
+    try:
+        yield raccolta
+    finally:
+        _disattiva(raccolta)
+
+    problemi = []
+    if massimo is not None and raccolta.numero > massimo:
+        problemi.append(f'{raccolta.numero} query (budget {massimo})')
+    if n_piu_1:
+        problemi += [f'{volte}x {sql}' for sql, volte in raccolta.ripetute(soglia or _soglia())]
+    if problemi:
+        raise BudgetQuerySuperato('; '.join(problemi))
@@ -0,0 +1,287 @@
+# utils/outbox.py - Invio email in background: outbox su DB + pool di worker SMTP
+import logging
+import smtplib
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from flask_mail import Message
+from sqlalchemy import select, update, insert, func, and_, case
+from sqlalchemy.exc import IntegrityError
+
+from models import db
+from models.email_outbox import EmailOutbox, RitmoOutbox
+from utils.telemetria import telemetria
+
+log = logging.getLogger('tablhero.outbox')
+
+
+def accoda_email(destinatario, oggetto, html, job_id=None):
+    """
+    Scrive l'email in outbox nella transazione del chiamante: parte solo se
+    la richiesta fa commit, e la richiesta non aspetta mai il server SMTP.
+    """
+    email = EmailOutbox(destinatario=destinatario, oggetto=oggetto, html=html, job_id=job_id)
+    db.session.add(email)
+    return email
+
+
+def accoda_job(email, job_id=None):
+    """
+    Accoda un invio massivo con un solo INSERT multi-riga.
+    `email` è una lista di tuple (destinatario, oggetto, html); commit a carico del chiamante.
+    Con `job_id` aggiunge un altro lotto a un job già iniziato.
+    Ritorna il job_id da passare a stato_job.
+    """
+    job_id = job_id or uuid.uuid4().hex
+    if email:
+        adesso = datetime.utcnow()
+        db.session.execute(insert(EmailOutbox), [
+            {'destinatario': destinatario, 'oggetto': oggetto, 'html': html,
+             'stato': 'in_coda', 'tentativi': 0, 'prossimo_tentativo': adesso,
+             'data_creazione': adesso, 'job_id': job_id}
+            for destinatario, oggetto, html in email
+        ])
+    return job_id
+
+
+def stato_job(job_id):
+    """Avanzamento di un invio massivo: conteggi per stato (una query sull'indice job_id)"""
+    conteggi = dict(db.session.execute(
+        select(EmailOutbox.stato, func.count())
+        .where(EmailOutbox.job_id == job_id)
+        .group_by(EmailOutbox.stato)
+    ).all())
+    stato = {s: conteggi.get(s, 0) for s in ('in_coda', 'in_invio', 'inviata', 'fallita')}
+    stato['totale'] = sum(stato.values())
+    stato['completato'] = stato['in_coda'] + stato['in_invio'] == 0
+    return stato
+
+
+class _Limitatore:
+    """
+    Al massimo `al_secondo` invii al secondo in tutto il cluster, non per processo.
+    I turni di invio si prenotano sulla riga outbox_ritmo: un UPDATE sposta in avanti
+    il prossimo turno libero di `blocco` intervalli e la rilettura, nella stessa
+    transazione e con la riga bloccata, dice quali turni toccano a questo processo.
+    Una transazione ogni `blocco` email (circa un secondo di invii); i turni rimasti
+    indietro (worker fermo, outbox vuota) si scartano invece di recuperarli a raffica.
+    """
+
+    NOME = 'smtp'
+
+    def __init__(self, al_secondo):
+        self.intervallo = 1.0 / al_secondo
+        self.blocco = max(1, min(int(al_secondo), 10))
+        self._turni = []  # Istanti (time.time) prenotati e non ancora usati
+        self._lock = threading.Lock()
+
+    def _prenota(self):
+        adesso_ms = int(time.time() * 1000)
+        durata_ms = int(self.blocco * self.intervallo * 1000)
+        tabella = RitmoOutbox.__table__
+        # Connessione a parte: un commit qui non deve scadere gli oggetti della sessione del worker
+        with db.engine.begin() as conn:
+            spostato = conn.execute(
+                update(tabella)
+                .where(tabella.c.nome == self.NOME)
+                .values(prossimo_ms=case((tabella.c.prossimo_ms < adesso_ms, adesso_ms),
+                                         else_=tabella.c.prossimo_ms) + durata_ms)
+            ).rowcount
+            if spostato:
+                inizio_ms = conn.execute(
+                    select(tabella.c.prossimo_ms).where(tabella.c.nome == self.NOME)
+                ).scalar() - durata_ms
+        if not spostato:
+            try:
+                with db.engine.begin() as conn:
+                    conn.execute(insert(tabella).values(nome=self.NOME, prossimo_ms=adesso_ms + durata_ms))
+                inizio_ms = adesso_ms
+            except IntegrityError:
+                return self._prenota()  # Un altro processo ha creato la riga nel frattempo
+        return [inizio_ms / 1000 + i * self.intervallo for i in range(self.blocco)]
+
+    def attendi(self):
+        with self._lock:
+            adesso = time.time()
+            while self._turni and self._turni[0] < adesso - self.intervallo:
+                self._turni.pop(0)
+            if not self._turni:
+                self._turni = self._prenota()
+            turno = self._turni.pop(0)
+        if turno > adesso:
+            time.sleep(turno - adesso)
+
+
+class _ConnessionePersa(Exception):
+    """Il server SMTP ha chiuso la connessione: si riapre al giro successivo"""
+
+
+def _prendibile(adesso):
+    # 'in_invio' con lease scaduto = worker morto a metà lotto
+    return and_(EmailOutbox.stato.in_(('in_coda', 'in_invio')),
+                EmailOutbox.prossimo_tentativo <= adesso)
+
+
+def seleziona_lotto(adesso, limite):
+    """SELECT degli id del prossimo lotto (usata anche da verifica_piani.py)"""
+    return (select(EmailOutbox.id).where(_prendibile(adesso))
+            .order_by(EmailOutbox.id).limit(limite))
+
+
+class OutboxWorkerPool:
+    """
+    Pool di thread che svuotano la outbox. Ogni worker prende un lotto di email
+    (UPDATE condizionale con token, niente lock di tabella: va bene anche con più
+    processi), le spedisce sulla stessa connessione SMTP finché c'è lavoro e registra
+    l'esito: i worker sono un pool di connessioni SMTP persistenti, limitato in
+    totale, su tutti i processi, a OUTBOX_EMAIL_AL_SECONDO invii. Gli errori temporanei vengono ritentati
+    con backoff esponenziale, dopo OUTBOX_MAX_TENTATIVI (o con un errore 5xx)
+    l'email finisce in 'fallita'.
+    Consegna at-least-once: se un worker muore a metà lotto, dopo il lease
+    le email non confermate vengono riprese da un altro worker.
+    """
+
+    def __init__(self, app, mail):
+        self.app = app
+        self.mail = mail
+        self.num_worker = app.config.get('OUTBOX_WORKER', 2)
+        self.dimensione_lotto = app.config.get('OUTBOX_LOTTO', 50)
+        self.max_tentativi = app.config.get('OUTBOX_MAX_TENTATIVI', 6)
+        self.backoff = app.config.get('OUTBOX_BACKOFF_SECONDI', 30)
+        self.backoff_max = app.config.get('OUTBOX_BACKOFF_MAX_SECONDI', 3600)
+        self.poll = app.config.get('OUTBOX_POLL_SECONDI', 2)
+        self.lease = app.config.get('OUTBOX_LEASE_SECONDI', 300)
+        al_secondo = app.config.get('OUTBOX_EMAIL_AL_SECONDO')
+        self._limitatore = _Limitatore(al_secondo) if al_secondo else None
+        self._stop = threading.Event()
+        self._thread = []
+
+    # --- Ciclo di vita ---------------------------------------------------
+
+    def avvia(self):
+        for i in range(self.num_worker):
+            t = threading.Thread(target=self._loop, name=f'outbox-{i}', daemon=True)
+            t.start()
+            self._thread.append(t)
+
+    def ferma(self, timeout=10):
+        self._stop.set()
+        for t in self._thread:
+            t.join(timeout)
+        self._thread = []
+
+    def svuota(self):
+        """Invio sincrono finché la outbox è vuota (script e test)"""
+        totale = 0
+        with self.app.app_context():
+            while True:
+                inviate = self._drena()
+                if not inviate:
+                    return totale
+                totale += inviate
+
+    def _loop(self):
+        while not self._stop.is_set():
+            with self.app.app_context():
+                try:
+                    lavorate = self._drena()
+                except Exception as e:
+                    db.session.rollback()
+                    log.exception('Outbox worker: errore')
+                    lavorate = 0
+                finally:
+                    db.session.remove()
+            if not lavorate:
+                self._stop.wait(self.poll)
+
+    # --- Lavoro ----------------------------------------------------------
+
+    def _prendi_lotto(self):
+        adesso = datetime.utcnow()
+        ids = db.session.execute(seleziona_lotto(adesso, self.dimensione_lotto)).scalars().all()
+        if not ids:
+            db.session.rollback()
+            return []
+
+        lotto = uuid.uuid4().hex
+        db.session.execute(
+            update(EmailOutbox)
+            .where(EmailOutbox.id.in_(ids), _prendibile(adesso))
+            .values(stato='in_invio', lotto=lotto,
+                    prossimo_tentativo=adesso + timedelta(seconds=self.lease))
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        return EmailOutbox.query.filter_by(lotto=lotto).order_by(EmailOutbox.id).all()
+
+    def _drena(self):
+        """Invia lotti sulla stessa connessione SMTP finché la outbox ha lavoro"""
+        lotto = self._prendi_lotto()
+        if not lotto:
+            return 0
+
+        lavorate = 0
+        try:
+            with self.mail.connect() as conn:
+                while lotto:
+                    self._invia_lotto(conn, lotto)
+                    db.session.commit()
+                    lavorate += len(lotto)
+                    lotto = self._prendi_lotto()
+        except _ConnessionePersa:
+            db.session.commit()
+        except (smtplib.SMTPException, OSError) as e:
+            # Connessione (o chiusura) fallita: tutto il lotto corrente va ritentato
+            for email in lotto:
+                if email.stato == 'in_invio':
+                    self._registra_fallimento(email, e)
+            db.session.commit()
+        return lavorate
+
+    def _invia_lotto(self, conn, lotto):
+        for i, email in enumerate(lotto):
+            if self._limitatore:
+                self._limitatore.attendi()
+            inizio = time.perf_counter()
+            try:
+                conn.send(Message(subject=email.oggetto,
+                                  recipients=[email.destinatario],
+                                  html=email.html))
+            except smtplib.SMTPServerDisconnected as e:
+                self._registra_fallimento(email, e)
+                # Le altre del lotto tornano in coda senza consumare tentativi
+                for resto in lotto[i + 1:]:
+                    resto.stato = 'in_coda'
+                    resto.lotto = None
+                    resto.prossimo_tentativo = datetime.utcnow()
+                raise _ConnessionePersa() from e
+            except smtplib.SMTPRecipientsRefused as e:
+                self._registra_fallimento(email, e, permanente=True)
+            except smtplib.SMTPResponseException as e:
+                self._registra_fallimento(email, e, permanente=e.smtp_code >= 500)
+            except Exception as e:
+                self._registra_fallimento(email, e)
+            else:
+                email.stato = 'inviata'
+                email.lotto = None
+                email.data_invio = datetime.utcnow()
+                telemetria.email_inviate.labels('inviata').inc()
+            finally:
+                telemetria.email_secondi.observe(time.perf_counter() - inizio)
+
+    def _registra_fallimento(self, email, errore, permanente=False):
+        email.tentativi += 1
+        email.lotto = None
+        email.ultimo_errore = str(errore)[:1000]
+        if permanente or email.tentativi >= self.max_tentativi:
+            email.stato = 'fallita'  # Dead letter: serve un intervento manuale
+            telemetria.email_inviate.labels('fallita').inc()
+            log.error('Email in dead letter', extra={'email_id': email.id, 'tentativi': email.tentativi,
+                                                     'errore': str(errore)})
+        else:
+            attesa = min(self.backoff * 2 ** (email.tentativi - 1), self.backoff_max)
+            email.stato = 'in_coda'
+            email.prossimo_tentativo = datetime.utcnow() + timedelta(seconds=attesa)
+            telemetria.email_inviate.labels('ritentata').inc()
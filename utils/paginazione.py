@@ -0,0 +1,64 @@
+# utils/paginazione.py - Paginazione keyset degli eventi su (data_evento, id): niente OFFSET né COUNT
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy import and_, or_
+
+from models.evento import Evento
+
+# items: eventi della pagina; prima/dopo: cursori per la pagina precedente/successiva (None se non c'è)
+Pagina = namedtuple('Pagina', 'items prima dopo')
+
+
+def cursore(evento):
+    """Posizione di un evento nell'ordinamento, da passare come ?dopo= o ?prima="""
+    return f'{evento.data_evento:%Y%m%d%H%M%S%f}-{evento.id}'
+
+
+def leggi_cursore(testo):
+    """Cursore -> (data_evento, id); None se assente o non valido (si riparte dalla prima pagina)"""
+    try:
+        data, evento_id = testo.split('-')
+        return datetime.strptime(data, '%Y%m%d%H%M%S%f'), int(evento_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def _dopo(posizione):
+    data, evento_id = posizione
+    return or_(Evento.data_evento < data, and_(Evento.data_evento == data, Evento.id < evento_id))
+
+
+def _prima(posizione):
+    data, evento_id = posizione
+    return or_(Evento.data_evento > data, and_(Evento.data_evento == data, Evento.id > evento_id))
+
+
+def pagina_eventi(query, per_pagina=20, dopo=None, prima=None):
+    """
+    Una pagina di `query` dal più recente, ordinata su (data_evento, id) come l'indice
+    ix_eventi_data_evento_id: il costo non cresce con il numero della pagina.
+    `dopo`/`prima` sono i cursori dell'ultimo/primo evento della pagina già vista.
+    Legge per_pagina + 1 righe per sapere se c'è un'altra pagina in quella direzione.
+    """
+    indietro = leggi_cursore(prima)
+    avanti = leggi_cursore(dopo) if indietro is None else None
+
+    if indietro is not None:
+        righe = (query.filter(_prima(indietro))
+                 .order_by(Evento.data_evento.asc(), Evento.id.asc())
+                 .limit(per_pagina + 1).all())
+        altre = len(righe) > per_pagina
+        items = list(reversed(righe[:per_pagina]))
+        return Pagina(items,
+                      cursore(items[0]) if altre else None,
+                      cursore(items[-1]) if items else None)
+
+    if avanti is not None:
+        query = query.filter(_dopo(avanti))
+    righe = query.order_by(Evento.data_evento.desc(), Evento.id.desc()).limit(per_pagina + 1).all()
+    altre = len(righe) > per_pagina
+    items = righe[:per_pagina]
+    return Pagina(items,
+                  cursore(items[0]) if avanti is not None and items else None,
+                  cursore(items[-1]) if altre else None)
@@ -0,0 +1,157 @@
+# utils/partecipazioni.py - Iscrizioni/cancellazioni che mantengono eventi.num_partecipanti
+from sqlalchemy import update, select, delete, func, or_
+from sqlalchemy.exc import IntegrityError
+
+from models import db
+from models.evento import Evento
+from models.partecipazione import Partecipazione
+from models.lista_attesa import ListaAttesa
+from utils.exp import assegna_exp, storna_partecipazioni
+from utils.classifiche import aggiungi_exp_mensile, storna_exp_mensile
+
+
+def aggiorna_contatore(evento_id, delta):
+    """Incremento atomico lato DB: UPDATE eventi SET num_partecipanti = num_partecipanti + delta"""
+    db.session.execute(
+        update(Evento)
+        .where(Evento.id == evento_id)
+        .values(num_partecipanti=Evento.num_partecipanti + delta)
+    )
+
+
+class EventoCompleto(Exception):
+    """Nessun posto libero: il chiamante deve fare rollback"""
+
+
+class GiaIscritto(Exception):
+    """Partecipazione già presente (vincolo unique user_id/evento_id)"""
+
+
+def riserva_posti(evento_id, posti=1, contatore='num_partecipanti'):
+    """
+    Prenotazione atomica: UPDATE condizionale sul contatore dell'evento.
+    Blocca solo la riga dell'evento fino al commit, quindi iscrizioni
+    contemporanee allo stesso evento non possono superare max_partecipanti
+    (contando anche i posti tenuti dai checkout in corso).
+    `contatore` è 'num_partecipanti' o 'num_prenotati'.
+    Ritorna True se i posti sono stati presi.
+    """
+    colonna = getattr(Evento, contatore)
+    risultato = db.session.execute(
+        update(Evento)
+        .where(Evento.id == evento_id,
+               or_(Evento.max_partecipanti.is_(None),
+                   Evento.num_partecipanti + Evento.num_prenotati + posti <= Evento.max_partecipanti))
+        .values({colonna: colonna + posti})
+        .execution_options(synchronize_session=False)
+    )
+    return risultato.rowcount == 1
+
+
+def posti_disponibili(evento_id):
+    """
+    Posti ancora liberi (max_partecipanti - iscritti - tenuti dai checkout), leggendo la
+    riga evento con SELECT ... FOR UPDATE: fino al commit nessun altro la modifica.
+    None se l'evento non ha limite, 0 se non esiste.
+    """
+    riga = db.session.execute(
+        select(Evento.max_partecipanti, Evento.num_partecipanti, Evento.num_prenotati)
+        .where(Evento.id == evento_id)
+        .with_for_update()
+    ).first()
+    if riga is None:
+        return 0
+    if riga.max_partecipanti is None:
+        return None
+    return max(0, riga.max_partecipanti - (riga.num_partecipanti or 0) - (riga.num_prenotati or 0))
+
+
+def crea_partecipazione(user, evento):
+    """
+    Inserisce la partecipazione (posto già preso dal chiamante) e assegna l'EXP.
+    Se esiste già fa rollback e solleva GiaIscritto.
+    """
+    partecipazione = Partecipazione(
+        user_id=user.id,
+        evento_id=evento.id,
+        exp_guadagnata=evento.exp_reward
+    )
+    db.session.add(partecipazione)
+    try:
+        db.session.flush()
+    except IntegrityError:
+        db.session.rollback()
+        raise GiaIscritto(evento.id)
+
+    # Se era in lista d'attesa per questo evento non serve più
+    ListaAttesa.query.filter_by(user_id=user.id, evento_id=evento.id).delete()
+
+    assegna_exp(user.id, evento.exp_reward, 'iscrizione', evento.id)
+    aggiungi_exp_mensile(user.id, evento.exp_reward, partecipazione.data_partecipazione)
+    return partecipazione
+
+
+def iscrivi_utente(user, evento):
+    """
+    Prenota il posto, crea la partecipazione e assegna l'EXP (commit a carico del chiamante).
+    Solleva EventoCompleto o GiaIscritto; in caso di GiaIscritto la sessione è già stata
+    riportata indietro, posto compreso.
+    """
+    # Prima l'UPDATE (lock esclusivo sulla riga evento), poi l'INSERT:
+    # l'ordine inverso rischia deadlock con il lock condiviso della foreign key
+    if not riserva_posti(evento.id):
+        raise EventoCompleto(evento.id)
+
+    return crea_partecipazione(user, evento)
+
+
+def annulla_partecipazione(partecipazione, causale='annullamento'):
+    """Rimuove la partecipazione stornando l'EXP guadagnata e liberando il posto"""
+    assegna_exp(partecipazione.user_id, -(partecipazione.exp_guadagnata or 0), causale,
+                partecipazione.evento_id)
+    aggiungi_exp_mensile(partecipazione.user_id, -(partecipazione.exp_guadagnata or 0),
+                         partecipazione.data_partecipazione)
+
+    db.session.delete(partecipazione)
+    aggiorna_contatore(partecipazione.evento_id, -1)
+
+
+def rimuovi_partecipazioni(*condizioni):
+    """
+    Rimozione set-based delle partecipazioni che soddisfano `condizioni`, senza caricarle:
+    - uno storno per partecipazione su exp_ledger e un UPDATE users JOIN
+      (SELECT user_id, SUM(exp_guadagnata) ...) che toglie l'EXP e ricalcola il livello;
+    - un UPDATE per (utente, mese) sul rollup delle classifiche per periodo;
+    - un UPDATE eventi JOIN (SELECT evento_id, COUNT(*) ...) scala i contatori;
+    - un DELETE cancella le righe.
+    Commit a carico del chiamante. Ritorna il numero di partecipazioni rimosse.
+    """
+    storna_partecipazioni(*condizioni)
+    storna_exp_mensile(*condizioni)
+
+    conteggi = (select(Partecipazione.evento_id, func.count(Partecipazione.id).label('n'))
+                .where(*condizioni)
+                .group_by(Partecipazione.evento_id)
+                .subquery())
+    db.session.execute(
+        update(Evento)
+        .where(Evento.id == conteggi.c.evento_id)
+        .values(num_partecipanti=Evento.num_partecipanti - conteggi.c.n)
+        .execution_options(synchronize_session=False)
+    )
+
+    return db.session.execute(
+        delete(Partecipazione)
+        .where(*condizioni)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+
+def rimuovi_partecipazioni_utente(user_id):
+    """Tutte le partecipazioni di un utente (disiscrizione/cancellazione account)"""
+    return rimuovi_partecipazioni(Partecipazione.user_id == user_id)
+
+
+def rimuovi_partecipazioni_evento(evento_id):
+    """Tutti i partecipanti di un evento (rimozione in massa/eliminazione evento)"""
+    return rimuovi_partecipazioni(Partecipazione.evento_id == evento_id)
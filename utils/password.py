@@ -0,0 +1,97 @@
+# utils/password.py - Hash e verifica bcrypt su un pool limitato, con coda massima e costo configurabile
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import os
+import threading
+
+from models import bcrypt
+
+log = logging.getLogger('tablhero.password')
+
+# bcrypt usa solo i primi 72 byte: le versioni fino alla 4 troncavano da sole, la 5 solleva
+# ValueError. Troncare qui tiene valide le hash già salvate e accetta password fino a 128 caratteri.
+BYTE_MASSIMI = 72
+
+
+class ServizioOccupato(Exception):
+    """Troppe operazioni bcrypt in corso o in attesa: meglio rifiutare subito che accodare all'infinito"""
+
+
+def costo_hash(password_hash):
+    """'$2b$12$...' -> 12 (None se la hash non è bcrypt)"""
+    try:
+        return int(password_hash.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+class ServizioPassword:
+    """
+    bcrypt su al massimo `worker` thread (la libreria rilascia il GIL, quindi girano in
+    parallelo su core diversi) e con al massimo `coda` richieste in attesa. Una raffica
+    di login occupa così solo `worker` core: le altre richieste del processo continuano
+    a girare, e oltre la coda si risponde subito con ServizioOccupato.
+    """
+
+    def __init__(self, worker=None, coda=None, costo=12, attesa_massima=10):
+        self.configura(worker, coda, costo, attesa_massima)
+
+    def configura(self, worker=None, coda=None, costo=12, attesa_massima=10):
+        self.worker = worker or os.cpu_count() or 1
+        self.coda = self.worker * 4 if coda is None else coda
+        self.costo = costo
+        self.attesa_massima = attesa_massima
+        self._posti = threading.BoundedSemaphore(self.worker + self.coda)
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.configura(app.config.get('PASSWORD_WORKER'), app.config.get('PASSWORD_CODA'),
+                       app.config.get('BCRYPT_LOG_ROUNDS', 12), app.config.get('PASSWORD_ATTESA_SECONDI', 10))
+
+    def _esegui(self, funzione, *args):
+        posti = self._posti
+        if not posti.acquire(blocking=False):
+            raise ServizioOccupato()
+        try:
+            if self._pool is None:
+                with self._lock:
+                    if self._pool is None:
+                        self._pool = ThreadPoolExecutor(max_workers=self.worker, thread_name_prefix='bcrypt')
+            futuro = self._pool.submit(funzione, *args)
+        except BaseException:
+            posti.release()
+            raise
+        # Il posto si libera quando bcrypt ha finito, anche se il chiamante ha smesso di aspettare
+        futuro.add_done_callback(lambda _: posti.release())
+        try:
+            return futuro.result(timeout=self.attesa_massima)
+        except TimeoutError:
+            futuro.cancel()
+            raise ServizioOccupato() from None
+
+    @staticmethod
+    def _byte(password):
+        return password.encode('utf-8')[:BYTE_MASSIMI]
+
+    def hash(self, password, costo=None):
+        """Nuova hash bcrypt con il costo configurato (BCRYPT_LOG_ROUNDS)"""
+        hash_bytes = self._esegui(bcrypt.generate_password_hash, self._byte(password), costo or self.costo)
+        return hash_bytes.decode('utf-8')
+
+    def verifica(self, password_hash, password):
+        """Una sola verifica bcrypt; False anche per hash mancanti o non valide"""
+        if not password_hash or not password:
+            return False
+        try:
+            return self._esegui(bcrypt.check_password_hash, password_hash, self._byte(password))
+        except ValueError:
+            log.warning('Hash password non valida')
+            return False
+
+    def da_aggiornare(self, password_hash):
+        """La hash è stata fatta con un costo diverso da quello configurato (più alto o più basso)"""
+        return costo_hash(password_hash) != self.costo
+
+
+password_service = ServizioPassword()
@@ -0,0 +1,136 @@
+# utils/prenotazioni.py - Posti tenuti da parte durante il checkout Stripe
+from datetime import datetime, timedelta
+
+from sqlalchemy import update, delete, select, case
+from sqlalchemy.exc import IntegrityError
+
+from models import db
+from models.evento import Evento
+from models.prenotazione import PrenotazionePosto
+from utils.partecipazioni import (riserva_posti, crea_partecipazione, iscrivi_utente,
+                                  EventoCompleto)
+
+
+def crea_prenotazione(user, evento, minuti):
+    """
+    Tiene un posto per `minuti` (commit a carico del chiamante).
+    Se l'utente ha già una prenotazione per l'evento la rinnova senza occupare altri posti.
+    Solleva EventoCompleto se non ci sono posti liberi nemmeno dopo aver liberato quelli scaduti.
+    """
+    scadenza = datetime.utcnow() + timedelta(minutes=minuti)
+
+    prenotazione = PrenotazionePosto.query.filter_by(user_id=user.id, evento_id=evento.id).first()
+    if prenotazione:
+        prenotazione.scadenza = scadenza
+        return prenotazione
+
+    if not riserva_posti(evento.id, contatore='num_prenotati'):
+        # Prima di dire "completo" recupera i posti di checkout abbandonati su questo evento
+        if not libera_prenotazioni_scadute(evento.id) or \
+                not riserva_posti(evento.id, contatore='num_prenotati'):
+            raise EventoCompleto(evento.id)
+
+    prenotazione = PrenotazionePosto(user_id=user.id, evento_id=evento.id, scadenza=scadenza)
+    db.session.add(prenotazione)
+    try:
+        db.session.flush()
+    except IntegrityError:
+        # Doppio click: l'altra richiesta ha già creato la prenotazione
+        db.session.rollback()
+        prenotazione = PrenotazionePosto.query.filter_by(user_id=user.id, evento_id=evento.id).one()
+        prenotazione.scadenza = scadenza
+    return prenotazione
+
+
+def _elimina_prenotazione(prenotazione):
+    """DELETE con controllo rowcount: solo chi la elimina davvero sposta i contatori"""
+    eliminata = db.session.execute(
+        delete(PrenotazionePosto)
+        .where(PrenotazionePosto.id == prenotazione.id)
+        .execution_options(synchronize_session=False)
+    ).rowcount == 1
+    db.session.expunge(prenotazione)
+    return eliminata
+
+
+def rilascia_prenotazione(prenotazione):
+    """Libera il posto (checkout annullato/scaduto o errore Stripe)"""
+    if _elimina_prenotazione(prenotazione):
+        db.session.execute(
+            update(Evento)
+            .where(Evento.id == prenotazione.evento_id)
+            .values(num_prenotati=Evento.num_prenotati - 1)
+            .execution_options(synchronize_session=False)
+        )
+
+
+def converti_prenotazione(user, evento, stripe_session_id=None):
+    """
+    Pagamento completato: trasforma la prenotazione in partecipazione spostando
+    il posto da num_prenotati a num_partecipanti. Se la prenotazione è già stata
+    liberata dallo sweeper prova una normale iscrizione (può sollevare EventoCompleto).
+    """
+    prenotazione = None
+    if stripe_session_id:
+        prenotazione = PrenotazionePosto.query.filter_by(stripe_session_id=stripe_session_id).first()
+    if prenotazione is None:
+        prenotazione = PrenotazionePosto.query.filter_by(user_id=user.id, evento_id=evento.id).first()
+
+    if prenotazione is not None and _elimina_prenotazione(prenotazione):
+        db.session.execute(
+            update(Evento)
+            .where(Evento.id == evento.id)
+            .values(num_prenotati=Evento.num_prenotati - 1,
+                    num_partecipanti=Evento.num_partecipanti + 1)
+            .execution_options(synchronize_session=False)
+        )
+        return crea_partecipazione(user, evento)
+
+    return iscrivi_utente(user, evento)
+
+
+def _libera_prenotazioni(*condizioni, limite=None):
+    """
+    Elimina in blocco le prenotazioni che soddisfano `condizioni` e restituisce i posti
+    con un solo UPDATE ... CASE sugli eventi coinvolti (commit a carico del chiamante).
+    Ritorna il numero di posti liberati.
+    """
+    query = (select(PrenotazionePosto.id, PrenotazionePosto.evento_id)
+             .where(*condizioni)
+             .with_for_update())
+    if limite:
+        query = query.limit(limite)
+
+    righe = db.session.execute(query).all()
+    if not righe:
+        return 0
+
+    posti_per_evento = {}
+    for _, ev_id in righe:
+        posti_per_evento[ev_id] = posti_per_evento.get(ev_id, 0) + 1
+
+    db.session.execute(
+        delete(PrenotazionePosto)
+        .where(PrenotazionePosto.id.in_([r.id for r in righe]))
+        .execution_options(synchronize_session=False)
+    )
+    db.session.execute(
+        update(Evento)
+        .where(Evento.id.in_(posti_per_evento))
+        .values(num_prenotati=Evento.num_prenotati - case(posti_per_evento, value=Evento.id, else_=0))
+        .execution_options(synchronize_session=False)
+    )
+    return len(righe)
+
+
+def libera_prenotazioni_scadute(evento_id=None, limite=1000):
+    """Sweeper: recupera i posti dei checkout abbandonati (tutti gli eventi o uno solo)"""
+    condizioni = [PrenotazionePosto.scadenza < datetime.utcnow()]
+    if evento_id is not None:
+        condizioni.append(PrenotazionePosto.evento_id == evento_id)
+    return _libera_prenotazioni(*condizioni, limite=limite)
+
+
+def rilascia_prenotazioni_utente(user_id):
+    """Da chiamare prima di eliminare un utente"""
+    return _libera_prenotazioni(PrenotazionePosto.user_id == user_id)
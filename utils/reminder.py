@@ -0,0 +1,52 @@
+# utils/reminder.py - Reminder eventi: destinatari in una query, invio tramite outbox
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+
+from models import db
+from models.user import User
+from models.evento import Evento
+from models.partecipazione import Partecipazione
+from utils.outbox import accoda_job
+
+
+def _destinatari(*condizioni):
+    """Partecipanti degli eventi selezionati: un'unica JOIN invece di un lazy load per riga"""
+    return db.session.execute(
+        select(User.email, User.nome, Evento.titolo, Evento.data_evento)
+        .join(Partecipazione, Partecipazione.user_id == User.id)
+        .join(Evento, Evento.id == Partecipazione.evento_id)
+        .where(*condizioni)
+        .order_by(Evento.id, User.id)
+    ).all()
+
+
+def accoda_reminder(*condizioni, automatico=False):
+    """
+    Accoda i reminder per gli eventi che soddisfano `condizioni` come un job outbox
+    (commit a carico del chiamante). L'invio lo fanno i worker outbox, con le loro
+    connessioni SMTP persistenti e il limite OUTBOX_EMAIL_AL_SECONDO.
+    Ritorna (job_id, numero di email accodate).
+    """
+    email = []
+    for r in _destinatari(*condizioni):
+        data = r.data_evento.strftime("%d/%m/%Y alle %H:%M")
+        if automatico:
+            html = (f'<h2>Reminder Evento Automatico</h2><p>Ciao {r.nome},<br><strong>{r.titolo}</strong> '
+                    f'è domani {data}!</p><p>Non mancare! 🎲</p>')
+        else:
+            html = (f'<h2>Reminder Evento</h2><p>Ciao {r.nome},<br><strong>{r.titolo}</strong> '
+                    f'è domani {data}!</p><a href="[link]">Dettagli</a>')
+        email.append((r.email, f'Reminder: {r.titolo} domani! - TableHero', html))
+
+    return accoda_job(email), len(email)
+
+
+def accoda_reminder_domani():
+    """Job giornaliero: reminder per tutti gli eventi di domani"""
+    domani = datetime.utcnow() + timedelta(days=1)
+    domani_inizio = datetime(domani.year, domani.month, domani.day, 0, 0, 0)
+    domani_fine = datetime(domani.year, domani.month, domani.day, 23, 59, 59)
+    return accoda_reminder(Evento.data_evento >= domani_inizio,
+                           Evento.data_evento <= domani_fine,
+                           automatico=True)
@@ -0,0 +1,263 @@
+# utils/scheduler.py - Scheduler unico per cluster: leader eletto su DB, job store persistente, registro esecuzioni
+import atexit
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
+from sqlalchemy import update, delete, or_
+from sqlalchemy.exc import IntegrityError
+
+from models import db
+from models.scheduler import LeaderScheduler, EsecuzioneJob
+from utils.prenotazioni import libera_prenotazioni_scadute
+from utils.reminder import accoda_reminder_domani
+from utils.exp import compatta_registro, riconcilia
+from utils.membership import scadi_membership, accoda_avvisi_scadenza
+from utils.telemetria import telemetria
+
+ISTANZA = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}'
+NOME_LEADER = 'scheduler'
+
+log = logging.getLogger('tablhero.scheduler')
+
+# I job persistiti sono riferimenti testuali a funzioni di modulo: l'app la prendono da qui
+_app = None
+
+
+# --- Job -----------------------------------------------------------------
+
+def job_reminder():
+    """Accoda i reminder automatici per gli eventi di domani (alle 9:00)"""
+    job_id, totale = accoda_reminder_domani()
+    db.session.commit()
+    log.info('Reminder accodati', extra={'totale': totale, 'job_id': job_id})
+
+
+def job_prenotazioni_scadute():
+    """Libera in blocco i posti dei checkout Stripe abbandonati"""
+    liberati = libera_prenotazioni_scadute()
+    db.session.commit()
+    if liberati:
+        log.info('Posti liberati da prenotazioni scadute', extra={'liberati': liberati})
+
+
+def job_pulizia_registro():
+    """Il registro esecuzioni serve solo per deduplicare: tiene 30 giorni di storia"""
+    db.session.execute(
+        delete(EsecuzioneJob)
+        .where(EsecuzioneJob.inizio < datetime.utcnow() - timedelta(days=30))
+    )
+    db.session.commit()
+
+
+def job_registro_exp():
+    """
+    Fonde per mese i movimenti EXP più vecchi di EXP_COMPATTAZIONE_GIORNI e
+    riallinea users.tabl_exp alla somma del registro, segnalando la deriva trovata
+    """
+    prima_di = datetime.utcnow() - timedelta(days=_app.config['EXP_COMPATTAZIONE_GIORNI'])
+    fusi, scritti = compatta_registro(prima_di)
+    deriva = riconcilia(correggi=True)
+    db.session.commit()
+
+    if fusi:
+        log.info('Registro EXP compattato', extra={'fusi': fusi, 'righe': scritti})
+    if deriva:
+        log.warning('Deriva EXP corretta', extra={
+            'utenti': len(deriva),
+            'esempi': [{'user_id': u, 'tabl_exp': t, 'registro': s} for u, t, s in deriva[:20]],
+        })
+
+
+def job_membership():
+    """Chiude in blocco le membership scadute e accoda gli avvisi di scadenza imminente"""
+    adesso = datetime.utcnow()
+    job_id, avvisi = accoda_avvisi_scadenza(_app.config['MEMBERSHIP_AVVISI_GIORNI'], adesso)
+    scadute = scadi_membership(adesso)
+    db.session.commit()
+    log.info('Membership aggiornate', extra={'scadute': scadute, 'avvisi': avvisi, 'job_id': job_id})
+
+
+# id: (funzione, trigger, durata slot in secondi, descrizione)
+JOBS = {
+    'daily_reminder': (job_reminder, CronTrigger(hour=9, timezone='Europe/Rome'),
+                       86400, 'Invio reminder eventi giornaliero'),
+    'prenotazioni_scadute': (job_prenotazioni_scadute, IntervalTrigger(minutes=1),
+                             60, 'Pulizia prenotazioni posti scadute'),
+    'pulizia_registro_job': (job_pulizia_registro, CronTrigger(hour=4, timezone='Europe/Rome'),
+                             86400, 'Pulizia registro esecuzioni job'),
+    'registro_exp': (job_registro_exp, CronTrigger(hour=3, minute=30, timezone='Europe/Rome'),
+                     86400, 'Compattazione e riconciliazione registro EXP'),
+    'membership_scadute': (job_membership, CronTrigger(hour=2, timezone='Europe/Rome'),
+                           86400, 'Scadenza membership e avvisi di rinnovo'),
+}
+
+
+def esegui_job(job_id):
+    """
+    Esegue un job al massimo una volta per slot in tutto il cluster: la riga
+    (job_id, slot) nel registro fa da lock, chi non riesce a inserirla salta.
+    Se il processo muore a metà il job resta 'in_corso' e non viene ripetuto.
+    """
+    funzione, _, durata_slot, _ = JOBS[job_id]
+    inizio_slot = int(time.time() // durata_slot) * durata_slot
+    slot = datetime.utcfromtimestamp(inizio_slot).strftime('%Y-%m-%dT%H:%M')
+
+    with _app.app_context():
+        try:
+            esecuzione = EsecuzioneJob(job_id=job_id, slot=slot, istanza=ISTANZA)
+            db.session.add(esecuzione)
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            log.info('Job già eseguito per lo slot', extra={'job': job_id, 'slot': slot})
+            return
+
+        esito, errore = 'ok', None
+        inizio = time.perf_counter()
+        try:
+            funzione()
+        except Exception as e:
+            db.session.rollback()
+            esito, errore = 'errore', str(e)
+            log.exception('Job fallito', extra={'job': job_id})
+        telemetria.job_secondi.labels(job_id, esito).observe(time.perf_counter() - inizio)
+
+        db.session.execute(
+            update(EsecuzioneJob)
+            .where(EsecuzioneJob.id == esecuzione.id)
+            .values(esito=esito, errore=errore, fine=datetime.utcnow())
+        )
+        db.session.commit()
+        db.session.remove()
+
+
+# --- Elezione del leader -------------------------------------------------
+
+def prendi_lease(nome, secondi):
+    """
+    Prende o rinnova il lease `nome` per questo processo con un UPDATE condizionale
+    (riuscito solo se il lease è già nostro o è scaduto). Ritorna True se siamo leader.
+    """
+    adesso = datetime.utcnow()
+    scadenza = adesso + timedelta(seconds=secondi)
+
+    preso = db.session.execute(
+        update(LeaderScheduler)
+        .where(LeaderScheduler.nome == nome,
+               or_(LeaderScheduler.istanza == ISTANZA, LeaderScheduler.scadenza < adesso))
+        .values(istanza=ISTANZA, scadenza=scadenza)
+    ).rowcount == 1
+
+    if not preso:
+        # Prima esecuzione in assoluto: la riga non esiste ancora
+        db.session.add(LeaderScheduler(nome=nome, istanza=ISTANZA, scadenza=scadenza))
+        try:
+            db.session.flush()
+        except IntegrityError:
+            db.session.rollback()
+            return False
+    db.session.commit()
+    return True
+
+
+def rilascia_lease(nome):
+    """Lascia subito il posto invece di far aspettare la scadenza del lease"""
+    db.session.execute(
+        update(LeaderScheduler)
+        .where(LeaderScheduler.nome == nome, LeaderScheduler.istanza == ISTANZA)
+        .values(scadenza=datetime.utcnow())
+    )
+    db.session.commit()
+
+
+class SchedulerCluster:
+    """
+    Ogni processo (worker gunicorn, reloader di debug...) crea un SchedulerCluster,
+    ma solo il leader avvia APScheduler. La leadership è un lease su una riga di
+    scheduler_leader, preso e rinnovato con un UPDATE condizionale a ogni heartbeat:
+    se il leader muore, allo scadere del lease subentra un altro processo.
+    I job stanno in un job store su DB, così il nuovo leader ritrova i prossimi
+    orari di esecuzione e recupera quelli mancati (misfire_grace_time).
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.lease = app.config.get('SCHEDULER_LEASE_SECONDI', 60)
+        self.heartbeat = app.config.get('SCHEDULER_HEARTBEAT_SECONDI', 20)
+        self.scheduler = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def is_leader(self):
+        return self.scheduler is not None
+
+    def avvia(self):
+        global _app
+        _app = self.app
+        self._thread = threading.Thread(target=self._loop, name='scheduler-leader', daemon=True)
+        self._thread.start()
+        atexit.register(self.ferma)
+
+    def ferma(self):
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        if self.scheduler:
+            self._ferma_scheduler()
+            with self.app.app_context():
+                rilascia_lease(NOME_LEADER)
+
+    def _loop(self):
+        while not self._stop.is_set():
+            with self.app.app_context():
+                try:
+                    leader = prendi_lease(NOME_LEADER, self.lease)
+                    if leader and self.scheduler is None:
+                        self._avvia_scheduler()
+                except Exception as e:
+                    db.session.rollback()
+                    log.exception('Scheduler: heartbeat fallito')
+                    leader = False
+                finally:
+                    db.session.remove()
+            if not leader and self.scheduler is not None:
+                log.warning('Scheduler: leadership persa', extra={'istanza': ISTANZA})
+                self._ferma_scheduler()
+            self._stop.wait(self.heartbeat)
+
+    def _avvia_scheduler(self):
+        scheduler = BackgroundScheduler(
+            jobstores={'default': SQLAlchemyJobStore(engine=db.engine, tablename='apscheduler_jobs')},
+            job_defaults={'coalesce': True, 'misfire_grace_time': 3600},
+            timezone='Europe/Rome'
+        )
+        # In pausa finché i job non sono allineati con quelli salvati
+        scheduler.start(paused=True)
+        for job_id, (_, trigger, _, descrizione) in JOBS.items():
+            salvato = scheduler.get_job(job_id)
+            if salvato is None or str(salvato.trigger) != str(trigger):
+                scheduler.add_job(esegui_job, trigger=trigger, args=[job_id], id=job_id,
+                                  name=descrizione, replace_existing=True)
+        for salvato in scheduler.get_jobs():
+            if salvato.id not in JOBS:
+                salvato.remove()
+        scheduler.resume()
+
+        self.scheduler = scheduler
+        log.info('Scheduler avviato (leader)', extra={'istanza': ISTANZA, 'job': sorted(JOBS)})
+
+    def _ferma_scheduler(self):
+        try:
+            self.scheduler.shutdown(wait=False)
+        finally:
+            self.scheduler = None
@@ -0,0 +1,61 @@
+# utils/smtp_sink.py - Server SMTP locale per provare la outbox senza spedire email vere
+#
+# Richiede aiosmtpd (solo sviluppo): pip install aiosmtpd
+import random
+import threading
+import time
+
+
+class SmtpSink:
+    """
+    Server SMTP in un thread che accetta tutto e tiene i messaggi in memoria.
+    `latenza` (secondi per messaggio) e `tasso_errori` (0..1, risposta 451)
+    simulano un provider lento o instabile per misurare retry e backoff.
+    """
+
+    def __init__(self, host='127.0.0.1', port=8025, latenza=0.0, tasso_errori=0.0):
+        try:
+            from aiosmtpd.controller import Controller
+        except ImportError:
+            raise RuntimeError("SmtpSink richiede aiosmtpd: pip install aiosmtpd")
+
+        self.host = host
+        self.port = port
+        self.latenza = latenza
+        self.tasso_errori = tasso_errori
+        self.messaggi = []
+        self.connessioni = 0
+        self.rifiutati = 0
+        self._lock = threading.Lock()
+        self._controller = Controller(self, hostname=host, port=port)
+
+    # Hook aiosmtpd
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        with self._lock:
+            self.connessioni += 1
+        session.host_name = hostname
+        return responses
+
+    async def handle_DATA(self, server, session, envelope):
+        if self.latenza:
+            time.sleep(self.latenza)  # Blocca il loop come farebbe un server lento
+        if self.tasso_errori and random.random() < self.tasso_errori:
+            with self._lock:
+                self.rifiutati += 1
+            return '451 Errore temporaneo simulato'
+        with self._lock:
+            self.messaggi.append((envelope.rcpt_tos, envelope.content))
+        return '250 OK'
+
+    def avvia(self):
+        self._controller.start()
+        return self
+
+    def ferma(self):
+        self._controller.stop()
+
+    def __enter__(self):
+        return self.avvia()
+
+    def __exit__(self, *exc):
+        self.ferma()
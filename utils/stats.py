@@ -0,0 +1,141 @@
+# utils/stats.py - Contatori aggregati per homepage, pannello admin e statistiche
+from datetime import datetime, timedelta
+import threading
+import time
+
+from sqlalchemy import event, func, case, inspect, select
+from sqlalchemy.orm import Session
+
+from models import db
+from models.user import User
+from models.evento import Evento
+from models.partecipazione import Partecipazione
+
+LIVELLI = ['bronzo', 'argento', 'oro', 'platino', 'diamante']
+
+# Campi che, se modificati, cambiano i contatori
+_CAMPI_USER = ('ruolo', 'attivo', 'livello', 'email_verificata')
+_CAMPI_EVENTO = ('data_evento',)
+
+
+class StatsService:
+    """
+    Calcola tutti i contatori con una sola query GROUP BY per tabella
+    (aggregati condizionali) e li tiene in cache per `ttl` secondi.
+    Le scritture che cambiano ruolo, stato, livello o partecipazioni la invalidano.
+    """
+
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._dati = None
+        self._calcolati_il = None
+
+    def get(self):
+        with self._lock:
+            if self._dati is None or time.monotonic() - self._calcolati_il > self.ttl:
+                self._dati = self._calcola()
+                self._calcolati_il = time.monotonic()
+            return self._dati
+
+    def invalida(self):
+        with self._lock:
+            self._dati = None
+
+    def _calcola(self):
+        adesso = datetime.utcnow()
+        da_30gg = adesso - timedelta(days=30)
+
+        # 1 query su users: una riga per combinazione ruolo/attivo/livello/verificata
+        righe_utenti = db.session.execute(
+            select(User.ruolo, User.attivo, User.livello, User.email_verificata,
+                   func.count(User.id),
+                   func.sum(case((User.data_registrazione >= da_30gg, 1), else_=0)))
+            .group_by(User.ruolo, User.attivo, User.livello, User.email_verificata)
+        ).all()
+
+        utenti = {
+            'totale': 0,
+            'attivi': 0,
+            'attivi_verificati': 0,
+            'nuovi_30gg_attivi': 0,
+            'per_ruolo': {},
+            'per_ruolo_attivi': {},
+            'per_livello': dict.fromkeys(LIVELLI, 0),
+        }
+        for ruolo, attivo, livello, verificata, n, nuovi in righe_utenti:
+            utenti['totale'] += n
+            utenti['per_ruolo'][ruolo] = utenti['per_ruolo'].get(ruolo, 0) + n
+            if livello in utenti['per_livello']:
+                utenti['per_livello'][livello] += n
+            if attivo:
+                utenti['attivi'] += n
+                utenti['per_ruolo_attivi'][ruolo] = utenti['per_ruolo_attivi'].get(ruolo, 0) + n
+                utenti['nuovi_30gg_attivi'] += int(nuovi or 0)
+                if verificata:
+                    utenti['attivi_verificati'] += n
+
+        # 1 query su eventi
+        totale_eventi, prossimi = db.session.execute(
+            select(func.count(Evento.id),
+                   func.sum(case((Evento.data_evento > adesso, 1), else_=0)))
+        ).one()
+        totale_eventi, prossimi = totale_eventi or 0, int(prossimi or 0)
+
+        # 1 query su partecipazioni
+        totale_partecipazioni = db.session.execute(
+            select(func.count(Partecipazione.id))
+        ).scalar() or 0
+
+        return {
+            'utenti': utenti,
+            'eventi': {
+                'totale': totale_eventi,
+                'prossimi': prossimi,
+                'passati': totale_eventi - prossimi,
+            },
+            'partecipazioni': {'totale': totale_partecipazioni},
+        }
+
+
+stats_service = StatsService()
+
+
+# --- Invalidazione automatica al commit ---
+
+def _modificato(obj, campi):
+    stato = inspect(obj)
+    return any(stato.attrs[campo].history.has_changes() for campo in campi)
+
+
+@event.listens_for(Session, 'after_flush')
+def _controlla_modifiche(session, flush_context):
+    if session.info.get('stats_da_invalidare'):
+        return
+    for obj in list(session.new) + list(session.deleted):
+        if isinstance(obj, (User, Evento, Partecipazione)):
+            session.info['stats_da_invalidare'] = True
+            return
+    for obj in session.dirty:
+        if ((isinstance(obj, User) and _modificato(obj, _CAMPI_USER)) or
+                (isinstance(obj, Evento) and _modificato(obj, _CAMPI_EVENTO))):
+            session.info['stats_da_invalidare'] = True
+            return
+
+
+@event.listens_for(Session, 'after_bulk_update')
+@event.listens_for(Session, 'after_bulk_delete')
+def _operazione_bulk(context):
+    if context.mapper.class_ in (User, Evento, Partecipazione):
+        context.session.info['stats_da_invalidare'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalida_al_commit(session):
+    if session.info.pop('stats_da_invalidare', False):
+        stats_service.invalida()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _scarta(session):
+    session.info.pop('stats_da_invalidare', None)
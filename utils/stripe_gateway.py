@@ -0,0 +1,147 @@
+# utils/stripe_gateway.py - Accesso a Stripe: client HTTP condiviso, cache prezzi, riuso checkout e customer
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import requests
+import stripe
+from requests.adapters import HTTPAdapter
+from sqlalchemy import delete
+from sqlalchemy.exc import IntegrityError
+
+from models import db
+from models.stripe_cache import PrezzoStripe, CheckoutStripe
+from utils.telemetria import telemetria, risorsa_stripe
+
+# Cache in processo chiave -> price_id (i Price Stripe sono immutabili: non scade mai)
+_prezzi = {}
+_lock = threading.Lock()
+
+
+class _ClientStripe(stripe.RequestsClient):
+    """RequestsClient su una sola Session keep-alive condivisa, con conteggio chiamate"""
+
+    chiamate = 0
+    secondi = 0.0
+
+    def request(self, method, url, headers, post_data=None):
+        inizio = time.perf_counter()
+        try:
+            return super().request(method, url, headers, post_data)
+        finally:
+            durata = time.perf_counter() - inizio
+            with _lock:
+                _ClientStripe.chiamate += 1
+                _ClientStripe.secondi += durata
+            telemetria.stripe_secondi.labels(method.upper(), risorsa_stripe(url)).observe(durata)
+
+
+def configura_stripe(app):
+    """Una volta in create_app: chiave, pool di connessioni e (per i test) server Stripe locale"""
+    stripe.api_key = app.config['STRIPE_SECRET_KEY']
+    stripe.max_network_retries = 2  # La libreria aggiunge una Idempotency-Key ai POST ritentati
+
+    if app.config.get('STRIPE_API_BASE'):
+        stripe.api_base = app.config['STRIPE_API_BASE']  # es. stripe-mock su http://localhost:12111
+
+    sessione = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=app.config.get('STRIPE_HTTP_POOL', 10))
+    sessione.mount('https://', adapter)
+    sessione.mount('http://', adapter)
+    stripe.default_http_client = _ClientStripe(session=sessione, timeout=app.config.get('STRIPE_TIMEOUT', 30))
+
+
+def statistiche_api():
+    """Chiamate HTTP a Stripe fatte da questo processo e tempo totale speso"""
+    return {'chiamate': _ClientStripe.chiamate, 'secondi': _ClientStripe.secondi}
+
+
+def prezzo(chiave, nome, importo):
+    """
+    Price id per `chiave` (che deve includere l'importo: un Price non cambia mai).
+    Ordine: cache in processo, tabella stripe_prezzi, infine un'unica chiamata
+    Product.create con default_price_data.
+    """
+    price_id = _prezzi.get(chiave)
+    if price_id:
+        return price_id
+
+    salvato = PrezzoStripe.query.filter_by(chiave=chiave).first()
+    if salvato is None:
+        prodotto = stripe.Product.create(
+            name=nome,
+            default_price_data={'currency': 'eur', 'unit_amount': importo},
+            metadata={'chiave': chiave},
+        )
+        salvato = PrezzoStripe(chiave=chiave, importo=importo, product_id=prodotto.id,
+                               price_id=prodotto.default_price)
+        try:
+            with db.session.begin_nested():
+                db.session.add(salvato)
+        except IntegrityError:
+            # Creato in parallelo da un'altra richiesta: vale il suo
+            salvato = PrezzoStripe.query.filter_by(chiave=chiave).one()
+
+    _prezzi[chiave] = salvato.price_id
+    return salvato.price_id
+
+
+def crea_checkout(chiave, price_id, importo, success_url, cancel_url, metadata,
+                  user=None, email=None, scadenza=None):
+    """
+    Sessione di checkout per un acquisto. Se per la stessa `chiave` ce n'è già una
+    aperta con lo stesso importo (doppio click, pagina ricaricata) riusa quella.
+    Con `user` usa il suo customer Stripe; altrimenti chiede a Stripe di crearlo,
+    così il webhook può salvarlo in User.stripe_customer_id. Commit a carico del chiamante.
+    Ritorna (session_id, url).
+    """
+    margine = timedelta(minutes=5)
+    aperta = CheckoutStripe.query.filter_by(chiave=chiave).first()
+    if aperta and aperta.importo == importo and aperta.scadenza > datetime.utcnow() + margine:
+        return aperta.session_id, aperta.url
+
+    # Stripe accetta expires_at tra 30 minuti e 24 ore
+    if scadenza is None:
+        scadenza = datetime.utcnow() + timedelta(minutes=60)
+
+    parametri = {}
+    if user is not None and user.stripe_customer_id:
+        parametri['customer'] = user.stripe_customer_id
+    else:
+        parametri['customer_email'] = email or user.email
+        parametri['customer_creation'] = 'always'
+
+    session = stripe.checkout.Session.create(
+        payment_method_types=['card'],
+        line_items=[{'price': price_id, 'quantity': 1}],
+        mode='payment',
+        success_url=success_url,
+        cancel_url=cancel_url,
+        expires_at=int(scadenza.replace(tzinfo=timezone.utc).timestamp()),
+        metadata=metadata,
+        **parametri
+    )
+
+    if aperta is None:
+        try:
+            with db.session.begin_nested():
+                db.session.add(CheckoutStripe(chiave=chiave, importo=importo, session_id=session.id,
+                                              url=session.url, scadenza=scadenza))
+            return session.id, session.url
+        except IntegrityError:
+            # Doppio click arrivato in parallelo: vince l'ultima sessione creata
+            aperta = CheckoutStripe.query.filter_by(chiave=chiave).one()
+    aperta.importo = importo
+    aperta.session_id = session.id
+    aperta.url = session.url
+    aperta.scadenza = scadenza
+    return session.id, session.url
+
+
+def chiudi_checkout(session_id):
+    """Sessione pagata o scaduta: non va più riproposta (dal worker webhook)"""
+    db.session.execute(
+        delete(CheckoutStripe)
+        .where(CheckoutStripe.session_id == session_id)
+        .execution_options(synchronize_session=False)
+    )
@@ -0,0 +1,89 @@
+# utils/stripe_locale.py - Finto server API Stripe per misurare i checkout senza chiamare Stripe
+#
+# Risponde solo agli endpoint usati da utils/stripe_gateway.py. Per test più fedeli
+# si può usare stripe-mock (https://github.com/stripe/stripe-mock) con STRIPE_API_BASE.
+import json
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+
+class StripeLocale:
+    """
+    Server HTTP in un thread: POST /v1/products e /v1/checkout/sessions.
+    `latenza` (secondi) simula il round trip verso api.stripe.com;
+    `richieste` conta le chiamate per endpoint, `connessioni` le connessioni TCP aperte.
+    """
+
+    def __init__(self, host='127.0.0.1', port=12111, latenza=0.0):
+        self.latenza = latenza
+        self.richieste = Counter()
+        self.connessioni = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._crea_handler())
+        self._server.daemon_threads = True
+        self.url = f'http://{host}:{port}'
+
+    def _crea_handler(self):
+        finto = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # Keep-alive: una connessione per client
+
+            def setup(self):
+                super().setup()
+                with finto._lock:
+                    finto.connessioni += 1
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                lunghezza = int(self.headers.get('Content-Length', 0))
+                dati = parse_qs(self.rfile.read(lunghezza).decode())
+                with finto._lock:
+                    finto.richieste[self.path] += 1
+                if finto.latenza:
+                    time.sleep(finto.latenza)
+
+                if self.path == '/v1/products':
+                    corpo = {'id': f'prod_{uuid.uuid4().hex[:14]}', 'object': 'product',
+                             'name': dati.get('name', [''])[0],
+                             'default_price': f'price_{uuid.uuid4().hex[:14]}'}
+                elif self.path == '/v1/checkout/sessions':
+                    session_id = f'cs_test_{uuid.uuid4().hex}'
+                    corpo = {'id': session_id, 'object': 'checkout.session',
+                             'url': f'{finto.url}/pay/{session_id}',
+                             'expires_at': int(dati.get('expires_at', ['0'])[0])}
+                else:
+                    self._rispondi(404, {'error': {'message': f'{self.path} non simulato'}})
+                    return
+                self._rispondi(200, corpo)
+
+            def _rispondi(self, stato, corpo):
+                testo = json.dumps(corpo).encode()
+                self.send_response(stato)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(testo)))
+                self.send_header('Request-Id', f'req_{uuid.uuid4().hex[:14]}')
+                self.end_headers()
+                self.wfile.write(testo)
+
+        return Handler
+
+    def avvia(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def ferma(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.avvia()
+
+    def __exit__(self, *exc):
+        self.ferma()
@@ -0,0 +1,181 @@
+# utils/telemetria.py - Metriche Prometheus: richieste, pool DB, email, Stripe, job dello scheduler e webhook
+#
+# Serve prometheus-client (pip install prometheus-client) e METRICHE_PROMETHEUS=True.
+# Con più processi (gunicorn) PROMETHEUS_MULTIPROC_DIR deve puntare a una cartella vuota
+# prima dell'avvio: ogni processo scrive i suoi valori su file mmap e /metrics li somma.
+# Nel gunicorn.conf.py del deploy:
+#     def child_exit(server, worker):
+#         from prometheus_client import multiprocess
+#         multiprocess.mark_process_dead(worker.pid)
+import logging
+import os
+import re
+import time
+from urllib.parse import urlsplit
+
+from flask import Response, abort, g, request
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+
+try:
+    import prometheus_client
+    from prometheus_client import multiprocess
+except ImportError:
+    prometheus_client = None
+
+BUCKET_RICHIESTE = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BUCKET_ATTESA_DB = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30)
+BUCKET_JOB = (0.1, 0.5, 1, 5, 15, 60, 300, 900, 3600)
+BUCKET_RITARDO_WEBHOOK = (0.5, 1, 2, 5, 10, 30, 60, 300, 900, 3600)
+
+# /v1/checkout/sessions/cs_test_a1B2 -> /v1/checkout/sessions/{id}: etichette a cardinalità fissa
+_ID_STRIPE = re.compile(r'/[a-z]+_[A-Za-z0-9_]+')
+
+log = logging.getLogger('tablhero.telemetria')
+
+
+class _Spenta:
+    """Metrica finta usata quando le metriche sono disattivate: ogni chiamata è un no-op"""
+
+    def labels(self, *args, **kwargs):
+        return self
+
+    def observe(self, valore):
+        pass
+
+    def inc(self, valore=1):
+        pass
+
+    def set(self, valore):
+        pass
+
+
+_SPENTA = _Spenta()
+
+
+class Telemetria:
+    """
+    Le metriche come attributi: finché attiva() non viene chiamata sono tutte _Spenta,
+    così i punti di misura sparsi nel codice non controllano nulla e non costano nulla.
+    """
+
+    def __init__(self):
+        self.attiva = False
+        self.richieste = self.db_attesa = self.db_connessioni = _SPENTA
+        self.email_inviate = self.email_secondi = self.stripe_secondi = _SPENTA
+        self.job_secondi = self.webhook_ritardo = _SPENTA
+
+    def attiva_metriche(self):
+        if self.attiva:
+            return  # Una sola registrazione per processo (create_app può essere chiamata più volte)
+        from prometheus_client import Counter, Gauge, Histogram
+
+        self.richieste = Histogram(
+            'tablhero_richiesta_secondi', 'Durata delle richieste HTTP per endpoint',
+            ['endpoint', 'metodo', 'stato'], buckets=BUCKET_RICHIESTE)
+        self.db_attesa = Histogram(
+            'tablhero_db_checkout_attesa_secondi', 'Attesa per avere una connessione dal pool',
+            buckets=BUCKET_ATTESA_DB)
+        self.db_connessioni = Gauge(
+            'tablhero_db_pool_connessioni', 'Connessioni del pool per stato (somma dei processi vivi)',
+            ['stato'], multiprocess_mode='livesum')
+        self.email_inviate = Counter(
+            'tablhero_email_totale', 'Email della outbox per esito', ['esito'])
+        self.email_secondi = Histogram(
+            'tablhero_email_invio_secondi', 'Durata dell\'invio SMTP di una email')
+        self.stripe_secondi = Histogram(
+            'tablhero_stripe_chiamata_secondi', 'Durata delle chiamate HTTP a Stripe',
+            ['metodo', 'risorsa'])
+        self.job_secondi = Histogram(
+            'tablhero_job_secondi', 'Durata dei job dello scheduler', ['job', 'esito'],
+            buckets=BUCKET_JOB)
+        self.webhook_ritardo = Histogram(
+            'tablhero_webhook_ritardo_secondi', 'Dalla ricezione del webhook Stripe alla sua elaborazione',
+            buckets=BUCKET_RITARDO_WEBHOOK)
+        self.attiva = True
+
+
+telemetria = Telemetria()
+
+
+def risorsa_stripe(url):
+    """URL dell'API Stripe -> percorso senza id, da usare come etichetta"""
+    return _ID_STRIPE.sub('/{id}', urlsplit(url).path)
+
+
+class QueuePoolMisurato(QueuePool):
+    """QueuePool che misura l'attesa del checkout e pubblica connessioni in uso e libere"""
+
+    def _do_get(self):
+        inizio = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            telemetria.db_attesa.observe(time.perf_counter() - inizio)
+            self._pubblica()
+
+    def _do_return_conn(self, record):
+        super()._do_return_conn(record)
+        self._pubblica()
+
+    def _pubblica(self):
+        telemetria.db_connessioni.labels('in_uso').set(self.checkedout())
+        telemetria.db_connessioni.labels('libere').set(self.checkedin())
+
+
+def _usa_pool_misurato(app):
+    """Il pool misurato va scelto prima di db.init_app; SQLite in memoria resta su StaticPool"""
+    url = make_url(app.config['SQLALCHEMY_DATABASE_URI'])
+    if url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:'):
+        return
+    opzioni = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    opzioni.setdefault('poolclass', QueuePoolMisurato)
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = opzioni
+
+
+def configura_telemetria(app):
+    """
+    Da chiamare in create_app prima di db.init_app. Con METRICHE_PROMETHEUS spento (o
+    prometheus-client non installato) non registra nulla: niente hook, niente /metrics.
+    """
+    if not app.config.get('METRICHE_PROMETHEUS'):
+        return
+    if prometheus_client is None:
+        log.warning('METRICHE_PROMETHEUS attivo ma prometheus-client non è installato: metriche disattivate')
+        return
+
+    telemetria.attiva_metriche()
+    _usa_pool_misurato(app)
+
+    @app.before_request
+    def _inizio_richiesta():
+        g._inizio_richiesta = time.perf_counter()
+
+    @app.after_request
+    def _misura_richiesta(response):
+        inizio = g.pop('_inizio_richiesta', None)
+        if inizio is not None:
+            telemetria.richieste.labels(request.endpoint or 'sconosciuto', request.method,
+                                        str(response.status_code)).observe(time.perf_counter() - inizio)
+        return response
+
+    @app.teardown_request
+    def _misura_errore(exc):
+        # Eccezione non gestita: after_request non è stato chiamato
+        inizio = g.pop('_inizio_richiesta', None)
+        if inizio is not None:
+            telemetria.richieste.labels(request.endpoint or 'sconosciuto', request.method,
+                                        '500').observe(time.perf_counter() - inizio)
+
+    @app.route('/metrics')
+    def metrics():
+        token = app.config.get('METRICHE_TOKEN')
+        if token and request.headers.get('Authorization') != f'Bearer {token}':
+            abort(403)
+        if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+            registro = prometheus_client.CollectorRegistry()
+            multiprocess.MultiProcessCollector(registro)
+        else:
+            registro = prometheus_client.REGISTRY
+        return Response(prometheus_client.generate_latest(registro),
+                        content_type=prometheus_client.CONTENT_TYPE_LATEST)
@@ -0,0 +1,281 @@
+# utils/webhook_stripe.py - Webhook Stripe: ricezione veloce + elaborazione in ordine da un worker
+import json
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+import stripe
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+
+from models import db
+from models.user import User
+from models.evento import Evento
+from models.prenotazione import PrenotazionePosto
+from models.stripe_evento import EventoStripe
+from utils.partecipazioni import EventoCompleto, GiaIscritto
+from utils.prenotazioni import converti_prenotazione, rilascia_prenotazione
+from utils.scheduler import prendi_lease, rilascia_lease
+from utils.stripe_gateway import chiudi_checkout
+from utils.telemetria import telemetria
+
+NOME_LEASE = 'stripe_webhook'
+
+log = logging.getLogger('tablhero.webhook')
+
+
+class FirmaNonValida(Exception):
+    """Payload non firmato da Stripe (o firma scaduta)"""
+
+
+def registra_evento(payload, firma, segreto, verifica=True):
+    """
+    Verifica la firma e salva l'evento grezzo: una sola INSERT, niente logica di business.
+    I retry di Stripe hanno lo stesso id evento e vengono scartati dal vincolo UNIQUE.
+    Ritorna True se l'evento è nuovo, False se era un duplicato.
+    """
+    testo = payload.decode('utf-8')
+    if verifica:
+        try:
+            stripe.WebhookSignature.verify_header(testo, firma, segreto, tolerance=300)
+        except stripe.error.SignatureVerificationError as e:
+            raise FirmaNonValida(str(e))
+
+    evento = json.loads(testo)
+    db.session.add(EventoStripe(stripe_id=evento['id'], tipo=evento['type'], payload=testo))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return False
+    return True
+
+
+# --- Elaborazione --------------------------------------------------------
+
+def _checkout_completato(session):
+    metadata = session.get('metadata', {})
+    chiudi_checkout(session.get('id'))
+
+    # Customer creato da Stripe al primo acquisto: i checkout successivi lo riusano
+    if session.get('customer') and str(metadata.get('userid', '')).isdigit():
+        db.session.execute(
+            update(User)
+            .where(User.id == int(metadata['userid']), User.stripe_customer_id.is_(None))
+            .values(stripe_customer_id=session['customer'])
+            .execution_options(synchronize_session=False)
+        )
+
+    # 🎫 PAGAMENTO EVENTO
+    if 'eventoid' in metadata:
+        user = db.session.get(User, int(metadata['userid']))
+        evento = db.session.get(Evento, int(metadata['eventoid']))
+        if not user or not evento:
+            return 'utente o evento inesistente'
+
+        # Check if event is in the past
+        if evento.data_evento and evento.data_evento <= datetime.utcnow():
+            log.warning('Pagamento rifiutato: evento passato', extra={'evento_id': evento.id, 'user_id': user.id})
+            return f'rifiutato: evento passato {evento.titolo}'
+
+        try:
+            # Converte il posto tenuto durante il checkout in partecipazione
+            converti_prenotazione(user, evento, session.get('id'))
+            log.info('Iscrizione da pagamento', extra={'evento_id': evento.id, 'user_id': user.id})
+        except EventoCompleto:
+            db.session.rollback()
+            log.error('Evento completo: pagamento da rimborsare', extra={'evento_id': evento.id, 'user_id': user.id})
+            return f'evento completo: pagamento di {user.nickname} da rimborsare'
+        except GiaIscritto:
+            log.info('Pagamento di un utente già iscritto', extra={'evento_id': evento.id, 'user_id': user.id})
+            return 'già iscritto'
+
+    # 🔄 RINNOVO MEMBERSHIP
+    elif metadata.get('tipo') == 'renew':
+        user = db.session.get(User, int(metadata['userid']))
+        if user:
+            # Sostituisci la logica: usa data scadenza esistente + 365gg
+            user.ha_pagato = True
+            if user.data_scadenza:
+                user.data_scadenza = user.data_scadenza + timedelta(days=365)  # DA SCADENZA ESISTENTE
+            else:
+                user.data_scadenza = datetime.utcnow() + timedelta(days=365)  # Fallback se non c'è scadenza
+            user.payment_status = 'completed'
+            # Upgrade sidekick to tablhero upon membership renewal
+            if user.ruolo == 'sidekick':
+                user.ruolo = 'tablhero'
+            log.info('Membership rinnovata', extra={'user_id': user.id, 'scadenza': user.data_scadenza})
+
+    # 🎫 MEMBERSHIP GENERICO (nuova O renew)
+    elif metadata.get('tipo') == 'membership':
+        user = db.session.get(User, int(metadata['userid']))
+        if user:
+            user.ha_pagato = True
+            if user.data_scadenza and user.data_scadenza > datetime.utcnow():
+                # Se è un rinnovo, usa scadenza esistente + 365gg
+                user.data_scadenza = user.data_scadenza + timedelta(days=365)
+            else:
+                # Se è nuova membership, usa oggi + 365gg
+                user.data_scadenza = datetime.utcnow() + timedelta(days=365)
+            user.payment_status = 'completed'
+            # Upgrade sidekick to tablhero upon membership purchase
+            if user.ruolo == 'sidekick':
+                user.ruolo = 'tablhero'
+            log.info('Membership attivata', extra={'user_id': user.id, 'scadenza': user.data_scadenza})
+
+    return None
+
+
+def _checkout_scaduto(session):
+    """Checkout scaduto: libera subito il posto tenuto"""
+    chiudi_checkout(session.get('id'))
+    prenotazione = PrenotazionePosto.query.filter_by(stripe_session_id=session.get('id')).first()
+    if prenotazione:
+        rilascia_prenotazione(prenotazione)
+        log.info('Prenotazione liberata', extra={'evento_id': prenotazione.evento_id})
+    return None
+
+
+GESTORI = {
+    'checkout.session.completed': _checkout_completato,
+    'checkout.session.expired': _checkout_scaduto,
+}
+
+
+def _blocca_in_coda(evento_id):
+    """Blocca la riga dell'evento (FOR UPDATE) e la ritorna solo se è ancora in coda"""
+    evento_stripe = db.session.get(EventoStripe, evento_id, with_for_update=True, populate_existing=True)
+    if evento_stripe is None or evento_stripe.stato != 'in_coda':
+        db.session.rollback()
+        return None
+    return evento_stripe
+
+
+def elabora_evento(evento_stripe, max_tentativi=8, backoff=10):
+    """
+    Applica l'evento e lo segna 'elaborato' nella stessa transazione: un evento
+    non viene mai applicato due volte. La riga viene bloccata prima di applicarlo e
+    il passaggio a 'elaborato' è un UPDATE condizionato a stato='in_coda': se un altro
+    processo (lease scaduto a metà lotto) l'ha già elaborato, rollback e ritorna None.
+    In caso di errore resta in coda con backoff esponenziale e dopo `max_tentativi`
+    passa a 'fallito' (da rilanciare con replay_webhook.py).
+    """
+    evento_id = evento_stripe.id
+    try:
+        evento_stripe = _blocca_in_coda(evento_id)
+        if evento_stripe is None:
+            log.info('Webhook già elaborato da un altro processo', extra={'evento_id': evento_id})
+            return None
+        ricevuto = evento_stripe.data_ricezione
+        dati = json.loads(evento_stripe.payload)
+        gestore = GESTORI.get(dati['type'])
+        esito = gestore(dati['data']['object']) if gestore else 'tipo ignorato'
+
+        # Condizionato: vale anche se il gestore ha fatto rollback e il blocco è stato rilasciato
+        presi = db.session.execute(
+            update(EventoStripe)
+            .where(EventoStripe.id == evento_id, EventoStripe.stato == 'in_coda')
+            .values(stato='elaborato', esito=esito, data_elaborazione=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if not presi:
+            db.session.rollback()
+            log.warning('Webhook elaborato nel frattempo da un altro processo: modifiche annullate',
+                        extra={'evento_id': evento_id})
+            return None
+        db.session.commit()
+        if ricevuto:
+            telemetria.webhook_ritardo.observe((datetime.utcnow() - ricevuto).total_seconds())
+        return True
+    except Exception as e:
+        db.session.rollback()
+        evento_stripe = _blocca_in_coda(evento_id)
+        if evento_stripe is None:
+            return None
+        evento_stripe.tentativi += 1
+        evento_stripe.esito = str(e)[:1000]
+        if evento_stripe.tentativi >= max_tentativi:
+            evento_stripe.stato = 'fallito'
+            log.error('Webhook fallito definitivamente', extra={'stripe_id': evento_stripe.stripe_id, 'errore': str(e)})
+        else:
+            attesa = backoff * 2 ** (evento_stripe.tentativi - 1)
+            evento_stripe.prossimo_tentativo = datetime.utcnow() + timedelta(seconds=attesa)
+            log.warning('Webhook in errore, nuovo tentativo', extra={'stripe_id': evento_stripe.stripe_id,
+                                                                     'attesa_secondi': attesa, 'errore': str(e)})
+        db.session.commit()
+        return False
+
+
+def elabora_coda(limite=100, max_tentativi=8, backoff=10, continua=None):
+    """
+    Elabora gli eventi pronti in ordine di arrivo. Ritorna quanti ne ha presi.
+    `continua` (se indicato) viene chiamato prima di ogni evento per rinnovare il
+    lease: se ritorna False il lotto si interrompe lì.
+    """
+    eventi = (EventoStripe.query
+              .filter(EventoStripe.stato == 'in_coda',
+                      EventoStripe.prossimo_tentativo <= datetime.utcnow())
+              .order_by(EventoStripe.id)
+              .limit(limite)
+              .all())
+    for presi, evento_stripe in enumerate(eventi):
+        if continua is not None and not continua():
+            log.warning('Lease webhook perso: lotto interrotto', extra={'rimasti': len(eventi) - presi})
+            return presi
+        elabora_evento(evento_stripe, max_tentativi, backoff)
+    return len(eventi)
+
+
+class WebhookWorker:
+    """
+    Thread che svuota la coda webhook. Ogni processo ne ha uno, ma lavora solo
+    chi tiene il lease 'stripe_webhook': un solo consumatore nel cluster, quindi
+    gli eventi vengono applicati nell'ordine in cui Stripe li ha consegnati.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.poll = app.config.get('STRIPE_WEBHOOK_POLL_SECONDI', 1)
+        self.lease = app.config.get('STRIPE_WEBHOOK_LEASE_SECONDI', 30)
+        self.max_tentativi = app.config.get('STRIPE_WEBHOOK_MAX_TENTATIVI', 8)
+        self.backoff = app.config.get('STRIPE_WEBHOOK_BACKOFF_SECONDI', 10)
+        self._lease_fino = 0  # time.monotonic() entro cui il lease è sicuramente nostro
+        self._stop = threading.Event()
+        self._thread = None
+
+    def avvia(self):
+        self._thread = threading.Thread(target=self._loop, name='stripe-webhook', daemon=True)
+        self._thread.start()
+
+    def ferma(self):
+        self._stop.set()
+        if self._lease_fino:
+            with self.app.app_context():
+                rilascia_lease(NOME_LEASE)
+
+    def _leader(self):
+        # Rinnova a un terzo della durata: un UPDATE ogni lease/3 secondi, non a ogni poll
+        if time.monotonic() < self._lease_fino - self.lease * 2 / 3:
+            return True
+        if prendi_lease(NOME_LEASE, self.lease):
+            self._lease_fino = time.monotonic() + self.lease
+            return True
+        self._lease_fino = 0
+        return False
+
+    def _loop(self):
+        while not self._stop.is_set():
+            lavorati = 0
+            with self.app.app_context():
+                try:
+                    if self._leader():
+                        lavorati = elabora_coda(max_tentativi=self.max_tentativi, backoff=self.backoff,
+                                                continua=self._leader)
+                except Exception as e:
+                    db.session.rollback()
+                    log.exception('Worker webhook: errore')
+                finally:
+                    db.session.remove()
+            if not lavorati:
+                self._stop.wait(self.poll)
@@ -0,0 +1,171 @@
+# verifica_piani.py - EXPLAIN delle query calde dei blueprint: fallisce se un piano torna a una scansione completa
+#
+# Uso: python verifica_piani.py              (tutte le query, exit 1 se un piano regredisce)
+#      python verifica_piani.py --verbose    (stampa anche il piano di ogni query)
+#      python verifica_piani.py --solo eventi_lista dashboard_recenti
+#      python verifica_piani.py --soglia-righe 5000
+# Gira sul DB di DATABASE_URL: EXPLAIN su MariaDB/MySQL, EXPLAIN QUERY PLAN su SQLite.
+# Su MariaDB un piano type=ALL conta come scansione completa se nessun indice era
+# utilizzabile (possible_keys vuoto) oppure se l'ottimizzatore stima più di
+# --soglia-righe righe: sotto soglia (tabelle quasi vuote) la scansione è spesso
+# scelta anche con l'indice giusto e non viene segnalata.
+# Le query di outbox, lista d'attesa e membership sono costruite dalle stesse
+# funzioni usate dal codice, non ricopiate qui.
+import argparse
+import re
+import sys
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, func
+
+from app import create_app
+from models import db
+from models.user import User
+from models.evento import Evento
+from models.partecipazione import Partecipazione
+from utils.classifiche import _somme, mese_di
+from utils.lista_attesa import testa_lista
+from utils.membership import condizioni_scadute, lotto_avvisi
+from utils.outbox import seleziona_lotto
+from utils.paginazione import _dopo, _prima
+
+# Scansioni volute: nessun filtro da indicizzare, la tabella va letta tutta
+AMMESSE = {
+    'admin_eventi_popolari': {'eventi', 'partecipazioni'},  # GROUP BY su tutte le partecipazioni
+}
+
+
+def query_calde(config):
+    """(nome, statement) come li costruiscono le route; parametri fissi e realistici"""
+    adesso = datetime.utcnow()
+    domani = datetime(adesso.year, adesso.month, adesso.day) + timedelta(days=1)
+    posizione = (adesso, 1000)
+    passati = Evento.query.filter(Evento.data_evento < adesso, Evento.data_evento.isnot(None))
+    return [
+        # eventi.lista (con e senza ?tipo=)
+        ('eventi_lista', Evento.query
+         .filter(Evento.data_evento > adesso, Evento.data_evento.isnot(None))
+         .order_by(Evento.data_evento.asc())),
+        ('eventi_lista_tipo', Evento.query
+         .filter(Evento.data_evento > adesso, Evento.data_evento.isnot(None))
+         .filter_by(tipo='giochi_ruolo')
+         .order_by(Evento.data_evento.asc())),
+        # eventi.eventi_passati / eventi_passati_json (pagina_eventi)
+        ('eventi_passati', passati
+         .order_by(Evento.data_evento.desc(), Evento.id.desc()).limit(13)),
+        ('eventi_passati_dopo', passati.filter(_dopo(posizione))
+         .order_by(Evento.data_evento.desc(), Evento.id.desc()).limit(13)),
+        ('eventi_passati_tipo', passati.filter_by(tipo='giochi_tavolo')
+         .order_by(Evento.data_evento.desc(), Evento.id.desc()).limit(13)),
+        ('eventi_gia_iscritto', Partecipazione.query.filter_by(user_id=1, evento_id=1).limit(1)),
+        # admin.gestione_eventi (keyset nei due versi)
+        ('admin_eventi_prima', Evento.query.filter(_prima(posizione))
+         .order_by(Evento.data_evento.asc(), Evento.id.asc()).limit(21)),
+        ('admin_eventi_tipo', Evento.query.filter_by(tipo='giochi_ruolo').filter(_dopo(posizione))
+         .order_by(Evento.data_evento.desc(), Evento.id.desc()).limit(21)),
+        # admin.dashboard, admin.gestione_utenti, admin.statistiche, admin.stats
+        ('admin_ultimi_utenti', User.query.order_by(User.data_registrazione.desc()).limit(10)),
+        ('admin_prossimi_eventi', Evento.query.filter(Evento.data_evento > adesso)
+         .order_by(Evento.data_evento.asc()).limit(5)),
+        ('admin_utenti_ruolo', User.query.filter_by(ruolo='veteran')
+         .order_by(User.data_registrazione.desc()).limit(20)),
+        ('admin_partecipanti_evento', Partecipazione.query.filter_by(evento_id=1)),
+        ('admin_top_utenti', User.query.order_by(User.tabl_exp.desc()).limit(10)),
+        ('admin_top_attivi', User.query.filter_by(attivo=True).order_by(User.tabl_exp.desc()).limit(5)),
+        ('admin_eventi_popolari', db.session.query(Evento, func.count(Partecipazione.id).label('partecipanti'))
+         .join(Partecipazione).group_by(Evento.id).order_by(db.text('partecipanti DESC')).limit(5)),
+        # dashboard.index, dashboard.storico, dashboard.elimina_account
+        ('dashboard_conteggio', Partecipazione.query.filter_by(user_id=1).with_entities(func.count())),
+        ('dashboard_recenti', Partecipazione.query.filter_by(user_id=1)
+         .order_by(Partecipazione.data_partecipazione.desc()).limit(5)),
+        ('dashboard_prossime', Partecipazione.query.join(Evento)
+         .filter(Partecipazione.user_id == 1, Evento.data_evento > adesso)),
+        # leaderboard: primo per ruolo tra gli attivi e classifica del mese
+        ('leaderboard_top_ruolo', User.query.filter_by(attivo=True, ruolo='tablhero')
+         .order_by(User.tabl_exp.desc()).limit(1)),
+        ('leaderboard_periodo', select(_somme(mese_di(adesso), mese_di(adesso)))),
+        # auth
+        ('auth_login', User.query.filter_by(nickname='mario').limit(1)),
+        ('auth_verifica', User.query.filter_by(token_verifica='x').limit(1)),
+        # lista d'attesa e outbox
+        ('lista_attesa_testa', testa_lista(1, 1)),
+        ('outbox_lotto', seleziona_lotto(adesso, config.get('OUTBOX_LOTTO', 50))),
+        # job membership: stesse condizioni dell'UPDATE delle scadute e degli avvisi
+        ('membership_scadute', select(User.id).where(*condizioni_scadute(adesso))),
+        ('membership_avvisi', lotto_avvisi(domani, 0, 1000)),
+    ]
+
+
+def piano(conn, stmt):
+    """Righe di EXPLAIN dello statement, compilato con i parametri del dialetto in uso"""
+    stmt = getattr(stmt, 'statement', stmt)
+    dialetto = conn.dialect
+    compilato = stmt.compile(dialect=dialetto, compile_kwargs={'render_postcompile': True})  # IN (...) espansi
+    parametri = compilato.construct_params()
+    if dialetto.positional:
+        parametri = tuple(parametri[nome] for nome in compilato.positiontup)
+    prefisso = 'EXPLAIN QUERY PLAN ' if dialetto.name == 'sqlite' else 'EXPLAIN '
+    return [dict(r._mapping) for r in conn.exec_driver_sql(prefisso + str(compilato), parametri)]
+
+
+def scansioni(dialetto, righe, soglia_righe):
+    """Tabelle lette per intero senza indice (le subquery materializzate non contano)"""
+    tabelle = set(db.metadata.tables)
+    if dialetto == 'sqlite':
+        trovate = set()
+        for r in righe:
+            m = re.match(r'SCAN (\w+)', r['detail'])
+            if m and 'INDEX' not in r['detail']:
+                trovate.add(m.group(1))
+        return trovate & tabelle
+    return {r['table'] for r in righe
+            if r['type'] == 'ALL' and (not r['possible_keys'] or (r['rows'] or 0) > soglia_righe)} & tabelle
+
+
+def descrivi(dialetto, righe):
+    if dialetto == 'sqlite':
+        return [r['detail'] for r in righe]
+    return [f"{r['table']}: type={r['type']} key={r['key']} rows={r['rows']} {r.get('Extra') or ''}"
+            for r in righe]
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--solo', nargs='+', metavar='NOME', help='controlla solo queste query')
+parser.add_argument('--verbose', action='store_true', help='stampa il piano di ogni query')
+parser.add_argument('--soglia-righe', type=int, default=1000,
+                    help='MariaDB: type=ALL oltre queste righe stimate è una regressione anche con indici possibili')
+args = parser.parse_args()
+
+app = create_app(avvia_scheduler=False)
+
+with app.app_context():
+    queries = query_calde(app.config)
+    if args.solo:
+        sconosciute = set(args.solo) - {nome for nome, _ in queries}
+        if sconosciute:
+            parser.error(f'query sconosciute: {", ".join(sorted(sconosciute))}')
+        queries = [(nome, stmt) for nome, stmt in queries if nome in args.solo]
+
+    conn = db.session.connection()
+    dialetto = conn.dialect.name
+    print(f"🔍 {len(queries)} query su {dialetto}")
+
+    regressioni = 0
+    for nome, stmt in queries:
+        righe = piano(conn, stmt)
+        complete = scansioni(dialetto, righe, args.soglia_righe) - AMMESSE.get(nome, set())
+        if complete:
+            regressioni += 1
+            print(f"❌ {nome}: scansione completa di {', '.join(sorted(complete))}")
+        else:
+            print(f"✅ {nome}")
+        if complete or args.verbose:
+            for riga in descrivi(dialetto, righe):
+                print(f"     {riga}")
+
+    db.session.rollback()
+
+if regressioni:
+    print(f"❌ {regressioni} piani con scansione completa")
+    sys.exit(1)
+print("✅ Nessuna scansione completa")
@@ -0,0 +1,86 @@
+# verifica_query.py - Budget di query per pagina: fallisce se una pagina supera il budget o fa N+1
+#
+# Uso: python verifica_query.py                                        (solo pagine pubbliche)
+#      python verifica_query.py --nickname mario --email m@x.it --password ...   (anche dashboard,
+#                                                                          e pannello admin se admin)
+# Le pagine sono chieste con il test client di Flask sul DB di DATABASE_URL; il dettaglio
+# evento usa l'evento con più iscritti, dove un N+1 sui partecipanti si vede subito.
+import argparse
+import sys
+
+from sqlalchemy import select
+
+from app import create_app
+from models import db
+from models.evento import Evento
+from utils.metriche_sql import budget_query, BudgetQuerySuperato
+
+# (url, query massime, 'pubblica' | 'utente' | 'admin'); {evento} = evento con più iscritti
+BUDGET = [
+    ('/', 3, 'pubblica'),  # Prima richiesta: riempie la cache statistiche (una query per tabella)
+    ('/eventi/', 2, 'pubblica'),
+    ('/eventi/passati', 2, 'pubblica'),
+    ('/eventi/passati/json', 2, 'pubblica'),
+    ('/eventi/{evento}', 3, 'pubblica'),
+    ('/leaderboard', 2, 'pubblica'),
+    ('/leaderboard?periodo=mese', 6, 'pubblica'),
+    ('/dashboard/', 6, 'utente'),
+    ('/dashboard/eventi', 3, 'utente'),
+    ('/eventi/{evento}', 6, 'utente'),
+    ('/admin/', 6, 'admin'),
+    ('/admin/utenti', 4, 'admin'),
+    ('/admin/eventi', 3, 'admin'),
+    ('/admin/eventi/{evento}/edit', 4, 'admin'),
+    ('/admin/eventi/{evento}/partecipanti', 4, 'admin'),
+    ('/admin/statistiche', 5, 'admin'),
+]
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--nickname')
+parser.add_argument('--email')
+parser.add_argument('--password')
+args = parser.parse_args()
+
+app = create_app(avvia_scheduler=False)
+
+with app.app_context():
+    evento_id = db.session.scalar(
+        select(Evento.id).order_by(Evento.num_partecipanti.desc(), Evento.id).limit(1))
+    db.session.remove()
+
+client = app.test_client()
+accesso = {'pubblica'}
+if args.nickname:
+    risposta = client.post('/login', data={'nickname': args.nickname, 'email': args.email or '',
+                                           'password': args.password or ''})
+    if risposta.status_code != 302 or '/login' in risposta.headers.get('Location', ''):
+        sys.exit('❌ Login non riuscito')
+    accesso = {'utente'}
+    if client.get('/admin/').status_code == 200:
+        accesso.add('admin')
+
+fuori_budget = 0
+for url, massimo, serve in BUDGET:
+    if serve not in accesso:
+        continue
+    if '{evento}' in url:
+        if evento_id is None:
+            continue
+        url = url.format(evento=evento_id)
+    try:
+        with budget_query(massimo) as raccolta:
+            risposta = client.get(url)
+    except BudgetQuerySuperato as e:
+        fuori_budget += 1
+        print(f"❌ {url}: {e}")
+        continue
+    if risposta.status_code >= 400:
+        fuori_budget += 1
+        print(f"❌ {url}: HTTP {risposta.status_code}")
+        continue
+    print(f"✅ {url}: {raccolta.numero}/{massimo} query, {raccolta.durata * 1000:.1f} ms")
+
+if fuori_budget:
+    print(f"❌ {fuori_budget} pagine fuori budget")
+    sys.exit(1)
+print("✅ Tutte le pagine nel budget")